@@ -3,12 +3,22 @@ Authentication endpoints - OAuth2 integration with Nextcloud
 """
 
 from fastapi import APIRouter, HTTPException, Query, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse
 from pydantic import BaseModel
 import httpx
 import logging
 
 from app.config import settings
+from app.repositories import users as users_repo
+from app.services.http_client import get_http_client
+from app.services.sessions import (
+    create_session,
+    end_session,
+    get_current_session,
+    sign_session_token,
+    unsign_session_token,
+)
+from app.services.tokens import TokenRefreshError, refresh_session
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -50,7 +60,7 @@ async def login():
         f"&scope=openid profile email"
     )
     
-    logger.info(f"Redirecting to Nextcloud OAuth2: {auth_url}")
+    logger.info("Redirecting to Nextcloud OAuth2")
     return RedirectResponse(url=auth_url)
 
 
@@ -72,53 +82,72 @@ async def oauth_callback(
     
     # Exchange code for token
     try:
-        async with httpx.AsyncClient() as client:
-            token_response = await client.post(
-                settings.OAUTH2_TOKEN_URL,
-                data={
-                    "grant_type": "authorization_code",
-                    "code": code,
-                    "redirect_uri": settings.OAUTH2_REDIRECT_URI,
-                    "client_id": settings.OAUTH2_CLIENT_ID,
-                    "client_secret": settings.OAUTH2_CLIENT_SECRET,
-                }
+        client = get_http_client()
+        token_response = await client.post(
+            settings.OAUTH2_TOKEN_URL,
+            data={
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": settings.OAUTH2_REDIRECT_URI,
+                "client_id": settings.OAUTH2_CLIENT_ID,
+                "client_secret": settings.OAUTH2_CLIENT_SECRET,
+            }
+        )
+        
+        if token_response.status_code != 200:
+            logger.error(f"Token exchange failed: HTTP {token_response.status_code}")
+            raise HTTPException(
+                status_code=token_response.status_code,
+                detail="Failed to exchange authorization code for token"
             )
-            
-            if token_response.status_code != 200:
-                logger.error(f"Token exchange failed: {token_response.text}")
-                raise HTTPException(
-                    status_code=token_response.status_code,
-                    detail="Failed to exchange authorization code for token"
-                )
-            
-            token_data = token_response.json()
-            access_token = token_data.get("access_token")
-            
-            # Get user info from Nextcloud
-            user_response = await client.get(
-                settings.OAUTH2_USERINFO_URL,
-                headers={"Authorization": f"Bearer {access_token}"},
-                params={"format": "json"}
+        
+        token_data = token_response.json()
+        access_token = token_data.get("access_token")
+        
+        # Get user info from Nextcloud
+        user_response = await client.get(
+            settings.OAUTH2_USERINFO_URL,
+            headers={"Authorization": f"Bearer {access_token}"},
+            params={"format": "json"}
+        )
+        
+        if user_response.status_code != 200:
+            logger.error(f"Failed to get user info: HTTP {user_response.status_code}")
+            raise HTTPException(
+                status_code=user_response.status_code,
+                detail="Failed to get user information"
             )
-            
-            if user_response.status_code != 200:
-                logger.error(f"Failed to get user info: {user_response.text}")
-                raise HTTPException(
-                    status_code=user_response.status_code,
-                    detail="Failed to get user information"
-                )
-            
-            user_data = user_response.json()
-            
-            # TODO: Create or update user in database
-            # TODO: Create session
-            # TODO: Set session cookie
-            
-            logger.info(f"User logged in: {user_data}")
-            
-            # Redirect to frontend
-            return RedirectResponse(url="/eneo/")
-            
+        
+        user_data = user_response.json()
+        profile = user_data.get("ocs", {}).get("data", user_data)
+        
+        user_id = await users_repo.upsert_user(
+            nextcloud_user_id=profile["id"],
+            email=profile.get("email"),
+            display_name=profile.get("displayname") or profile.get("display-name"),
+        )
+        session_token = await create_session(
+            user_id,
+            profile["id"],
+            access_token,
+            token_data.get("refresh_token"),
+            token_data.get("expires_in"),
+        )
+        
+        logger.info(f"User {user_id} logged in")
+        
+        # Redirect to frontend
+        response = RedirectResponse(url="/eneo/")
+        response.set_cookie(
+            settings.SESSION_COOKIE_NAME,
+            sign_session_token(session_token),
+            max_age=settings.SESSION_LIFETIME,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=settings.SESSION_COOKIE_HTTPONLY,
+            samesite=settings.SESSION_COOKIE_SAMESITE,
+        )
+        return response
+        
     except httpx.RequestError as e:
         logger.error(f"HTTP request failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to communicate with OAuth2 provider")
@@ -130,11 +159,15 @@ async def logout(request: Request):
     Logout endpoint
     Invalidates session and clears cookies
     """
-    # TODO: Invalidate session in database
-    # TODO: Clear session cookie
+    cookie = request.cookies.get(settings.SESSION_COOKIE_NAME)
+    session_token = unsign_session_token(cookie) if cookie else None
+    if session_token:
+        await end_session(session_token)
     
     logger.info("User logged out")
-    return {"message": "Logged out successfully"}
+    response = JSONResponse({"message": "Logged out successfully"})
+    response.delete_cookie(settings.SESSION_COOKIE_NAME)
+    return response
 
 
 @router.get("/me")
@@ -142,44 +175,31 @@ async def get_current_user(request: Request):
     """
     Get current authenticated user information
     """
-    # TODO: Get user from session
-    # TODO: Return user info
+    session = await get_current_session(request)
+    user = await users_repo.get_user(session.user_id)
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
     
-    # Placeholder response
     return {
-        "id": "user123",
-        "email": "user@example.com",
-        "display_name": "Test User",
+        "id": user["nextcloud_user_id"],
+        "email": user["email"],
+        "display_name": user["display_name"],
         "authenticated": True
     }
 
 
 @router.post("/refresh")
-async def refresh_token(refresh_token: str):
+async def refresh_token(request: Request):
     """
-    Refresh access token using refresh token
+    Renew the Nextcloud access token of the current session
+    Shares the single-flight refresh used by WebDAV calls, so it is safe to
+    call while other requests for the same user are in flight
     """
+    session = await get_current_session(request)
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                settings.OAUTH2_TOKEN_URL,
-                data={
-                    "grant_type": "refresh_token",
-                    "refresh_token": refresh_token,
-                    "client_id": settings.OAUTH2_CLIENT_ID,
-                    "client_secret": settings.OAUTH2_CLIENT_SECRET,
-                }
-            )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail="Failed to refresh token"
-                )
-            
-            return response.json()
-            
-    except httpx.RequestError as e:
+        await refresh_session(session)
+    except TokenRefreshError as e:
         logger.error(f"Token refresh failed: {e}")
-        raise HTTPException(status_code=500, detail="Failed to refresh token")
-
+        raise HTTPException(status_code=401, detail="Failed to refresh token")
+    
+    return {"expires_at": session.expires_at}
@@ -2,12 +2,33 @@
 Chat endpoints - AI conversation interface
 """
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 from typing import List, Optional
 from datetime import datetime
+import json
 import logging
 
+import anyio
+
+from app.config import settings
+from app.repositories import conversations as conversations_repo
+from app.services import limits
+from app.services.chat import ChatTurn, finish_turn, save_user_message, start_turn
+from app.services.llm import ChatStream, LLMOverloaded, check_admission, stream_chat
+from app.services.sessions import get_current_session
+from app.utils.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    decode_cursor,
+    iter_pages,
+    ndjson_lines,
+    split_page,
+)
+
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
@@ -22,7 +43,7 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     """Chat request model"""
     message: str
-    conversation_id: Optional[str] = None
+    conversation_id: Optional[int] = None
     context_files: Optional[List[str]] = None  # Nextcloud file paths
 
 
@@ -47,98 +68,225 @@ async def chat(request: ChatRequest, http_request: Request):
     """
     Send a message to the AI assistant
     """
-    # TODO: Get user from session
-    # TODO: Load conversation history if conversation_id provided
-    # TODO: Load context from specified files
-    # TODO: Generate AI response
-    # TODO: Save message and response to database
+    session = await get_current_session(http_request)
+    await _admit(session.user_id)
+    turn = await start_turn(session, request.message, request.conversation_id, request.context_files)
+    tokens = await _generate(turn)
     
-    logger.info(f"Chat request: {request.message}")
+    try:
+        reply = "".join([text async for text in tokens])
+    finally:
+        await tokens.aclose()
+    await finish_turn(turn, reply)
     
-    # Placeholder response
     return ChatResponse(
-        message="Detta är en placeholder-respons. AI-modellen är inte implementerad än.",
-        conversation_id=request.conversation_id or "conv_123",
-        sources=[
-            {
-                "file": "/Documents/example.pdf",
-                "excerpt": "Relevant text from document...",
-                "relevance": 0.85
-            }
-        ]
+        message=reply,
+        conversation_id=str(turn.conversation_id),
+        sources=turn.sources
+    )
+
+
+def _overloaded(e: LLMOverloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def _admit(user_id: int) -> None:
+    """Reject before the user message is saved when the user or the models cannot take the request"""
+    try:
+        check_admission(user_id)
+    except LLMOverloaded as e:
+        raise _overloaded(e)
+    limits.check_embedding_load()
+    await limits.consume(user_id, limits.CHAT)
+
+
+async def _generate(turn: ChatTurn) -> ChatStream:
+    """Queue the generation, then save the user message; a 429 leaves nothing saved"""
+    try:
+        tokens = stream_chat(turn.prompt, turn.user_id)
+    except LLMOverloaded as e:
+        raise _overloaded(e)
+    try:
+        await save_user_message(turn)
+    except BaseException:
+        await tokens.aclose()
+        raise
+    return tokens
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.post("/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Send a message to the AI assistant and stream the reply as server-sent events
+    
+    Events: 'sources' (before any tokens), 'token' per generated piece of text,
+    then 'done' with the saved message id, or 'error'. Closing the connection
+    stops generation, or drops it from the queue if it has not started;
+    whatever was generated up to then is saved.
+    """
+    session = await get_current_session(http_request)
+    await _admit(session.user_id)
+    turn = await start_turn(session, request.message, request.conversation_id, request.context_files)
+    tokens = await _generate(turn)
+    
+    async def events():
+        parts: List[str] = []
+        message_id = None
+        try:
+            yield _sse("sources", {"conversation_id": turn.conversation_id, "sources": turn.sources})
+            async for text in tokens:
+                parts.append(text)
+                yield _sse("token", {"text": text})
+        except Exception as e:
+            logger.exception(f"Generation failed in conversation {turn.conversation_id}")
+            yield _sse("error", {"message": str(e) if settings.DEBUG else "Generation failed"})
+        finally:
+            # The response task is cancelled when the client disconnects; shield the save
+            with anyio.CancelScope(shield=True):
+                await tokens.aclose()
+                message_id = await finish_turn(turn, "".join(parts))
+        yield _sse("done", {"conversation_id": turn.conversation_id, "message_id": message_id})
+    
+    # Runs once the response is over, also when the client left before events()
+    # started, which would otherwise leave the admitted generation queued
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(tokens.aclose)
     )
 
 
+def _conversation(row) -> Conversation:
+    return Conversation(
+        id=str(row["id"]),
+        title=row["title"] or "",
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+        message_count=row["message_count"]
+    )
+
+
+def _message(row) -> Message:
+    return Message(role=row["role"], content=row["content"], timestamp=row["created_at"])
+
+
+def _cursor(cursor: Optional[str], *types) -> Optional[tuple]:
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor, *types)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/conversations", response_model=List[Conversation])
-async def list_conversations(request: Request):
+async def list_conversations(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
     """
-    List all conversations for the current user
+    List conversations for the current user, newest first
+    
+    Pages of `limit`; the cursor for the next page is in the X-Next-Cursor
+    header. format=ndjson streams every conversation from the cursor on.
+    Paged by id rather than by last activity, which changes with every
+    message and would make conversations skip or repeat between pages.
     """
-    # TODO: Get user from session
-    # TODO: Query conversations from database
+    session = await get_current_session(request)
+    after = _cursor(cursor, int)
+    key = lambda row: (row["id"],)  # noqa: E731
     
-    # Placeholder response
-    return [
-        Conversation(
-            id="conv_123",
-            title="Diskussion om klimatpolicy",
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
-            message_count=5
+    if output == "ndjson":
+        rows = iter_pages(
+            lambda after, limit: conversations_repo.list_conversations(session.user_id, after[0] if after else None, limit),
+            key,
+            after,
+        )
+        return StreamingResponse(
+            ndjson_lines(rows, lambda row: _conversation(row).model_dump_json()),
+            media_type="application/x-ndjson",
         )
-    ]
+    
+    rows = await conversations_repo.list_conversations(session.user_id, after[0] if after else None, limit + 1)
+    rows, next_cursor = split_page(rows, limit, key)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [_conversation(row) for row in rows]
 
 
 @router.get("/conversations/{conversation_id}", response_model=List[Message])
-async def get_conversation(conversation_id: str, request: Request):
+async def get_conversation(
+    conversation_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
     """
-    Get all messages in a conversation
+    Get the messages in a conversation, oldest first
+    
+    Pages of `limit`; the cursor for the next page is in the X-Next-Cursor
+    header. format=ndjson streams every message from the cursor on.
     """
-    # TODO: Get user from session
-    # TODO: Verify user owns this conversation
-    # TODO: Query messages from database
+    session = await get_current_session(request)
+    if await conversations_repo.get_conversation(conversation_id, session.user_id) is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    after = _cursor(cursor, int)
+    key = lambda row: (row["id"],)  # noqa: E731
     
-    # Placeholder response
-    return [
-        Message(
-            role="user",
-            content="Vad säger policyn om klimatmål?",
-            timestamp=datetime.utcnow()
-        ),
-        Message(
-            role="assistant",
-            content="Enligt policyn ska kommunen vara klimatneutral till 2030...",
-            timestamp=datetime.utcnow()
+    if output == "ndjson":
+        rows = iter_pages(
+            lambda after, limit: conversations_repo.list_messages(conversation_id, after[0] if after else 0, limit),
+            key,
+            after,
+        )
+        return StreamingResponse(
+            ndjson_lines(rows, lambda row: _message(row).model_dump_json()),
+            media_type="application/x-ndjson",
         )
-    ]
+    
+    rows = await conversations_repo.list_messages(conversation_id, after[0] if after else 0, limit + 1)
+    rows, next_cursor = split_page(rows, limit, key)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [_message(row) for row in rows]
 
 
 @router.delete("/conversations/{conversation_id}")
-async def delete_conversation(conversation_id: str, request: Request):
+async def delete_conversation(conversation_id: int, request: Request):
     """
     Delete a conversation
     """
-    # TODO: Get user from session
-    # TODO: Verify user owns this conversation
-    # TODO: Delete conversation and messages from database
+    session = await get_current_session(request)
     
     logger.info(f"Deleting conversation: {conversation_id}")
+    if not await conversations_repo.delete_conversation(conversation_id, session.user_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
     return {"message": "Conversation deleted successfully"}
 
 
 @router.post("/conversations/{conversation_id}/title")
 async def update_conversation_title(
-    conversation_id: str,
+    conversation_id: int,
     title: str,
     request: Request
 ):
     """
     Update conversation title
     """
-    # TODO: Get user from session
-    # TODO: Verify user owns this conversation
-    # TODO: Update title in database
+    session = await get_current_session(request)
     
-    logger.info(f"Updating conversation title: {conversation_id} -> {title}")
+    logger.info(f"Updating conversation title: {conversation_id}")
+    if not await conversations_repo.update_title(conversation_id, session.user_id, title):
+        raise HTTPException(status_code=404, detail="Conversation not found")
     return {"message": "Title updated successfully"}
-
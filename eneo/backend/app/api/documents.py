@@ -2,11 +2,43 @@
 Document management endpoints - Integration with Nextcloud files
 """
 
-from fastapi import APIRouter, HTTPException, Request
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
 from typing import List, Optional
+from contextlib import AsyncExitStack
 from datetime import datetime
+from urllib.parse import quote
+import json
 import logging
+import math
+
+import httpx
+
+from app.config import settings
+from app.repositories import documents as documents_repo
+from app.repositories import permissions as permissions_repo
+from app.services import jobs, limits
+from app.services.content import iter_indexed_text
+from app.services.extraction import ExtractionError, UnsupportedFileType
+from app.services.http_client import DOWNLOAD_LANE, CircuitOpenError
+from app.services.ingestion import index_file
+from app.services.listing import list_folder
+from app.services.search import hybrid_search
+from app.services.search_cache import bump_index_version
+from app.services.sessions import get_current_session
+from app.services.tokens import TokenRefreshError, get_access_token
+from app.services.webdav import WebDAVError, open_file
+from app.utils.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    decode_cursor,
+    iter_pages,
+    ndjson_lines,
+    split_page,
+)
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -35,7 +67,8 @@ class SearchRequest(BaseModel):
     """Search request model"""
     query: str
     file_paths: Optional[List[str]] = None  # Limit search to specific files
-    limit: int = 10
+    limit: int = Field(10, ge=1, le=100)
+    recall_target: float = Field(0.9, ge=0.5, le=0.99)  # higher is more accurate but slower
 
 
 class SearchResult(BaseModel):
@@ -44,51 +77,132 @@ class SearchResult(BaseModel):
     file_path: str
     title: str
     excerpt: str
-    relevance_score: float
+    relevance_score: float  # fused score, 1.0 = ranked first by both signals
+    semantic_rank: Optional[int] = None
+    semantic_score: Optional[float] = None  # cosine similarity
+    semantic_contribution: float = 0.0  # part of relevance_score from the vector search
+    lexical_rank: Optional[int] = None
+    lexical_score: Optional[float] = None  # full-text rank
+    lexical_contribution: float = 0.0  # part of relevance_score from the full-text search; the two add up to it
+
+
+def _document(row) -> Document:
+    return Document(
+        id=str(row["id"]),
+        nextcloud_file_id=row["nextcloud_file_id"] or "",
+        nextcloud_file_path=row["nextcloud_file_path"],
+        title=row["title"] or "",
+        file_type=row["file_type"] or "",
+        file_size=row["file_size"] or 0,
+        indexed=row["indexed_at"] is not None,
+        indexed_at=row["indexed_at"],
+        created_at=row["created_at"]
+    )
+
+
+def _permission(row) -> dict:
+    return {
+        "file_path": row["nextcloud_file_path"],
+        "permission_type": row["permission_type"],
+        "granted_at": row["granted_at"].isoformat()
+    }
+
+
+def _before_id(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor, int)[0]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _id_key(row) -> tuple:
+    return (row["id"],)
+
+
+def _nextcloud_unreachable(e: httpx.RequestError) -> HTTPException:
+    """503 with Retry-After while the circuit to Nextcloud is open, 502 for other transport errors"""
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(
+            status_code=503,
+            detail="Nextcloud is unavailable, try again later",
+            headers={"Retry-After": str(max(math.ceil(e.retry_after), 1))},
+        )
+    logger.error(f"Nextcloud request failed: {e}")
+    return HTTPException(status_code=502, detail="Failed to communicate with Nextcloud")
 
 
 @router.get("/", response_model=List[Document])
-async def list_documents(request: Request):
+async def list_documents(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
     """
-    List all indexed documents for the current user
+    List indexed documents for the current user, most recently added first
+    
+    Pages of `limit`; the cursor for the next page is in the X-Next-Cursor
+    header. format=ndjson streams every document from the cursor on.
     """
-    # TODO: Get user from session
-    # TODO: Query documents from database
+    session = await get_current_session(request)
+    before_id = _before_id(cursor)
     
-    # Placeholder response
-    return [
-        Document(
-            id="doc_123",
-            nextcloud_file_id="12345",
-            nextcloud_file_path="/Documents/klimatpolicy.pdf",
-            title="Klimatpolicy 2024",
-            file_type="pdf",
-            file_size=1024000,
-            indexed=True,
-            indexed_at=datetime.utcnow(),
-            created_at=datetime.utcnow()
+    if output == "ndjson":
+        rows = iter_pages(
+            lambda after, limit: documents_repo.list_documents(session.user_id, after[0] if after else None, limit),
+            _id_key,
+            (before_id,) if before_id else None,
         )
-    ]
+        return StreamingResponse(
+            ndjson_lines(rows, lambda row: _document(row).model_dump_json()),
+            media_type="application/x-ndjson",
+        )
+    
+    rows = await documents_repo.list_documents(session.user_id, before_id, limit + 1)
+    rows, next_cursor = split_page(rows, limit, _id_key)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [_document(row) for row in rows]
 
 
 @router.post("/index")
 async def index_document(index_request: IndexRequest, request: Request):
     """
     Index a document from Nextcloud for AI search
+    The file is streamed from WebDAV and embedded chunk batch by chunk batch
     """
-    # TODO: Get user from session
-    # TODO: Get access token from session
-    # TODO: Fetch file from Nextcloud using WebDAV
-    # TODO: Extract text from file
-    # TODO: Generate embeddings
-    # TODO: Store in vector database
+    session = await get_current_session(request)
+    if not session.access_token:
+        raise HTTPException(status_code=401, detail="No Nextcloud access token in session")
+    limits.check_embedding_load()
+    await limits.consume(session.user_id, limits.INDEX_FILES)
     
     logger.info(f"Indexing document: {index_request.file_path}")
     
+    try:
+        result = await index_file(session, index_request.file_path, force=index_request.force_reindex)
+    except UnsupportedFileType as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ExtractionError as e:
+        raise HTTPException(status_code=503 if e.retryable else 422, detail=str(e))
+    except TokenRefreshError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except WebDAVError as e:
+        if e.status_code in (401, 403, 404):
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        raise HTTPException(status_code=502, detail="Failed to fetch file from Nextcloud")
+    except httpx.RequestError as e:
+        raise _nextcloud_unreachable(e)
+    
     return {
-        "message": "Document indexed successfully",
-        "document_id": "doc_123",
-        "chunks": 42
+        "message": "Document unchanged" if result.unchanged else "Document indexed successfully",
+        "document_id": str(result.document_id),
+        "chunks": result.chunks,
+        "embedded": result.embedded,
+        "reused": result.reused
     }
 
 
@@ -96,105 +210,238 @@ async def index_document(index_request: IndexRequest, request: Request):
 async def index_documents_batch(file_paths: List[str], request: Request):
     """
     Index multiple documents in batch
+    Files are queued as a background job and processed by the indexing workers
     """
-    # TODO: Process multiple files
+    session = await get_current_session(request)
+    if not file_paths:
+        raise HTTPException(status_code=400, detail="No file paths given")
+    await limits.consume(session.user_id, limits.INDEX_FILES, cost=len(file_paths))
     
     logger.info(f"Batch indexing {len(file_paths)} documents")
+    job_id = await jobs.create_job(session.user_id, file_paths)
     
     return {
         "message": f"Started indexing {len(file_paths)} documents",
-        "job_id": "job_123"
+        "job_id": str(job_id)
     }
 
 
+@router.get("/jobs")
+async def list_index_jobs(request: Request):
+    """
+    List recent batch indexing jobs for the current user
+    """
+    session = await get_current_session(request)
+    return await jobs.list_jobs(session.user_id)
+
+
+@router.get("/jobs/{job_id}")
+async def get_index_job(job_id: int, request: Request):
+    """
+    Get progress of a batch indexing job
+    """
+    session = await get_current_session(request)
+    job = await jobs.get_job(job_id, session.user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @router.delete("/{document_id}")
-async def delete_document(document_id: str, request: Request):
+async def delete_document(document_id: int, request: Request):
     """
     Remove a document from the index
     """
-    # TODO: Get user from session
-    # TODO: Verify user owns this document
-    # TODO: Delete document and embeddings from database
+    session = await get_current_session(request)
     
     logger.info(f"Deleting document: {document_id}")
+    if not await documents_repo.delete_document(document_id, session.user_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    await bump_index_version(session.user_id)
     return {"message": "Document deleted successfully"}
 
 
 @router.post("/search", response_model=List[SearchResult])
 async def search_documents(search_request: SearchRequest, request: Request):
     """
-    Semantic search across indexed documents
+    Hybrid semantic and full-text search across indexed documents
     """
-    # TODO: Get user from session
-    # TODO: Generate query embedding
-    # TODO: Perform vector similarity search
-    # TODO: Return relevant excerpts
+    session = await get_current_session(request)
+    limits.check_embedding_load()
+    await limits.consume(session.user_id, limits.SEARCH)
     
-    logger.info(f"Searching documents: {search_request.query}")
+    hits = await hybrid_search(
+        search_request.query,
+        session.user_id,
+        search_request.file_paths,
+        search_request.limit,
+        search_request.recall_target,
+    )
     
-    # Placeholder response
     return [
         SearchResult(
-            document_id="doc_123",
-            file_path="/Documents/klimatpolicy.pdf",
-            title="Klimatpolicy 2024",
-            excerpt="Kommunen ska vara klimatneutral till 2030 genom att...",
-            relevance_score=0.92
+            document_id=str(hit.document_id),
+            file_path=hit.file_path,
+            title=hit.title,
+            excerpt=hit.excerpt,
+            relevance_score=hit.score,
+            semantic_rank=hit.semantic_rank,
+            semantic_score=hit.semantic_score,
+            semantic_contribution=hit.semantic_contribution,
+            lexical_rank=hit.lexical_rank,
+            lexical_score=hit.lexical_score,
+            lexical_contribution=hit.lexical_contribution
         )
+        for hit in hits
     ]
 
 
 @router.get("/nextcloud/files")
-async def list_nextcloud_files(request: Request, path: str = "/"):
+async def list_nextcloud_files(
+    request: Request,
+    path: str = "/",
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000)
+):
     """
     List files from Nextcloud (via WebDAV)
+    Listings are cached and only re-fetched when the folder changed; large
+    folders are paged with offset/limit
     """
-    # TODO: Get user from session
-    # TODO: Get access token from session
-    # TODO: Query Nextcloud WebDAV API
+    session = await get_current_session(request)
+    limit = limit or settings.LISTING_PAGE_SIZE
     
     logger.info(f"Listing Nextcloud files: {path}")
     
-    # Placeholder response
+    try:
+        listing = await list_folder(session, path)
+    except TokenRefreshError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except WebDAVError as e:
+        if e.status_code in (401, 403, 404):
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        raise HTTPException(status_code=502, detail="Failed to list folder in Nextcloud")
+    except httpx.RequestError as e:
+        raise _nextcloud_unreachable(e)
+    
     return {
-        "path": path,
+        "path": listing.path,
+        "etag": listing.etag,
+        "total": len(listing.entries),
+        "offset": offset,
+        "limit": limit,
         "files": [
             {
-                "name": "klimatpolicy.pdf",
-                "path": "/Documents/klimatpolicy.pdf",
-                "type": "file",
-                "size": 1024000,
-                "modified": datetime.utcnow().isoformat()
-            },
-            {
-                "name": "budget2024.xlsx",
-                "path": "/Documents/budget2024.xlsx",
-                "type": "file",
-                "size": 512000,
-                "modified": datetime.utcnow().isoformat()
+                "name": entry["name"],
+                "path": entry["path"],
+                "type": "folder" if entry["is_dir"] else "file",
+                "size": entry["size"],
+                "modified": entry["modified"],
+                "etag": entry["etag"],
+                "mime_type": entry["content_type"]
             }
+            for entry in listing.entries[offset:offset + limit]
         ]
     }
 
 
+# Passed to WebDAV so Nextcloud answers Range and conditional requests itself
+FORWARDED_REQUEST_HEADERS = ("range", "if-range", "if-none-match", "if-modified-since")
+FORWARDED_RESPONSE_HEADERS = (
+    "content-type", "content-length", "content-range", "content-encoding",
+    "content-disposition", "accept-ranges", "etag", "last-modified",
+)
+VALIDATOR_HEADERS = ("etag", "last-modified")
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (value.strip() for value in if_none_match.split(","))
+    return etag.removeprefix("W/") in (value.removeprefix("W/") for value in candidates)
+
+
+async def _indexed_text(request: Request, user_id: int, file_path: str) -> Response:
+    document = await documents_repo.get_by_path(user_id, file_path)
+    if document is None or document["indexed_at"] is None:
+        raise HTTPException(status_code=404, detail="File has not been indexed")
+
+    headers = {"Cache-Control": "private, no-cache"}
+    if document["content_hash"]:
+        headers["ETag"] = f'"{document["content_hash"]}-text"'
+        if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+    return StreamingResponse(
+        iter_indexed_text(document["id"]),
+        media_type="text/plain; charset=utf-8",
+        headers=headers,
+    )
+
+
 @router.get("/nextcloud/file-content")
-async def get_file_content(request: Request, file_path: str):
+async def get_file_content(
+    request: Request,
+    file_path: str,
+    output: str = Query("raw", alias="format", pattern="^(raw|text)$"),
+):
     """
-    Get file content from Nextcloud (via WebDAV)
+    Stream a file from Nextcloud
+    format=raw proxies the file bytes, honouring Range, If-Range and
+    If-None-Match; format=text serves the text extracted when it was indexed
     """
-    # TODO: Get user from session
-    # TODO: Get access token from session
-    # TODO: Fetch file from Nextcloud
-    # TODO: Return file content or metadata
-    
-    logger.info(f"Getting file content: {file_path}")
-    
-    return {
-        "file_path": file_path,
-        "content": "File content would be here...",
-        "size": 1024000,
-        "mime_type": "application/pdf"
+    session = await get_current_session(request)
+    if output == "text":
+        return await _indexed_text(request, session.user_id, file_path)
+
+    headers = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers}
+    # The body is relayed as received, so only ask for encodings the client accepts
+    headers["accept-encoding"] = request.headers.get("accept-encoding", "identity")
+
+    # The upstream response outlives this handler: it is closed once the body
+    # has been relayed or the client goes away
+    stack = AsyncExitStack()
+    try:
+        access_token = await get_access_token(session)
+        upstream = await stack.enter_async_context(open_file(file_path, access_token, headers, DOWNLOAD_LANE))
+    except TokenRefreshError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except WebDAVError as e:
+        if e.status_code in (401, 403, 404):
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        raise HTTPException(status_code=502, detail="Failed to fetch file from Nextcloud")
+    except httpx.RequestError as e:
+        raise _nextcloud_unreachable(e)
+
+    if upstream.status_code in (304, 412):
+        response_headers = {name: upstream.headers[name] for name in VALIDATOR_HEADERS if name in upstream.headers}
+        await stack.aclose()
+        return Response(status_code=upstream.status_code, headers=response_headers)
+
+    response_headers = {
+        name: upstream.headers[name] for name in FORWARDED_RESPONSE_HEADERS if name in upstream.headers
     }
+    response_headers.setdefault(
+        "content-disposition", f"inline; filename*=UTF-8''{quote(file_path.rsplit('/', 1)[-1])}"
+    )
+
+    async def relay():
+        # Each chunk is read from Nextcloud only after the previous one was
+        # sent, so a slow client slows the download instead of filling memory
+        try:
+            async for chunk in upstream.aiter_raw(settings.WEBDAV_CHUNK_SIZE):
+                yield chunk
+        finally:
+            await stack.aclose()
+
+    return StreamingResponse(
+        relay(),
+        status_code=upstream.status_code,
+        headers=response_headers,
+        background=BackgroundTask(stack.aclose),
+    )
 
 
 @router.post("/permissions")
@@ -202,10 +449,13 @@ async def grant_file_permission(file_path: str, permission_type: str, request: R
     """
     Grant Eneo permission to access a specific file or folder
     """
-    # TODO: Get user from session
-    # TODO: Store permission in database
+    session = await get_current_session(request)
+    if permission_type not in ("read", "write", "index"):
+        raise HTTPException(status_code=400, detail="permission_type must be 'read', 'write' or 'index'")
     
     logger.info(f"Granting {permission_type} permission for: {file_path}")
+    await permissions_repo.grant_permission(session.user_id, file_path, permission_type)
+    await bump_index_version(session.user_id)
     
     return {
         "message": "Permission granted",
@@ -215,18 +465,35 @@ async def grant_file_permission(file_path: str, permission_type: str, request: R
 
 
 @router.get("/permissions")
-async def list_permissions(request: Request):
+async def list_permissions(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
     """
-    List all file permissions granted to Eneo
+    List file permissions granted to Eneo, most recent first
+    
+    Pages of `limit`; the cursor for the next page is in the X-Next-Cursor
+    header. format=ndjson streams every permission from the cursor on.
     """
-    # TODO: Get user from session
-    # TODO: Query permissions from database
+    session = await get_current_session(request)
+    before_id = _before_id(cursor)
     
-    return [
-        {
-            "file_path": "/Documents",
-            "permission_type": "read",
-            "granted_at": datetime.utcnow().isoformat()
-        }
-    ]
-
+    if output == "ndjson":
+        rows = iter_pages(
+            lambda after, limit: permissions_repo.list_permissions(session.user_id, after[0] if after else None, limit),
+            _id_key,
+            (before_id,) if before_id else None,
+        )
+        return StreamingResponse(
+            ndjson_lines(rows, lambda row: json.dumps(_permission(row))),
+            media_type="application/x-ndjson",
+        )
+    
+    rows = await permissions_repo.list_permissions(session.user_id, before_id, limit + 1)
+    rows, next_cursor = split_page(rows, limit, _id_key)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [_permission(row) for row in rows]
@@ -2,12 +2,14 @@
 Health check endpoints
 """
 
-from fastapi import APIRouter, status
+from fastapi import APIRouter, HTTPException, Response, status
 from pydantic import BaseModel
 from datetime import datetime
-import psutil
+from typing import Dict, Optional
 import os
 
+from app.services.health import get_snapshot
+
 router = APIRouter()
 
 
@@ -19,6 +21,13 @@ class HealthResponse(BaseModel):
     environment: str
 
 
+class DependencyStatus(BaseModel):
+    """Result of the latest probe of one dependency"""
+    status: str
+    latency_ms: float
+    error: Optional[str] = None
+
+
 class DetailedHealthResponse(HealthResponse):
     """Detailed health check response"""
     database: str
@@ -26,6 +35,15 @@ class DetailedHealthResponse(HealthResponse):
     cpu_percent: float
     memory_percent: float
     disk_percent: float
+    sampled_at: datetime
+    checks: Dict[str, DependencyStatus]
+
+
+def _snapshot_or_503():
+    snapshot = get_snapshot()
+    if snapshot is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Health sampler not started")
+    return snapshot
 
 
 @router.get("/", response_model=HealthResponse)
@@ -41,29 +59,31 @@ async def health_check():
 
 @router.get("/detailed", response_model=DetailedHealthResponse)
 async def detailed_health_check():
-    """Detailed health check with system metrics"""
-    
-    # TODO: Add actual database and Redis health checks
-    db_status = "connected"  # Placeholder
-    redis_status = "connected"  # Placeholder
+    """Detailed health check with system metrics, from the latest background sample"""
+    snapshot = _snapshot_or_503()
     
     return DetailedHealthResponse(
-        status="healthy",
+        status=snapshot.status,
         timestamp=datetime.utcnow(),
         version="1.0.0",
         environment=os.getenv("ENVIRONMENT", "development"),
-        database=db_status,
-        redis=redis_status,
-        cpu_percent=psutil.cpu_percent(interval=1),
-        memory_percent=psutil.virtual_memory().percent,
-        disk_percent=psutil.disk_usage('/').percent
+        database=snapshot.checks["database"].status,
+        redis=snapshot.checks["redis"].status,
+        cpu_percent=snapshot.cpu_percent,
+        memory_percent=snapshot.memory_percent,
+        disk_percent=snapshot.disk_percent,
+        sampled_at=snapshot.sampled_at,
+        checks={name: vars(check) for name, check in snapshot.checks.items()},
     )
 
 
 @router.get("/ready")
-async def readiness_check():
-    """Kubernetes readiness probe endpoint"""
-    # TODO: Check if all dependencies are ready
+async def readiness_check(response: Response):
+    """Kubernetes readiness probe endpoint: 503 until the database answers and the models are loaded"""
+    snapshot = get_snapshot()
+    if snapshot is None or not snapshot.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "not ready"}
     return {"status": "ready"}
 
 
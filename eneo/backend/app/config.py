@@ -30,6 +30,14 @@ class Settings(BaseSettings):
     def DATABASE_URL(self) -> str:
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
     
+    DB_MAX_CONNECTIONS: int = 80  # budget shared by all ENEO_WORKERS processes
+    DB_POOL_MIN_SIZE: int = 2
+    DB_STATEMENT_CACHE_SIZE: int = 256  # prepared statements kept per connection
+    
+    @property
+    def DB_POOL_MAX_SIZE(self) -> int:
+        return max(self.DB_MAX_CONNECTIONS // max(self.ENEO_WORKERS, 1), self.DB_POOL_MIN_SIZE)
+    
     # Redis
     REDIS_HOST: str = "eneo-redis"
     REDIS_PORT: int = 6379
@@ -39,6 +47,8 @@ class Settings(BaseSettings):
     def REDIS_URL(self) -> str:
         return f"redis://:{self.REDIS_PASSWORD}@{self.REDIS_HOST}:{self.REDIS_PORT}/0"
     
+    REDIS_SOCKET_TIMEOUT: float = 2.0  # seconds; a slow Redis falls back to Postgres
+    
     # OAuth2
     OAUTH2_CLIENT_ID: str = ""
     OAUTH2_CLIENT_SECRET: str = ""
@@ -46,6 +56,9 @@ class Settings(BaseSettings):
     OAUTH2_TOKEN_URL: str = "http://localhost/index.php/apps/oauth2/api/v1/token"
     OAUTH2_USERINFO_URL: str = "http://localhost/ocs/v2.php/cloud/user"
     OAUTH2_REDIRECT_URI: str = "http://localhost/eneo/oauth/callback"
+    TOKEN_REFRESH_MARGIN: int = 120  # seconds before expiry an access token is renewed
+    TOKEN_REFRESH_LOCK_TTL: float = 15.0  # seconds one worker may hold a user's refresh lock
+    TOKEN_REFRESH_TIMEOUT: float = 5.0  # seconds for the token request; keep well under the lock TTL
     
     # Nextcloud
     NEXTCLOUD_URL: str = "http://nextcloud"
@@ -55,33 +68,109 @@ class Settings(BaseSettings):
     def NEXTCLOUD_WEBDAV_URL(self) -> str:
         return f"{self.NEXTCLOUD_URL}{self.NEXTCLOUD_WEBDAV_PATH}"
     
+    WEBDAV_CHUNK_SIZE: int = 64 * 1024  # bytes per streamed read
+    LISTING_FRESH_SECONDS: float = 10.0  # cached folder listings served without revalidation
+    LISTING_PAGE_SIZE: int = 200  # default entries per listing page
+    
+    # Outbound HTTP (Nextcloud, OAuth2, OpenAI)
+    HTTP_MAX_CONNECTIONS: int = 100  # pooled connections per worker process
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 50  # concurrent requests to one host
+    HTTP_MAX_DOWNLOADS_PER_HOST: int = 20  # proxied file downloads to one host, on top of the above
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # seconds an idle connection is kept
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 30.0
+    HTTP_RETRIES: int = 2  # extra attempts for idempotent requests
+    HTTP_RETRY_BASE_DELAY: float = 0.2  # seconds, doubled per attempt, with jitter
+    HTTP_CIRCUIT_FAILURE_THRESHOLD: int = 5  # consecutive failures that open a host's circuit
+    HTTP_CIRCUIT_RESET_TIMEOUT: float = 30.0  # seconds before a trial request is let through
+    
     # AI Model
-    AI_MODEL_TYPE: str = "local"  # 'local' or 'openai'
+    AI_MODEL_TYPE: str = "local"  # 'local', 'openai' or 'stub'
     AI_MODEL_NAME: str = "llama2"
     AI_MODEL_PATH: str = "/models/model.gguf"
     OPENAI_API_KEY: str = ""
     OPENAI_MODEL: str = "gpt-3.5-turbo"
+    OPENAI_BASE_URL: str = "https://api.openai.com/v1"  # any OpenAI-compatible server
+    LLM_MAX_QUEUED: int = 32  # local generations waiting for the model
+    LLM_MAX_QUEUED_PER_USER: int = 2
+    LLM_STUB_TOKEN_DELAY_MS: float = 20.0  # simulated per-token latency of the stub model
+    AI_CONTEXT_TOKENS: int = 4096  # model context window
+    AI_MAX_TOKENS: int = 512  # max tokens per generated reply
+    CHAT_SOURCE_CHUNKS: int = 5  # retrieved chunks passed to the model per question
+    CHAT_HISTORY_TOKENS: int = 1200  # budget for recent turns; older turns go into the summary
+    CHAT_SUMMARY_TOKENS: int = 300  # max length of the rolling conversation summary
+    CHAT_SUMMARY_BATCH: int = 20  # messages folded into the summary per update
     
     # Vector Database
     VECTOR_DIMENSION: int = 384
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_BATCH_SIZE: int = 32  # chunks per ingestion batch
+    EMBEDDING_MAX_BATCH_SIZE: int = 64  # texts per model call across all callers
+    EMBEDDING_MAX_LATENCY_MS: float = 10.0  # max wait for a batch to fill
+    VECTOR_INDEX_METHOD: str = "auto"  # 'auto', 'ivfflat' or 'hnsw'
+    VECTOR_INDEX_MIN_ROWS: int = 5000  # below this, exact scans beat an ANN index
+    VECTOR_INDEX_HNSW_MIN_ROWS: int = 1_000_000  # 'auto' switches to HNSW here
+    VECTOR_INDEX_BUILD_MEMORY: str = "1GB"  # maintenance_work_mem for index builds
+    VECTOR_INDEX_CHECK_INTERVAL: int = 3600  # seconds between rebuild checks
+    SEARCH_EXACT_MAX_CHUNKS: int = 20000  # candidate sets this small are scanned exactly
+    SEARCH_FILTERED_MIN_SELECTIVITY: float = 0.2  # share of corpus where a filtered ANN scan is safe
+    SEARCH_PARTITION_MIN_CHUNKS: int = 50000  # users this large get their own partial index
+    SEARCH_HYBRID_DEPTH: int = 3  # each signal contributes limit * depth candidates to fusion
+    SEARCH_RRF_K: int = 60  # reciprocal-rank fusion damping constant
+    
+    # Indexing
+    CHUNK_MAX_TOKENS: int = 254  # all-MiniLM-L6-v2 reads 256 tokens, including [CLS] and [SEP]
+    CHUNK_OVERLAP_TOKENS: int = 32  # trailing sentences repeated at the start of the next chunk
+    INDEX_WORKER_CONCURRENCY: int = 4  # tasks per worker process
+    INDEX_MAX_TASKS_PER_USER: int = 2  # running tasks per user across all workers
+    INDEX_MAX_ATTEMPTS: int = 5
+    INDEX_RETRY_BASE_DELAY: float = 30.0  # seconds, doubled per attempt
+    INDEX_RETRY_MAX_DELAY: float = 3600.0
+    INDEX_TASK_LEASE: int = 900  # seconds before a running task is considered abandoned
+    INDEX_POLL_INTERVAL: float = 2.0  # seconds between queue polls when idle
+    EXTRACTION_WORKERS: int = 2  # extraction processes per API or indexing worker process
+    EXTRACTION_TIMEOUT: float = 120.0  # seconds per file
+    EXTRACTION_MEMORY_LIMIT_MB: int = 1024  # address space per extraction process, 0 for no limit
+    EXTRACTION_PAGES_PER_TASK: int = 10  # PDF pages per parallel extraction task
+    SYNC_INTERVAL: int = 300  # seconds between change scans of folders granted for indexing
+    SYNC_CONCURRENCY: int = 4  # granted folders scanned at once
     
     # CORS
     CORS_ORIGINS: List[str] = ["http://localhost", "http://localhost:3000"]
     
     # Session
     SESSION_LIFETIME: int = 3600  # seconds
+    SESSION_COOKIE_NAME: str = "eneo_session"
+    SESSION_CACHE_SIZE: int = 10000  # sessions cached per worker process
+    SESSION_CACHE_TTL: float = 30.0  # seconds a cached session is trusted without Redis
     SESSION_COOKIE_SECURE: bool = False
     SESSION_COOKIE_HTTPONLY: bool = True
     SESSION_COOKIE_SAMESITE: str = "lax"
     
+    # Rate limits and admission control
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_CHAT_PER_MINUTE: float = 6.0  # chat messages per user
+    RATE_LIMIT_CHAT_BURST: int = 5
+    RATE_LIMIT_SEARCH_PER_MINUTE: float = 60.0  # searches per user
+    RATE_LIMIT_SEARCH_BURST: int = 20
+    RATE_LIMIT_INDEX_FILES_PER_HOUR: float = 2000.0  # files submitted for indexing per user
+    RATE_LIMIT_INDEX_FILES_BURST: int = 1000  # also the largest accepted batch
+    ADMISSION_LLM_WAIT_SLO: float = 30.0  # seconds the oldest queued generation may wait before new ones are refused
+    ADMISSION_EMBEDDING_WAIT_SLO: float = 1.0  # same for the embedding queue
+    
     # Logging
     LOG_LEVEL: str = "INFO"
-    LOG_FORMAT: str = "json"
+    LOG_FORMAT: str = "json"  # json or text
+    LOG_QUEUE_SIZE: int = 10000  # records waiting for the writer thread before new ones are dropped
+    LOG_DEBUG_SAMPLE_RATE: float = 0.1  # share of requests whose DEBUG records are kept
     
     # Performance
     ENEO_WORKERS: int = 4
-    CACHE_TTL: int = 3600
+    CACHE_TTL: int = 3600  # seconds query embeddings and search results stay in Redis
+    CACHE_MAX_SIZE: int = 1000  # entries per in-process cache
+    HEALTH_SAMPLE_INTERVAL: float = 10.0  # seconds between background health samples
+    HEALTH_CHECK_TIMEOUT: float = 2.0  # seconds each dependency probe may take
+    WORKER_METRICS_PORT: int = 9100  # Prometheus endpoint of the indexing worker, 0 to disable
     
     class Config:
         env_file = ".env"
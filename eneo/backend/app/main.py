@@ -3,7 +3,7 @@ Eneo Backend - FastAPI Application
 Main entry point for the Eneo AI platform backend
 """
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import logging
@@ -11,12 +11,11 @@ from contextlib import asynccontextmanager
 
 from app.config import settings
 from app.api import auth, chat, documents, health
+from app.services import database, embeddings, extraction, health as health_service, http_client, llm, logs, metrics, redis_client, sessions
+from app.utils.pagination import NEXT_CURSOR_HEADER
 
 # Configure logging
-logging.basicConfig(
-    level=getattr(logging, settings.LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+logs.configure_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -29,13 +28,25 @@ async def lifespan(app: FastAPI):
     logger.info(f"Database: {settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}")
     
     # Initialize database connection
-    # TODO: Add database initialization here
+    await database.init_pool()
+    await database.apply_migrations()
     
     # Initialize Redis connection
-    # TODO: Add Redis initialization here
+    await redis_client.init_redis()
+    sessions.start_session_listener()
+    
+    # Shared HTTP client for Nextcloud, OAuth2 and OpenAI
+    await http_client.init_http_client()
+    
+    # Document parsing runs in separate processes, off the event loop
+    extraction.start_extraction_pool()
     
     # Load AI models
-    # TODO: Add model loading here
+    await embeddings.start_embedding_service()
+    await llm.start_llm()
+    
+    # Dependency checks for the health endpoints, off the request path
+    await health_service.start_health_sampler()
     
     logger.info("Eneo backend started successfully")
     
@@ -43,7 +54,15 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Eneo backend...")
-    # TODO: Add cleanup code here
+    await health_service.stop_health_sampler()
+    await llm.stop_llm()
+    await embeddings.stop_embedding_service()
+    extraction.stop_extraction_pool()
+    await http_client.close_http_client()
+    await sessions.stop_session_listener()
+    await redis_client.close_redis()
+    await database.close_pool()
+    metrics.mark_process_dead()
     logger.info("Eneo backend shut down successfully")
 
 
@@ -62,8 +81,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, logs.REQUEST_ID_HEADER],
 )
 
+# Request latency per route, for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Outermost, so everything logged for a request carries its ID
+app.add_middleware(logs.RequestIdMiddleware)
+
 
 # Exception handlers
 @app.exception_handler(Exception)
@@ -74,7 +100,8 @@ async def global_exception_handler(request: Request, exc: Exception):
         status_code=500,
         content={
             "error": "Internal server error",
-            "message": str(exc) if settings.DEBUG else "An unexpected error occurred"
+            "message": str(exc) if settings.DEBUG else "An unexpected error occurred",
+            "request_id": logs.request_id.get(),
         }
     )
 
@@ -97,6 +124,13 @@ async def root():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus scrape endpoint, aggregated over all worker processes"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
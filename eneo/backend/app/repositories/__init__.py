@@ -0,0 +1,9 @@
+"""
+Repository layer - async data access for the tables in init-db.sql
+
+Every function takes an optional connection so callers can compose several
+calls into one transaction; without one, the shared pool is used. Query text
+is kept in module-level constants: asyncpg prepares each distinct statement
+once per connection and reuses it, so the hot queries are parsed and planned
+once rather than on every request.
+"""
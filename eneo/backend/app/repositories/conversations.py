@@ -0,0 +1,172 @@
+"""
+Conversations and messages repository
+"""
+
+from typing import List, Optional
+
+import asyncpg
+
+from app.services.database import get_executor
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_ID
+
+LIST_CONVERSATIONS = """
+    SELECT c.id, c.title, c.created_at, c.updated_at,
+           (SELECT count(*) FROM messages m WHERE m.conversation_id = c.id) AS message_count
+    FROM conversations c
+    WHERE c.user_id = $1 AND c.id < $2
+    ORDER BY c.id DESC
+    LIMIT $3
+"""
+
+GET_CONVERSATION = """
+    SELECT id, user_id, title, summary, summary_message_id, created_at, updated_at
+    FROM conversations
+    WHERE id = $1 AND user_id = $2
+"""
+
+CREATE_CONVERSATION = """
+    INSERT INTO conversations (user_id, title)
+    VALUES ($1, $2)
+    RETURNING id
+"""
+
+UPDATE_TITLE = "UPDATE conversations SET title = $3 WHERE id = $1 AND user_id = $2"
+
+DELETE_CONVERSATION = "DELETE FROM conversations WHERE id = $1 AND user_id = $2"
+
+LIST_MESSAGES = """
+    SELECT id, role, content, created_at
+    FROM messages
+    WHERE conversation_id = $1 AND id > $2
+    ORDER BY id
+    LIMIT $3
+"""
+
+RECENT_MESSAGES = """
+    SELECT id, role, content
+    FROM messages
+    WHERE conversation_id = $1 AND id > $2
+    ORDER BY id DESC
+    LIMIT $3
+"""
+
+MESSAGES_BETWEEN = """
+    SELECT id, role, content
+    FROM messages
+    WHERE conversation_id = $1 AND id > $2 AND id < $3
+    ORDER BY id
+    LIMIT $4
+"""
+
+# Guarded by the previous watermark so concurrent compactions cannot fold twice
+UPDATE_SUMMARY = """
+    UPDATE conversations SET summary = $2, summary_message_id = $3
+    WHERE id = $1 AND coalesce(summary_message_id, 0) = $4
+"""
+
+ADD_MESSAGE = """
+    INSERT INTO messages (conversation_id, role, content)
+    VALUES ($1, $2, $3)
+    RETURNING id
+"""
+
+TOUCH_CONVERSATION = "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE id = $1"
+
+
+async def list_conversations(
+    user_id: int,
+    before_id: Optional[int] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    conn: Optional[asyncpg.Connection] = None,
+) -> List[asyncpg.Record]:
+    """List a user's conversations, newest first, starting below an id"""
+    return await get_executor(conn).fetch(LIST_CONVERSATIONS, user_id, before_id or MAX_ID, limit)
+
+
+async def get_conversation(
+    conversation_id: int,
+    user_id: int,
+    conn: Optional[asyncpg.Connection] = None,
+) -> Optional[asyncpg.Record]:
+    """Fetch a conversation if it belongs to the user"""
+    return await get_executor(conn).fetchrow(GET_CONVERSATION, conversation_id, user_id)
+
+
+async def create_conversation(user_id: int, title: str, conn: Optional[asyncpg.Connection] = None) -> int:
+    """Start a new conversation, returning its id"""
+    return await get_executor(conn).fetchval(CREATE_CONVERSATION, user_id, title)
+
+
+async def update_title(
+    conversation_id: int,
+    user_id: int,
+    title: str,
+    conn: Optional[asyncpg.Connection] = None,
+) -> bool:
+    """Rename a conversation; returns False if the user does not own it"""
+    result = await get_executor(conn).execute(UPDATE_TITLE, conversation_id, user_id, title)
+    return result != "UPDATE 0"
+
+
+async def delete_conversation(conversation_id: int, user_id: int, conn: Optional[asyncpg.Connection] = None) -> bool:
+    """Delete a conversation and its messages; returns False if the user does not own it"""
+    result = await get_executor(conn).execute(DELETE_CONVERSATION, conversation_id, user_id)
+    return result != "DELETE 0"
+
+
+async def list_messages(
+    conversation_id: int,
+    after_id: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    conn: Optional[asyncpg.Connection] = None,
+) -> List[asyncpg.Record]:
+    """List messages in a conversation in order, starting after a message id"""
+    return await get_executor(conn).fetch(LIST_MESSAGES, conversation_id, after_id, limit)
+
+
+async def recent_messages(
+    conversation_id: int,
+    after_id: int,
+    limit: int,
+    conn: Optional[asyncpg.Connection] = None,
+) -> List[asyncpg.Record]:
+    """The newest messages after a message id, newest first"""
+    return await get_executor(conn).fetch(RECENT_MESSAGES, conversation_id, after_id, limit)
+
+
+async def messages_between(
+    conversation_id: int,
+    after_id: int,
+    before_id: int,
+    limit: int,
+    conn: Optional[asyncpg.Connection] = None,
+) -> List[asyncpg.Record]:
+    """Messages strictly between two message ids, oldest first"""
+    return await get_executor(conn).fetch(MESSAGES_BETWEEN, conversation_id, after_id, before_id, limit)
+
+
+async def update_summary(
+    conversation_id: int,
+    summary: str,
+    through_message_id: int,
+    previous_message_id: int,
+    conn: Optional[asyncpg.Connection] = None,
+) -> bool:
+    """Store a rolling summary; returns False if another update moved the watermark first"""
+    result = await get_executor(conn).execute(
+        UPDATE_SUMMARY, conversation_id, summary, through_message_id, previous_message_id
+    )
+    return result != "UPDATE 0"
+
+
+async def add_message(
+    conversation_id: int,
+    role: str,
+    content: str,
+    conn: Optional[asyncpg.Connection] = None,
+) -> int:
+    """Append a message and bump the conversation's updated_at"""
+    executor = get_executor(conn)
+    message_id = await executor.fetchval(ADD_MESSAGE, conversation_id, role, content)
+    await executor.execute(TOUCH_CONVERSATION, conversation_id)
+    return message_id
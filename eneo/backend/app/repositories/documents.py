@@ -0,0 +1,209 @@
+"""
+Documents repository
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from app.services.database import get_executor
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_ID
+
+DOCUMENT_COLUMNS = """
+    id, nextcloud_file_id, nextcloud_file_path, title, file_type, file_size,
+    indexed_at, created_at
+"""
+
+LIST_DOCUMENTS = f"""
+    SELECT {DOCUMENT_COLUMNS}
+    FROM documents
+    WHERE user_id = $1 AND id < $2
+    ORDER BY id DESC
+    LIMIT $3
+"""
+
+GET_DOCUMENT = f"""
+    SELECT {DOCUMENT_COLUMNS}
+    FROM documents
+    WHERE id = $1 AND user_id = $2
+"""
+
+GET_BY_PATH = """
+    SELECT id, title, file_type, content_hash, chunk_count, indexed_at
+    FROM documents
+    WHERE user_id = $1 AND nextcloud_file_path = $2
+"""
+
+UPSERT_FOR_INDEXING = """
+    INSERT INTO documents (user_id, nextcloud_file_path, nextcloud_file_id, title, file_type)
+    VALUES ($1, $2, $3, $4, $5)
+    ON CONFLICT (user_id, nextcloud_file_path)
+    DO UPDATE SET nextcloud_file_id = COALESCE(EXCLUDED.nextcloud_file_id, documents.nextcloud_file_id)
+    RETURNING id, nextcloud_etag, nextcloud_mtime, content_hash, indexed_at, file_size,
+              (SELECT count(*) FROM embeddings WHERE document_id = documents.id AND index_run IS NULL) AS chunks
+"""
+
+MARK_INDEXED = """
+    UPDATE documents
+    SET file_size = $2, content_hash = $3, nextcloud_etag = $4, nextcloud_mtime = $5,
+        file_type = $6, chunk_count = $7, indexed_at = CURRENT_TIMESTAMP
+    WHERE id = $1
+"""
+
+DELETE_DOCUMENT = "DELETE FROM documents WHERE id = $1 AND user_id = $2"
+
+DELETE_BY_PATHS = "DELETE FROM documents WHERE user_id = $1 AND nextcloud_file_path = ANY($2)"
+
+DELETE_UNDER = "DELETE FROM documents WHERE user_id = $1 AND starts_with(nextcloud_file_path, $2)"
+
+ETAGS_FOR_PATHS = """
+    SELECT nextcloud_file_path, nextcloud_etag
+    FROM documents
+    WHERE user_id = $1 AND nextcloud_file_path = ANY($2)
+"""
+
+ETAGS_UNDER = """
+    SELECT nextcloud_file_path, nextcloud_etag
+    FROM documents
+    WHERE user_id = $1 AND starts_with(nextcloud_file_path, $2)
+"""
+
+# A document is searchable if the user owns it, it matches the optional
+# file_paths filter, and - once the user has granted any read/index
+# permission - it lies inside one of the granted paths
+SEARCHABLE_DOCUMENTS = """
+    WITH grants AS (
+        SELECT rtrim(nextcloud_file_path, '/') AS path
+        FROM file_permissions
+        WHERE user_id = $1 AND permission_type IN ('read', 'index')
+    )
+    SELECT d.id, d.chunk_count
+    FROM documents d
+    WHERE d.user_id = $1
+      AND d.indexed_at IS NOT NULL
+      AND ($2::text[] IS NULL OR d.nextcloud_file_path = ANY($2))
+      AND (
+          NOT EXISTS (SELECT 1 FROM grants)
+          OR EXISTS (
+              SELECT 1 FROM grants g
+              WHERE g.path = ''
+                 OR d.nextcloud_file_path = g.path
+                 OR starts_with(d.nextcloud_file_path, g.path || '/')
+          )
+      )
+"""
+
+USER_CHUNK_COUNT = "SELECT COALESCE(sum(chunk_count), 0)::bigint FROM documents WHERE user_id = $1"
+
+USER_CHUNK_COUNTS = """
+    SELECT user_id, sum(chunk_count)::bigint AS chunks
+    FROM documents
+    GROUP BY user_id
+    HAVING sum(chunk_count) >= $1
+"""
+
+
+async def list_documents(
+    user_id: int,
+    before_id: Optional[int] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    conn: Optional[asyncpg.Connection] = None,
+) -> List[asyncpg.Record]:
+    """List a user's documents, newest first, starting below an id"""
+    return await get_executor(conn).fetch(LIST_DOCUMENTS, user_id, before_id or MAX_ID, limit)
+
+
+async def get_document(document_id: int, user_id: int, conn: Optional[asyncpg.Connection] = None) -> Optional[asyncpg.Record]:
+    """Fetch a document if it belongs to the user"""
+    return await get_executor(conn).fetchrow(GET_DOCUMENT, document_id, user_id)
+
+
+async def get_by_path(user_id: int, file_path: str, conn: Optional[asyncpg.Connection] = None) -> Optional[asyncpg.Record]:
+    """Fetch the user's document for a Nextcloud path"""
+    return await get_executor(conn).fetchrow(GET_BY_PATH, user_id, file_path)
+
+
+async def upsert_for_indexing(
+    user_id: int,
+    file_path: str,
+    file_id: Optional[str],
+    title: str,
+    file_type: str,
+    conn: Optional[asyncpg.Connection] = None,
+) -> asyncpg.Record:
+    """Fetch or create the document row for a file, with its current index state"""
+    return await get_executor(conn).fetchrow(UPSERT_FOR_INDEXING, user_id, file_path, file_id, title, file_type)
+
+
+async def mark_indexed(
+    document_id: int,
+    file_size: int,
+    content_hash: str,
+    etag: Optional[str],
+    mtime: Optional[datetime],
+    file_type: str,
+    chunk_count: int,
+    conn: Optional[asyncpg.Connection] = None,
+) -> None:
+    """Record a completed indexing run"""
+    await get_executor(conn).execute(
+        MARK_INDEXED, document_id, file_size, content_hash, etag, mtime, file_type, chunk_count
+    )
+
+
+async def delete_document(document_id: int, user_id: int, conn: Optional[asyncpg.Connection] = None) -> bool:
+    """Delete a document and its embeddings; returns False if the user does not own it"""
+    result = await get_executor(conn).execute(DELETE_DOCUMENT, document_id, user_id)
+    return result != "DELETE 0"
+
+
+async def delete_by_paths(user_id: int, file_paths: List[str], conn: Optional[asyncpg.Connection] = None) -> int:
+    """Delete the user's documents for these file paths; returns how many were removed"""
+    result = await get_executor(conn).execute(DELETE_BY_PATHS, user_id, file_paths)
+    return int(result.split()[-1])
+
+
+async def delete_under(user_id: int, folder_path: str, conn: Optional[asyncpg.Connection] = None) -> int:
+    """Delete the user's documents below a folder (given with a trailing slash)"""
+    result = await get_executor(conn).execute(DELETE_UNDER, user_id, folder_path)
+    return int(result.split()[-1])
+
+
+async def etags_for_paths(
+    user_id: int,
+    file_paths: List[str],
+    conn: Optional[asyncpg.Connection] = None,
+) -> Dict[str, Optional[str]]:
+    """Map file path -> ETag recorded at the last indexing, for paths that have a document"""
+    rows = await get_executor(conn).fetch(ETAGS_FOR_PATHS, user_id, file_paths)
+    return {row["nextcloud_file_path"]: row["nextcloud_etag"] for row in rows}
+
+
+async def etags_under(
+    user_id: int,
+    folder_path: str,
+    conn: Optional[asyncpg.Connection] = None,
+) -> Dict[str, Optional[str]]:
+    """Map file path -> ETag recorded at the last indexing, for documents below a folder"""
+    rows = await get_executor(conn).fetch(ETAGS_UNDER, user_id, folder_path)
+    return {row["nextcloud_file_path"]: row["nextcloud_etag"] for row in rows}
+
+
+async def searchable_documents(
+    user_id: int,
+    file_paths: Optional[List[str]],
+    conn: Optional[asyncpg.Connection] = None,
+) -> List[asyncpg.Record]:
+    """(id, chunk_count) of every document the user may search"""
+    return await get_executor(conn).fetch(SEARCHABLE_DOCUMENTS, user_id, file_paths)
+
+
+async def users_with_chunks(min_chunks: int, conn: Optional[asyncpg.Connection] = None) -> List[asyncpg.Record]:
+    """(user_id, chunks) for users owning at least min_chunks chunks"""
+    return await get_executor(conn).fetch(USER_CHUNK_COUNTS, min_chunks)
+
+
+async def user_chunk_count(user_id: int, conn: Optional[asyncpg.Connection] = None) -> int:
+    """Total chunks across a user's documents"""
+    return await get_executor(conn).fetchval(USER_CHUNK_COUNT, user_id)
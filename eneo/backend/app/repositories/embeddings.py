@@ -0,0 +1,158 @@
+"""
+Embeddings repository
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from app.services.database import get_executor
+
+FIND_BY_HASHES = """
+    SELECT DISTINCT ON (chunk_hash) chunk_hash, embedding
+    FROM embeddings
+    WHERE chunk_hash = ANY($1::varchar[])
+"""
+
+INSERT_STAGED_CHUNK = """
+    INSERT INTO embeddings (document_id, user_id, chunk_index, chunk_text, chunk_hash, embedding, index_run)
+    VALUES ($1, $2, $3, $4, $5, $6, $7)
+"""
+
+CHUNK_TEXTS = """
+    SELECT chunk_index, chunk_text
+    FROM embeddings
+    WHERE document_id = $1 AND index_run IS NULL AND chunk_index > $2
+    ORDER BY chunk_index
+    LIMIT $3
+"""
+
+DELETE_RUN = "DELETE FROM embeddings WHERE index_run = $1"
+
+DELETE_LIVE = "DELETE FROM embeddings WHERE document_id = $1 AND index_run IS NULL"
+
+PROMOTE_RUN = "UPDATE embeddings SET index_run = NULL WHERE index_run = $1"
+
+# Left behind by runs that died without cleaning up
+DELETE_ABANDONED_RUNS = """
+    DELETE FROM embeddings
+    WHERE document_id = $1 AND index_run IS NOT NULL
+      AND created_at < CURRENT_TIMESTAMP - make_interval(secs => $2)
+"""
+
+SEARCH_IN_DOCUMENTS = """
+    SELECT n.id AS chunk_id, d.id, d.nextcloud_file_path, d.title, n.chunk_text, n.score
+    FROM (
+        SELECT e.id, e.document_id, e.chunk_text, 1 - (e.embedding <=> $1) AS score
+        FROM embeddings e
+        WHERE e.document_id = ANY($2::int[]) AND e.index_run IS NULL
+        ORDER BY e.embedding <=> $1
+        LIMIT $3
+    ) n
+    JOIN documents d ON d.id = n.document_id
+    ORDER BY n.score DESC
+"""
+
+LEXICAL_SEARCH = """
+    SELECT n.id AS chunk_id, d.id, d.nextcloud_file_path, d.title, n.chunk_text, n.score
+    FROM (
+        SELECT e.id, e.document_id, e.chunk_text, ts_rank_cd(e.chunk_tsv, q) AS score
+        FROM embeddings e, websearch_to_tsquery('swedish', $1) q
+        WHERE e.document_id = ANY($2::int[]) AND e.index_run IS NULL AND e.chunk_tsv @@ q
+        ORDER BY score DESC
+        LIMIT $3
+    ) n
+    JOIN documents d ON d.id = n.document_id
+    ORDER BY n.score DESC
+"""
+
+# The owner id is inlined rather than bound: a partial index on user_id = N can
+# only be chosen when the planner sees the literal, not under a generic plan
+SEARCH_IN_PARTITION = """
+    SELECT n.id AS chunk_id, d.id, d.nextcloud_file_path, d.title, n.chunk_text, n.score
+    FROM (
+        SELECT e.id, e.document_id, e.chunk_text, 1 - (e.embedding <=> $1) AS score
+        FROM embeddings e
+        WHERE e.user_id = {user_id} AND e.document_id = ANY($2::int[]) AND e.index_run IS NULL
+        ORDER BY e.embedding <=> $1
+        LIMIT $3
+    ) n
+    JOIN documents d ON d.id = n.document_id
+    ORDER BY n.score DESC
+"""
+
+
+async def find_by_hashes(hashes: List[str], conn: Optional[asyncpg.Connection] = None) -> List[asyncpg.Record]:
+    """Fetch one stored embedding per known chunk hash"""
+    return await get_executor(conn).fetch(FIND_BY_HASHES, hashes)
+
+
+async def insert_staged_chunks(
+    run_id: str,
+    rows: Sequence[Tuple],
+    conn: Optional[asyncpg.Connection] = None,
+) -> None:
+    """Insert (document_id, user_id, chunk_index, chunk_text, chunk_hash, embedding) rows under an indexing run"""
+    await get_executor(conn).executemany(INSERT_STAGED_CHUNK, [(*row, run_id) for row in rows])
+
+
+async def chunk_texts(
+    document_id: int,
+    after_index: int,
+    limit: int,
+    conn: Optional[asyncpg.Connection] = None,
+) -> List[asyncpg.Record]:
+    """A page of a document's chunks in order, starting after chunk_index after_index"""
+    return await get_executor(conn).fetch(CHUNK_TEXTS, document_id, after_index, limit)
+
+
+async def delete_run(run_id: str, conn: Optional[asyncpg.Connection] = None) -> None:
+    """Discard the rows staged by an indexing run"""
+    await get_executor(conn).execute(DELETE_RUN, run_id)
+
+
+async def swap_in_run(
+    document_id: int,
+    run_id: str,
+    abandoned_after: float,
+    conn: asyncpg.Connection,
+) -> None:
+    """
+    Replace a document's live chunks with the rows staged by a run
+    Call inside a transaction; rows of runs older than abandoned_after seconds are dropped too
+    """
+    await conn.execute(DELETE_LIVE, document_id)
+    await conn.execute(PROMOTE_RUN, run_id)
+    await conn.execute(DELETE_ABANDONED_RUNS, document_id, abandoned_after)
+
+
+async def search_in_documents(
+    query_vector,
+    document_ids: List[int],
+    limit: int,
+    conn: Optional[asyncpg.Connection] = None,
+) -> List[asyncpg.Record]:
+    """Nearest chunks by cosine distance within the given documents"""
+    return await get_executor(conn).fetch(SEARCH_IN_DOCUMENTS, query_vector, document_ids, limit)
+
+
+async def lexical_search(
+    query: str,
+    document_ids: List[int],
+    limit: int,
+    conn: Optional[asyncpg.Connection] = None,
+) -> List[asyncpg.Record]:
+    """Full-text matches ranked by ts_rank_cd within the given documents"""
+    return await get_executor(conn).fetch(LEXICAL_SEARCH, query, document_ids, limit)
+
+
+async def search_in_partition(
+    query_vector,
+    user_id: int,
+    document_ids: List[int],
+    limit: int,
+    conn: Optional[asyncpg.Connection] = None,
+) -> List[asyncpg.Record]:
+    """Nearest chunks within the given documents, served by the owner's partial index"""
+    query = SEARCH_IN_PARTITION.format(user_id=int(user_id))
+    return await get_executor(conn).fetch(query, query_vector, document_ids, limit)
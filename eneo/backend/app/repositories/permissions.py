@@ -0,0 +1,44 @@
+"""
+File permissions repository
+"""
+
+from typing import List, Optional
+
+import asyncpg
+
+from app.services.database import get_executor
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_ID
+
+GRANT_PERMISSION = """
+    INSERT INTO file_permissions (user_id, nextcloud_file_path, permission_type)
+    VALUES ($1, $2, $3)
+    RETURNING id, nextcloud_file_path, permission_type, granted_at
+"""
+
+LIST_PERMISSIONS = """
+    SELECT id, nextcloud_file_path, permission_type, granted_at
+    FROM file_permissions
+    WHERE user_id = $1 AND id < $2
+    ORDER BY id DESC
+    LIMIT $3
+"""
+
+
+async def grant_permission(
+    user_id: int,
+    file_path: str,
+    permission_type: str,
+    conn: Optional[asyncpg.Connection] = None,
+) -> asyncpg.Record:
+    """Record that Eneo may access a file or folder"""
+    return await get_executor(conn).fetchrow(GRANT_PERMISSION, user_id, file_path, permission_type)
+
+
+async def list_permissions(
+    user_id: int,
+    before_id: Optional[int] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    conn: Optional[asyncpg.Connection] = None,
+) -> List[asyncpg.Record]:
+    """List permissions granted by a user, newest first, starting below an id"""
+    return await get_executor(conn).fetch(LIST_PERMISSIONS, user_id, before_id or MAX_ID, limit)
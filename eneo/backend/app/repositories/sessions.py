@@ -0,0 +1,82 @@
+"""
+Sessions repository
+"""
+
+from datetime import datetime
+from typing import Optional
+
+import asyncpg
+
+from app.services.database import get_executor
+
+SESSION_COLUMNS = """
+    s.session_token, s.user_id, u.nextcloud_user_id,
+    s.access_token, s.refresh_token, s.expires_at, s.created_at
+"""
+
+INSERT_SESSION = """
+    INSERT INTO sessions (user_id, session_token, access_token, refresh_token, expires_at)
+    VALUES ($1, $2, $3, $4, $5)
+"""
+
+GET_SESSION = f"""
+    SELECT {SESSION_COLUMNS}
+    FROM sessions s
+    JOIN users u ON u.id = s.user_id
+    WHERE s.session_token = $1
+"""
+
+GET_LATEST_SESSION = f"""
+    SELECT {SESSION_COLUMNS}
+    FROM sessions s
+    JOIN users u ON u.id = s.user_id
+    WHERE s.user_id = $1 AND s.access_token IS NOT NULL
+    ORDER BY s.created_at DESC
+    LIMIT 1
+"""
+
+UPDATE_TOKENS = """
+    UPDATE sessions
+    SET access_token = $2, refresh_token = $3, expires_at = $4
+    WHERE session_token = $1
+"""
+
+DELETE_SESSION = "DELETE FROM sessions WHERE session_token = $1"
+
+
+async def create_session(
+    user_id: int,
+    session_token: str,
+    access_token: Optional[str],
+    refresh_token: Optional[str],
+    expires_at: Optional[datetime],
+    conn: Optional[asyncpg.Connection] = None,
+) -> None:
+    """Store a new session"""
+    await get_executor(conn).execute(INSERT_SESSION, user_id, session_token, access_token, refresh_token, expires_at)
+
+
+async def get_session(session_token: str, conn: Optional[asyncpg.Connection] = None) -> Optional[asyncpg.Record]:
+    """Fetch a session joined with its user"""
+    return await get_executor(conn).fetchrow(GET_SESSION, session_token)
+
+
+async def get_latest_session(user_id: int, conn: Optional[asyncpg.Connection] = None) -> Optional[asyncpg.Record]:
+    """Fetch the most recent session with an access token for a user"""
+    return await get_executor(conn).fetchrow(GET_LATEST_SESSION, user_id)
+
+
+async def update_tokens(
+    session_token: str,
+    access_token: str,
+    refresh_token: Optional[str],
+    expires_at: Optional[datetime],
+    conn: Optional[asyncpg.Connection] = None,
+) -> None:
+    """Store refreshed OAuth2 tokens on a session"""
+    await get_executor(conn).execute(UPDATE_TOKENS, session_token, access_token, refresh_token, expires_at)
+
+
+async def delete_session(session_token: str, conn: Optional[asyncpg.Connection] = None) -> None:
+    """Remove a session"""
+    await get_executor(conn).execute(DELETE_SESSION, session_token)
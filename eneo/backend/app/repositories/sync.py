@@ -0,0 +1,101 @@
+"""
+Sync state repository - change tracking for folders granted for indexing
+"""
+
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from app.services.database import get_executor
+
+# One sync root per distinct path granted with permission_type 'index'
+ENSURE_SYNC_ROOTS = """
+    INSERT INTO sync_roots (user_id, root_path)
+    SELECT DISTINCT user_id, '/' || btrim(nextcloud_file_path, '/')
+    FROM file_permissions
+    WHERE permission_type = 'index'
+    ON CONFLICT (user_id, root_path) DO NOTHING
+"""
+
+PRUNE_SYNC_ROOTS = """
+    DELETE FROM sync_roots s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM file_permissions p
+        WHERE p.user_id = s.user_id
+          AND p.permission_type = 'index'
+          AND '/' || btrim(p.nextcloud_file_path, '/') = s.root_path
+    )
+"""
+
+LIST_SYNC_ROOTS = """
+    SELECT id, user_id, root_path, etag, sync_token, last_synced_at
+    FROM sync_roots
+    ORDER BY last_synced_at NULLS FIRST, id
+"""
+
+FOLDER_ETAGS = "SELECT folder_path, etag FROM sync_folders WHERE root_id = $1"
+
+SAVE_FOLDER_ETAGS = """
+    INSERT INTO sync_folders (root_id, folder_path, etag)
+    SELECT $1, folder_path, etag FROM unnest($2::text[], $3::text[]) AS f(folder_path, etag)
+    ON CONFLICT (root_id, folder_path) DO UPDATE SET etag = EXCLUDED.etag
+"""
+
+FORGET_FOLDERS = """
+    DELETE FROM sync_folders
+    WHERE root_id = $1
+      AND EXISTS (SELECT 1 FROM unnest($2::text[]) AS gone(path) WHERE starts_with(folder_path, gone.path))
+"""
+
+MARK_SYNCED = """
+    UPDATE sync_roots
+    SET etag = $2, sync_token = $3, last_synced_at = CURRENT_TIMESTAMP, last_error = NULL
+    WHERE id = $1
+"""
+
+MARK_FAILED = "UPDATE sync_roots SET last_error = $2 WHERE id = $1"
+
+
+async def refresh_roots(conn: Optional[asyncpg.Connection] = None) -> List[asyncpg.Record]:
+    """Bring sync roots in line with current index grants and list them, least recently synced first"""
+    executor = get_executor(conn)
+    await executor.execute(ENSURE_SYNC_ROOTS)
+    await executor.execute(PRUNE_SYNC_ROOTS)
+    return await executor.fetch(LIST_SYNC_ROOTS)
+
+
+async def folder_etags(root_id: int, conn: Optional[asyncpg.Connection] = None) -> Dict[str, Optional[str]]:
+    """Map folder path -> ETag seen at the last walk of a root"""
+    rows = await get_executor(conn).fetch(FOLDER_ETAGS, root_id)
+    return {row["folder_path"]: row["etag"] for row in rows}
+
+
+async def save_folder_etags(
+    root_id: int,
+    etags: Dict[str, Optional[str]],
+    conn: Optional[asyncpg.Connection] = None,
+) -> None:
+    """Record folder ETags seen during a walk"""
+    if etags:
+        await get_executor(conn).execute(SAVE_FOLDER_ETAGS, root_id, list(etags), list(etags.values()))
+
+
+async def forget_folders(root_id: int, folder_paths: List[str], conn: Optional[asyncpg.Connection] = None) -> None:
+    """Drop stored ETags for folders (and everything below them) that no longer exist"""
+    if folder_paths:
+        await get_executor(conn).execute(FORGET_FOLDERS, root_id, folder_paths)
+
+
+async def mark_synced(
+    root_id: int,
+    etag: Optional[str],
+    sync_token: Optional[str],
+    conn: Optional[asyncpg.Connection] = None,
+) -> None:
+    """Record a completed pass"""
+    await get_executor(conn).execute(MARK_SYNCED, root_id, etag, sync_token)
+
+
+async def mark_failed(root_id: int, error: str, conn: Optional[asyncpg.Connection] = None) -> None:
+    """Record why the last pass failed; the previous state is kept for the next attempt"""
+    await get_executor(conn).execute(MARK_FAILED, root_id, error)
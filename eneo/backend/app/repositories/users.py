@@ -0,0 +1,38 @@
+"""
+Users repository
+"""
+
+from typing import Optional
+
+import asyncpg
+
+from app.services.database import get_executor
+
+UPSERT_USER = """
+    INSERT INTO users (nextcloud_user_id, email, display_name)
+    VALUES ($1, $2, $3)
+    ON CONFLICT (nextcloud_user_id)
+    DO UPDATE SET email = EXCLUDED.email, display_name = EXCLUDED.display_name
+    RETURNING id
+"""
+
+GET_USER = """
+    SELECT id, nextcloud_user_id, email, display_name, created_at, updated_at
+    FROM users
+    WHERE id = $1
+"""
+
+
+async def upsert_user(
+    nextcloud_user_id: str,
+    email: Optional[str],
+    display_name: Optional[str],
+    conn: Optional[asyncpg.Connection] = None,
+) -> int:
+    """Create or update a user from Nextcloud profile data, returning its id"""
+    return await get_executor(conn).fetchval(UPSERT_USER, nextcloud_user_id, email, display_name)
+
+
+async def get_user(user_id: int, conn: Optional[asyncpg.Connection] = None) -> Optional[asyncpg.Record]:
+    """Fetch a user by id"""
+    return await get_executor(conn).fetchrow(GET_USER, user_id)
@@ -0,0 +1,104 @@
+"""
+Chat turns - retrieval, prompt assembly and persistence around model generation
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import logging
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.repositories import conversations as conversations_repo
+from app.services.context import HISTORY_FETCH_LIMIT, build_prompt, schedule_compaction
+from app.services.search import SearchHit, hybrid_search
+from app.services.sessions import UserSession
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = (
+    "Du är Eneo, en AI-assistent för medarbetare i Sundsvalls kommun. "
+    "Svara på svenska. Använd utdragen ur dokumenten nedan när de är relevanta "
+    "och hänvisa till filnamnet. Om svaret inte finns i dokumenten, säg det."
+)
+
+
+@dataclass
+class ChatTurn:
+    """A user message with its assembled prompt, waiting for the assistant's reply"""
+    conversation_id: Optional[int]  # None until save_user_message creates the conversation
+    user_id: int
+    message: str
+    prompt: List[Dict[str, str]]
+    sources: List[dict] = field(default_factory=list)
+    summary: Optional[str] = None
+    summary_through: int = 0
+    compact_before: Optional[int] = None  # older turns did not fit and should be summarized
+
+
+def _source(hit: SearchHit) -> dict:
+    return {
+        "document_id": hit.document_id,
+        "file": hit.file_path,
+        "title": hit.title,
+        "excerpt": hit.excerpt,
+        "relevance": hit.score,
+    }
+
+
+async def start_turn(
+    session: UserSession,
+    message: str,
+    conversation_id: Optional[int] = None,
+    context_files: Optional[List[str]] = None,
+) -> ChatTurn:
+    """
+    Resolve the conversation and assemble the prompt; nothing is written yet
+    Raises 404 if the conversation does not belong to the user
+    """
+    conversation = None
+    history = []
+    if conversation_id is not None:
+        conversation = await conversations_repo.get_conversation(conversation_id, session.user_id)
+        if conversation is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        history = await conversations_repo.recent_messages(
+            conversation_id, conversation["summary_message_id"] or 0, HISTORY_FETCH_LIMIT
+        )
+
+    hits = await hybrid_search(message, session.user_id, context_files, settings.CHAT_SOURCE_CHUNKS, 0.9)
+    context = build_prompt(SYSTEM_PROMPT, message, conversation, history, hits)
+
+    return ChatTurn(
+        conversation_id=conversation_id,
+        user_id=session.user_id,
+        message=message,
+        prompt=context.messages,
+        sources=[_source(hit) for hit in context.hits],
+        summary=conversation["summary"] if conversation is not None else None,
+        summary_through=context.summary_through,
+        compact_before=context.compact_before,
+    )
+
+
+async def save_user_message(turn: ChatTurn) -> None:
+    """
+    Save the user message, creating the conversation if it is new
+    Called once the generation has been admitted, so a rejected request
+    leaves neither an empty conversation nor an unanswered message behind
+    """
+    if turn.conversation_id is None:
+        turn.conversation_id = await conversations_repo.create_conversation(turn.user_id, turn.message[:100])
+    await conversations_repo.add_message(turn.conversation_id, "user", turn.message)
+
+
+async def finish_turn(turn: ChatTurn, reply: str) -> Optional[int]:
+    """
+    Save the assistant's reply and fold turns that fell out of the prompt into the summary
+    Nothing is saved if the model produced no text
+    """
+    if turn.compact_before is not None:
+        schedule_compaction(turn.conversation_id, turn.user_id, turn.summary, turn.summary_through, turn.compact_before)
+    if not reply:
+        return None
+    return await conversations_repo.add_message(turn.conversation_id, "assistant", reply)
@@ -0,0 +1,62 @@
+"""
+Extracted text of indexed documents
+
+The index stores each document as overlapping chunks. The text is rebuilt by
+reading the chunks in order a page at a time and dropping the part of each
+chunk that repeats the end of the previous one, so serving it costs neither
+a Nextcloud download nor a re-extraction.
+"""
+
+from typing import AsyncIterator
+
+from app.repositories import embeddings as embeddings_repo
+
+CHUNK_PAGE_SIZE = 100
+
+
+def overlap_length(previous: str, chunk: str, limit: int) -> int:
+    """Length of the longest prefix of chunk (at most limit) that ends previous"""
+    head = chunk[:limit]
+    tail = previous[-limit:]
+    # KMP failure function over head + separator + tail; its final value is
+    # the longest prefix of head that is also a suffix of tail
+    text = head + "\0" + tail
+    failure = [0] * len(text)
+    for i in range(1, len(text)):
+        k = failure[i - 1]
+        while k and text[i] != text[k]:
+            k = failure[k - 1]
+        if text[i] == text[k]:
+            k += 1
+        failure[i] = k
+    return failure[-1] if text else 0
+
+
+def _whole_units(previous: str, chunk: str, skip: int) -> bool:
+    """Overlaps are whole sentences or rows; a match inside a word is a coincidence"""
+    before = previous[-skip - 1] if skip < len(previous) else " "
+    return before.isspace() and chunk[skip].isspace()
+
+
+async def iter_indexed_text(document_id: int) -> AsyncIterator[str]:
+    """Yield a document's text chunk by chunk, with chunk overlaps removed"""
+    previous = ""
+    after = -1
+    while True:
+        rows = await embeddings_repo.chunk_texts(document_id, after, CHUNK_PAGE_SIZE)
+        for row in rows:
+            chunk = row["chunk_text"] or ""
+            piece = chunk
+            if previous and len(chunk) > 1:
+                # A chunk never repeats all of the previous one
+                skip = overlap_length(previous, chunk, len(chunk) - 1)
+                if skip and not _whole_units(previous, chunk, skip):
+                    skip = 0
+                # Chunks without overlap start a new section or paragraph
+                piece = chunk[skip:] if skip else "\n\n" + chunk
+            if piece:
+                yield piece
+            previous = chunk
+        if len(rows) < CHUNK_PAGE_SIZE:
+            return
+        after = rows[-1]["chunk_index"]
@@ -0,0 +1,192 @@
+"""
+Token-budgeted prompt assembly for chat turns
+
+The prompt must fit the model context with room left for the reply. The
+budget is filled in priority order: system prompt and question, the rolling
+summary, recent turns (newest first, up to CHAT_HISTORY_TOKENS), then
+retrieved document excerpts in rank order.
+
+Turns that no longer fit are folded into conversations.summary after the
+reply has been sent. Each update summarizes only the previous summary plus the
+next CHAT_SUMMARY_BATCH messages past the summary watermark, so the cost per
+turn stays flat however long the conversation gets.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+import asyncio
+import logging
+
+from app.config import settings
+from app.repositories import conversations as conversations_repo
+from app.services import llm
+from app.services.search import SearchHit
+
+logger = logging.getLogger(__name__)
+
+# Recent messages fetched per turn; the history budget is normally exhausted well before this
+HISTORY_FETCH_LIMIT = 50
+
+# Role markers and separators the chat template adds per message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Sammanfatta samtalet nedan kortfattat på svenska. Behåll fakta, beslut, "
+    "namn, siffror och öppna frågor som kan behövas senare i samtalet."
+)
+
+ROLE_LABELS = {"user": "Användare", "assistant": "Assistent"}
+
+
+@dataclass
+class PromptContext:
+    """An assembled prompt and what was left out of it"""
+    messages: List[Dict[str, str]]
+    hits: List[SearchHit] = field(default_factory=list)  # excerpts that made it into the prompt
+    tokens: int = 0
+    summary_through: int = 0  # current summary watermark
+    compact_before: Optional[int] = None  # set when older unsummarized turns were left out
+
+
+def _tokens(text: str) -> int:
+    return llm.count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+
+def build_prompt(
+    system_prompt: str,
+    question: str,
+    conversation=None,
+    history: Optional[List] = None,
+    hits: Optional[List[SearchHit]] = None,
+) -> PromptContext:
+    """
+    Fit system prompt, summary, recent turns and excerpts into the context window
+    history is newest first, as returned by conversations_repo.recent_messages
+    """
+    history = history or []
+    budget = settings.AI_CONTEXT_TOKENS - settings.AI_MAX_TOKENS
+    used = _tokens(system_prompt) + _tokens(question)
+
+    summary_through = 0
+    if conversation is not None and conversation["summary"]:
+        system_prompt = f"{system_prompt}\n\nSammanfattning av samtalet hittills:\n{conversation['summary']}"
+        used += llm.count_tokens(conversation["summary"]) + MESSAGE_OVERHEAD_TOKENS
+    if conversation is not None:
+        summary_through = conversation["summary_message_id"] or 0
+
+    kept = []
+    history_budget = min(settings.CHAT_HISTORY_TOKENS, budget - used)
+    for row in history:
+        cost = _tokens(row["content"])
+        if cost > history_budget:
+            break
+        history_budget -= cost
+        used += cost
+        kept.append(row)
+
+    compact_before = None
+    if len(kept) < len(history) or len(history) >= HISTORY_FETCH_LIMIT:
+        compact_before = kept[-1]["id"] if kept else history[0]["id"] + 1
+
+    included = []
+    excerpts = []
+    for hit in hits or []:
+        excerpt = f"[{hit.file_path}]\n{hit.excerpt}"
+        cost = llm.count_tokens(excerpt) + 2
+        if used + cost > budget:
+            continue
+        used += cost
+        excerpts.append(excerpt)
+        included.append(hit)
+    if excerpts:
+        system_prompt = f"{system_prompt}\n\nUtdrag ur dokument:\n\n" + "\n\n".join(excerpts)
+
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend({"role": row["role"], "content": row["content"]} for row in reversed(kept))
+    messages.append({"role": "user", "content": question})
+
+    return PromptContext(
+        messages=messages,
+        hits=included,
+        tokens=used,
+        summary_through=summary_through,
+        compact_before=compact_before,
+    )
+
+
+async def compact_history(
+    conversation_id: int,
+    user_id: int,
+    summary: Optional[str],
+    summary_through: int,
+    before_id: int,
+) -> bool:
+    """Fold the next batch of unsummarized messages into the rolling summary"""
+    rows = await conversations_repo.messages_between(
+        conversation_id, summary_through, before_id, settings.CHAT_SUMMARY_BATCH
+    )
+    if not rows:
+        return False
+
+    # Leave room for the summary prompt, the previous summary and the new summary
+    budget = settings.AI_CONTEXT_TOKENS - 3 * settings.CHAT_SUMMARY_TOKENS - _tokens(SUMMARY_PROMPT)
+    lines = []
+    through = summary_through
+    for row in rows:
+        line = f"{ROLE_LABELS.get(row['role'], row['role'])}: {row['content']}"
+        cost = llm.count_tokens(line)
+        if lines and cost > budget:
+            break
+        if cost > budget:
+            # A single oversized message: keep its beginning
+            line = line[:int(budget * 3)]
+        budget -= cost
+        lines.append(line)
+        through = row["id"]
+
+    parts = []
+    if summary:
+        parts.append(f"Tidigare sammanfattning:\n{summary}")
+    parts.append("Nya meddelanden:\n" + "\n".join(lines))
+    prompt = [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": "\n\n".join(parts)},
+    ]
+
+    tokens = llm.stream_chat(prompt, user_id, max_tokens=settings.CHAT_SUMMARY_TOKENS)
+    new_summary = "".join([text async for text in tokens]).strip()
+    if not new_summary:
+        return False
+    return await conversations_repo.update_summary(conversation_id, new_summary, through, summary_through)
+
+
+_compacting: Set[int] = set()
+_tasks: Set[asyncio.Task] = set()
+
+
+def schedule_compaction(
+    conversation_id: int,
+    user_id: int,
+    summary: Optional[str],
+    summary_through: int,
+    before_id: int,
+) -> None:
+    """Run compact_history in the background, at most once at a time per conversation"""
+    if conversation_id in _compacting:
+        return
+
+    async def run() -> None:
+        try:
+            await compact_history(conversation_id, user_id, summary, summary_through, before_id)
+        except llm.LLMOverloaded:
+            # Not urgent; the next turn tries again
+            pass
+        except Exception:
+            logger.exception(f"Summarizing conversation {conversation_id} failed")
+        finally:
+            _compacting.discard(conversation_id)
+
+    _compacting.add(conversation_id)
+    task = asyncio.create_task(run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
@@ -0,0 +1,96 @@
+"""
+Database connection pool
+"""
+
+from pathlib import Path
+from typing import Optional, Union
+import logging
+
+import asyncpg
+from pgvector.asyncpg import register_vector
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[asyncpg.Pool] = None
+
+# Anything that can run a query: the pool or a connection acquired from it
+Executor = Union[asyncpg.Pool, asyncpg.Connection]
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / "migrations"
+# Held while migrating, so API and indexing worker processes starting together take turns.
+# Distinct from vector_index.REBUILD_LOCK_ID, which is held through hours-long index builds
+MIGRATION_LOCK = 0x656E6D69
+
+CREATE_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version VARCHAR(255) PRIMARY KEY,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """Register the pgvector codec on each new connection"""
+    await register_vector(conn)
+
+
+async def init_pool() -> asyncpg.Pool:
+    """Create the process-wide connection pool"""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            dsn=settings.DATABASE_URL,
+            min_size=settings.DB_POOL_MIN_SIZE,
+            max_size=settings.DB_POOL_MAX_SIZE,
+            statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+            max_inactive_connection_lifetime=300,
+            init=_init_connection,
+        )
+        logger.info(f"Database pool created ({settings.DB_POOL_MIN_SIZE}-{settings.DB_POOL_MAX_SIZE} connections)")
+    return _pool
+
+
+async def close_pool() -> None:
+    """Close the connection pool"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+        logger.info("Database pool closed")
+
+
+async def apply_migrations() -> None:
+    """
+    Apply the SQL files in migrations/ this database has not seen, in name order
+    init-db.sql creates the current schema for new databases and migrations
+    bring existing ones up to it, so each file must be safe on either; every
+    schema change to init-db.sql needs a matching file here
+    """
+    async with get_pool().acquire() as conn:
+        await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK)
+        try:
+            await conn.execute(CREATE_MIGRATIONS_TABLE)
+            applied = {row["version"] for row in await conn.fetch("SELECT version FROM schema_migrations")}
+            for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+                if path.stem in applied:
+                    continue
+                async with conn.transaction():
+                    await conn.execute(path.read_text())
+                    await conn.execute("INSERT INTO schema_migrations (version) VALUES ($1)", path.stem)
+                logger.info(f"Applied migration {path.name}")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK)
+
+
+def get_pool() -> asyncpg.Pool:
+    """Return the connection pool, failing if it has not been initialized"""
+    if _pool is None:
+        raise RuntimeError("Database pool is not initialized")
+    return _pool
+
+
+def get_executor(conn: Optional[asyncpg.Connection] = None) -> Executor:
+    """Use the given connection, or fall back to the pool"""
+    return conn if conn is not None else get_pool()
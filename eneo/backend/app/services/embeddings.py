@@ -0,0 +1,205 @@
+"""
+Embedding generation with sentence-transformers
+
+All callers in a process share one model instance. Requests are queued and a
+collector task merges them into micro-batches: a batch is dispatched once it
+reaches EMBEDDING_MAX_BATCH_SIZE texts or the oldest request has waited
+EMBEDDING_MAX_LATENCY_MS. While the model is busy, new requests keep queueing,
+so batch size grows with load and shrinks to single queries when idle.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+import asyncio
+import logging
+import time
+
+from app.config import settings
+from app.services.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _EmbeddingRequest:
+    texts: List[str]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class EmbeddingService:
+    """Loads the embedding model once and encodes text in micro-batches off the event loop"""
+
+    def __init__(self, model_name: str, max_batch_size: int, max_latency_ms: float):
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self._model = None
+        self._tokenizer = None
+        # One thread: the model parallelizes internally, concurrent encodes only contend
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._carry: Optional[_EmbeddingRequest] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def oldest_wait(self) -> float:
+        """Seconds the oldest request still waiting for a batch has been queued"""
+        if self._carry is not None:
+            oldest = self._carry
+        elif self._queue is not None and not self._queue.empty():
+            oldest = self._queue._queue[0]  # asyncio.Queue has no peek
+        else:
+            return 0.0
+        return time.monotonic() - oldest.enqueued_at
+
+    def _load(self) -> None:
+        from sentence_transformers import SentenceTransformer
+
+        logger.info(f"Loading embedding model: {self.model_name}")
+        self._model = SentenceTransformer(self.model_name)
+        dimension = self._model.get_sentence_embedding_dimension()
+        if dimension != settings.VECTOR_DIMENSION:
+            raise RuntimeError(
+                f"Embedding model dimension {dimension} does not match VECTOR_DIMENSION={settings.VECTOR_DIMENSION}"
+            )
+        # A separate copy for counting: the model's own tokenizer is reconfigured
+        # on every encode in the executor thread and must not be shared with
+        # the event loop
+        from transformers import AutoTokenizer
+
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name).backend_tokenizer
+
+    def _encode(self, texts: List[str]):
+        return self._model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+
+    def count_tokens(self, text: str) -> int:
+        """Model tokens in text, excluding the special tokens added around every input"""
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+    async def start(self) -> None:
+        """Load the model and start the batch collector"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._load)
+        self._queue = asyncio.Queue()
+        self._collector = asyncio.create_task(self._collect())
+        logger.info(
+            f"Embedding service ready (max batch {self.max_batch_size}, max latency {self.max_latency * 1000:.0f} ms)"
+        )
+
+    async def stop(self) -> None:
+        """Stop the collector and release the executor"""
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+        self._executor.shutdown(wait=False)
+
+    async def embed(self, texts: List[str]):
+        """Encode texts, returning one normalized vector per text"""
+        if self._queue is None:
+            raise RuntimeError("Embedding service is not started")
+        if not texts:
+            return []
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_EmbeddingRequest(texts=list(texts), future=future))
+        return await future
+
+    async def embed_query(self, text: str):
+        """Encode a single search query"""
+        return (await self.embed([text]))[0]
+
+    async def _next_batch(self) -> List[_EmbeddingRequest]:
+        """Collect requests until the batch is full or the oldest request hits its deadline"""
+        first = self._carry or await self._queue.get()
+        self._carry = None
+        batch = [first]
+        size = len(first.texts)
+        deadline = first.enqueued_at + self.max_latency
+
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if size + len(request.texts) > self.max_batch_size:
+                # Keep the overflow for the next batch rather than splitting a request
+                self._carry = request
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            pending = [request for request in batch if not request.future.done()]
+            if not pending:
+                continue
+            texts = [text for request in pending for text in request.texts]
+            try:
+                with stage_timer("embedding"):
+                    vectors = await loop.run_in_executor(self._executor, self._encode, texts)
+            except Exception as e:
+                logger.exception(f"Embedding batch of {len(texts)} texts failed")
+                for request in pending:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            offset = 0
+            for request in pending:
+                count = len(request.texts)
+                if not request.future.done():
+                    request.future.set_result(vectors[offset:offset + count])
+                offset += count
+
+
+_service: Optional[EmbeddingService] = None
+
+
+async def start_embedding_service() -> EmbeddingService:
+    """Create and start the process-wide embedding service"""
+    global _service
+    if _service is None:
+        _service = EmbeddingService(
+            settings.EMBEDDING_MODEL,
+            max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+            max_latency_ms=settings.EMBEDDING_MAX_LATENCY_MS,
+        )
+        await _service.start()
+    return _service
+
+
+async def stop_embedding_service() -> None:
+    """Stop the process-wide embedding service"""
+    global _service
+    if _service is not None:
+        await _service.stop()
+        _service = None
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Return the process-wide embedding service"""
+    if _service is None:
+        raise RuntimeError("Embedding service is not started")
+    return _service
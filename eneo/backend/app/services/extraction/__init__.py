@@ -0,0 +1,86 @@
+"""
+Text extraction from document files
+
+Plain-text formats are decoded straight from the download stream. Everything
+else is spooled to disk and handed to the extractor registered for its type
+(formats.py), which runs in a process pool with time and memory limits
+(pool.py).
+"""
+
+from typing import AsyncIterator, Optional
+import codecs
+import logging
+
+from app.config import settings
+from app.services.extraction.formats import EXTRACTORS
+from app.services.extraction.pool import ExtractionError, ExtractionPool  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# Formats that can be decoded directly from the download stream
+STREAMABLE_TYPES = {"txt", "md", "csv"}
+
+
+class UnsupportedFileType(Exception):
+    """Raised when no extractor exists for a file type"""
+
+
+def is_supported(file_type: str) -> bool:
+    """Check if text can be extracted from a file type"""
+    return file_type in STREAMABLE_TYPES or file_type in EXTRACTORS
+
+
+def is_streamable(file_type: str) -> bool:
+    """Check if a file type can be extracted without spooling to disk"""
+    return file_type in STREAMABLE_TYPES
+
+
+async def decode_stream(chunks: AsyncIterator[bytes], encoding: str = "utf-8") -> AsyncIterator[str]:
+    """Incrementally decode a byte stream, handling characters split across chunks"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+_pool: Optional[ExtractionPool] = None
+
+
+def start_extraction_pool() -> ExtractionPool:
+    """Start the extraction worker processes"""
+    global _pool
+    if _pool is None:
+        _pool = ExtractionPool(
+            workers=settings.EXTRACTION_WORKERS,
+            timeout=settings.EXTRACTION_TIMEOUT,
+            memory_limit=settings.EXTRACTION_MEMORY_LIMIT_MB * 1024 * 1024,
+            pages_per_task=settings.EXTRACTION_PAGES_PER_TASK,
+        )
+        logger.info(f"Extraction pool started with {settings.EXTRACTION_WORKERS} processes")
+    return _pool
+
+
+def stop_extraction_pool() -> None:
+    """Shut down the extraction worker processes"""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+async def extract_text(path: str, file_type: str) -> AsyncIterator[str]:
+    """
+    Yield the text of a file on disk in document order
+    Raises UnsupportedFileType, or ExtractionError when the file cannot be parsed
+    within the time and memory limits
+    """
+    if file_type not in EXTRACTORS:
+        raise UnsupportedFileType(f"Unsupported file type: {file_type}")
+    if _pool is None:
+        raise RuntimeError("Extraction pool is not started")
+    async for text in _pool.extract(path, file_type):
+        yield text
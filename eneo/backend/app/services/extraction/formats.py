@@ -0,0 +1,115 @@
+"""
+Extractor registry - one text extractor per file type
+
+Extractors run inside extraction worker processes. Each takes the path of a
+spooled file and yields text a page, slide, paragraph or row at a time.
+Paged formats also register a page counter, so a large document can be split
+into page ranges that are extracted in parallel.
+
+Parsing libraries are imported inside the extractors, so a missing optional
+dependency only disables its own format.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, Optional
+
+
+@dataclass
+class Extractor:
+    """How to extract text from one file type"""
+    extract: Callable[[str, Optional[range]], Iterator[str]]  # (path, pages or None for all)
+    page_count: Optional[Callable[[str], int]] = None  # set for formats split by page
+
+
+EXTRACTORS: Dict[str, Extractor] = {}
+
+
+def register(*file_types: str, page_count: Optional[Callable[[str], int]] = None):
+    """Register the decorated function as the extractor for file_types"""
+    def decorator(extract):
+        for file_type in file_types:
+            EXTRACTORS[file_type] = Extractor(extract, page_count)
+        return extract
+    return decorator
+
+
+def _pdf_page_count(path: str) -> int:
+    from PyPDF2 import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+@register("pdf", page_count=_pdf_page_count)
+def extract_pdf(path: str, pages: Optional[range]) -> Iterator[str]:
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    for number in pages if pages is not None else range(len(reader.pages)):
+        text = reader.pages[number].extract_text() or ""
+        if text.strip():
+            yield text + "\n\n"
+
+
+@register("docx")
+def extract_docx(path: str, pages: Optional[range]) -> Iterator[str]:
+    import docx
+
+    document = docx.Document(path)
+    for paragraph in document.paragraphs:
+        if paragraph.text.strip():
+            yield paragraph.text + "\n\n"
+    for table in document.tables:
+        for row in table.rows:
+            cells = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+            if cells:
+                yield " | ".join(cells) + "\n"
+        yield "\n"
+
+
+@register("pptx")
+def extract_pptx(path: str, pages: Optional[range]) -> Iterator[str]:
+    from pptx import Presentation
+
+    for slide in Presentation(path).slides:
+        texts = []
+        for shape in slide.shapes:
+            if shape.has_text_frame and shape.text_frame.text.strip():
+                texts.append(shape.text_frame.text)
+            elif getattr(shape, "has_table", False) and shape.has_table:
+                for row in shape.table.rows:
+                    cells = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+                    if cells:
+                        texts.append(" | ".join(cells))
+        if texts:
+            yield "\n".join(texts) + "\n\n"
+
+
+@register("xlsx", "xlsm")
+def extract_xlsx(path: str, pages: Optional[range]) -> Iterator[str]:
+    from openpyxl import load_workbook
+
+    # read_only streams rows from the XML instead of building every cell object
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield f"{sheet.title}\n"
+            for row in sheet.iter_rows(values_only=True):
+                cells = [str(value) for value in row if value is not None and str(value).strip()]
+                if cells:
+                    yield " | ".join(cells) + "\n"
+            yield "\n"
+    finally:
+        workbook.close()
+
+
+@register("html", "htm")
+def extract_html(path: str, pages: Optional[range]) -> Iterator[str]:
+    from bs4 import BeautifulSoup
+
+    with open(path, "rb") as handle:
+        soup = BeautifulSoup(handle, "html.parser")
+    for element in soup(["script", "style", "noscript"]):
+        element.decompose()
+    for line in soup.get_text("\n").splitlines():
+        if line.strip():
+            yield line.strip() + "\n"
@@ -0,0 +1,193 @@
+"""
+Process pool for text extraction
+
+Parsing PDFs and Office files is CPU-bound and some files are pathological,
+so extraction runs in separate processes rather than threads of the API or
+indexing worker:
+
+- each worker's address space is capped (RLIMIT_AS), so a runaway parse
+  fails with MemoryError instead of exhausting the host
+- each file gets EXTRACTION_TIMEOUT seconds of worker time; time spent
+  waiting for a free worker does not count. SIGALRM stops Python code in the
+  worker, and a worker that does not answer shortly after its limit (stuck in
+  C code) is killed on its own; the pool starts a replacement and the other
+  files being extracted carry on
+- paged formats are split into page ranges extracted in parallel, and their
+  text is yielded in page order as soon as the next range is ready
+"""
+
+from collections import deque
+from typing import AsyncIterator, Deque, List, Optional, Tuple
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+
+from app.services.extraction.formats import EXTRACTORS
+from app.services.extraction.worker import ExtractionTimeout, count_pages, extract_to_file, init_worker, run_task
+
+logger = logging.getLogger(__name__)
+
+# Extra time granted after a task's limit before a silent worker is killed
+KILL_GRACE = 5.0
+
+READ_SIZE = 64 * 1024
+
+
+class ExtractionError(Exception):
+    """Text could not be extracted; retryable when the file itself was not at fault"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class _FileClock:
+    """Worker time a file has used; tasks are charged when they finish"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.spent = 0.0
+
+    @property
+    def remaining(self) -> float:
+        return self.budget - self.spent
+
+
+class ExtractionPool:
+    """Runs extractors in worker processes with per-file time and memory limits"""
+
+    def __init__(self, workers: int, timeout: float, memory_limit: int, pages_per_task: int):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.pages_per_task = pages_per_task
+        # At most one task per worker is handed to the pool, so a submitted
+        # task starts at once and its kill timer measures only its own run
+        self._slots = asyncio.Semaphore(workers)
+        # spawn, not fork: a forked child would inherit the parent's memory
+        # (embedding model included) and fail its RLIMIT_AS straight away.
+        # multiprocessing.Pool rather than ProcessPoolExecutor: it replaces a
+        # killed worker without failing the tasks running in the others
+        self._pool = multiprocessing.get_context("spawn").Pool(
+            workers, initializer=init_worker, initargs=(memory_limit,)
+        )
+
+    def close(self) -> None:
+        self._pool.terminate()
+        self._pool.join()
+
+    def _kill(self, pid_path: str) -> None:
+        """Kill the worker running a task"""
+        try:
+            with open(pid_path) as pid_file:
+                pid = int(pid_file.read())
+        except (OSError, ValueError):
+            return
+        logger.warning(f"Killing extraction worker {pid} after it stopped responding")
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    async def _call(self, clock: _FileClock, func, *args):
+        await self._slots.acquire()
+        limit = clock.remaining
+        if limit <= 0:
+            self._slots.release()
+            raise ExtractionError("Extraction time limit exceeded")
+
+        loop = asyncio.get_running_loop()
+        fd, pid_path = tempfile.mkstemp(suffix=".pid")
+        os.close(fd)
+        # Resolved when the worker is free again, which may be after the
+        # caller has gone away; only then is the slot given back
+        result = loop.create_future()
+
+        def settle(setter, value) -> None:
+            if not result.done():
+                setter(value)
+
+        def finished(_) -> None:
+            self._slots.release()
+            os.unlink(pid_path)
+
+        result.add_done_callback(finished)
+        self._pool.apply_async(
+            run_task,
+            (pid_path, func, *args, limit),
+            callback=lambda value: loop.call_soon_threadsafe(settle, result.set_result, value),
+            error_callback=lambda error: loop.call_soon_threadsafe(settle, result.set_exception, error),
+        )
+
+        def kill_if_hung() -> None:
+            if not result.done():
+                self._kill(pid_path)
+                # A killed worker never reports back
+                result.cancel()
+
+        started = time.monotonic()
+        kill_timer = loop.call_later(limit + KILL_GRACE, kill_if_hung)
+        try:
+            return await asyncio.shield(result)
+        except asyncio.CancelledError:
+            if result.cancelled():
+                raise ExtractionError("Extraction time limit exceeded; worker killed")
+            # The caller went away; the worker finishes or is killed on the timer
+            raise
+        except ExtractionTimeout as e:
+            raise ExtractionError(str(e))
+        except MemoryError:
+            raise ExtractionError("Extraction memory limit exceeded")
+        finally:
+            if result.done():
+                kill_timer.cancel()
+            clock.spent += time.monotonic() - started
+
+    async def _parts(self, path: str, file_type: str, clock: _FileClock) -> List[Optional[range]]:
+        extractor = EXTRACTORS[file_type]
+        if extractor.page_count is None:
+            return [None]
+        pages = await self._call(clock, count_pages, path, file_type)
+        return [range(start, min(start + self.pages_per_task, pages)) for start in range(0, pages, self.pages_per_task)]
+
+    async def extract(self, path: str, file_type: str) -> AsyncIterator[str]:
+        """Yield the text of a spooled file, in document order"""
+        clock = _FileClock(self.timeout)
+        parts = deque(await self._parts(path, file_type, clock))
+        running: Deque[Tuple[str, asyncio.Future]] = deque()
+
+        def submit_next() -> None:
+            fd, output_path = tempfile.mkstemp(suffix=".txt")
+            os.close(fd)
+            task = asyncio.ensure_future(
+                self._call(clock, extract_to_file, path, file_type, parts.popleft(), output_path)
+            )
+            running.append((output_path, task))
+
+        try:
+            while parts or running:
+                # Keep up to one range per worker ahead of the consumer
+                while parts and len(running) < self.workers:
+                    submit_next()
+                output_path, task = running.popleft()
+                try:
+                    await task
+                    with open(output_path, encoding="utf-8") as output:
+                        while True:
+                            text = await asyncio.to_thread(output.read, READ_SIZE)
+                            if not text:
+                                break
+                            yield text
+                finally:
+                    os.unlink(output_path)
+        finally:
+            for output_path, task in running:
+                task.cancel()
+                try:
+                    os.unlink(output_path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,70 @@
+"""
+Code that runs inside extraction worker processes
+
+Kept free of application imports beyond the registry, so spawning a worker
+does not load the web stack or the embedding model.
+"""
+
+from typing import Optional
+import os
+import resource
+import signal
+
+from app.services.extraction.formats import EXTRACTORS
+
+
+class ExtractionTimeout(Exception):
+    """The per-file time limit expired inside a worker"""
+
+
+def _on_alarm(signum, frame):
+    raise ExtractionTimeout("Extraction time limit exceeded")
+
+
+def init_worker(memory_limit: int) -> None:
+    """Process initializer: cap the address space and arm the timeout handler"""
+    if memory_limit > 0:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+
+def _with_alarm(timeout: float, func, *args):
+    # SIGALRM interrupts pure-Python parsing loops; code stuck inside a C
+    # extension is handled by the parent killing the process
+    signal.setitimer(signal.ITIMER_REAL, max(timeout, 0.01))
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def run_task(pid_path: str, func, *args):
+    """
+    Run func after recording which process runs it, so the parent can kill
+    this worker alone if it hangs
+    """
+    with open(pid_path, "w") as pid_file:
+        pid_file.write(str(os.getpid()))
+    return func(*args)
+
+
+def count_pages(path: str, file_type: str, timeout: float) -> int:
+    """Number of pages in a paged document"""
+    return _with_alarm(timeout, EXTRACTORS[file_type].page_count, path)
+
+
+def _write_text(path: str, file_type: str, pages: Optional[range], output_path: str) -> int:
+    written = 0
+    with open(output_path, "w", encoding="utf-8") as output:
+        for text in EXTRACTORS[file_type].extract(path, pages):
+            output.write(text)
+            written += len(text)
+    return written
+
+
+def extract_to_file(path: str, file_type: str, pages: Optional[range], output_path: str, timeout: float) -> int:
+    """
+    Write the text of a file (or of a page range) to output_path
+    Text goes straight to disk, so neither process holds a whole document
+    """
+    return _with_alarm(timeout, _write_text, path, file_type, pages, output_path)
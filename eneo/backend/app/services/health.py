@@ -0,0 +1,202 @@
+"""
+Background health sampling
+
+Probes run on a timer in each API process instead of inside the health
+endpoints, so a probe never blocks the event loop or waits on a slow
+dependency; the endpoints only read the latest snapshot.
+
+- system: CPU (averaged over the sample interval, without sleeping), memory
+  and disk usage
+- database: SELECT 1 on a pooled connection
+- redis: PING
+- nextcloud: GET status.php through the shared HTTP client
+- embedding_model, chat_model: loaded in this process
+
+Each sample also refreshes the pool and queue gauges of /metrics.
+
+The process is ready when the database answers and both models are loaded.
+Redis and Nextcloud outages degrade the service but do not take it out of
+rotation, since another replica would be affected just the same.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional
+import asyncio
+import logging
+import time
+
+import psutil
+
+from app.config import settings
+from app.services import embeddings, llm
+from app.services.database import get_pool
+from app.services.http_client import get_http_client
+from app.services.metrics import record_pool_gauges
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+UNAVAILABLE = "unavailable"
+
+# Dependencies the process cannot serve requests without
+CRITICAL_CHECKS = ("database", "embedding_model", "chat_model")
+
+
+@dataclass
+class DependencyCheck:
+    """Result of probing one dependency"""
+    status: str
+    latency_ms: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class HealthSnapshot:
+    """The latest sample of system metrics and dependency checks"""
+    sampled_at: datetime
+    cpu_percent: float
+    memory_percent: float
+    disk_percent: float
+    checks: Dict[str, DependencyCheck] = field(default_factory=dict)
+    _monotonic: float = field(default_factory=time.monotonic, repr=False)
+
+    @property
+    def age(self) -> float:
+        """Seconds since the snapshot was taken"""
+        return time.monotonic() - self._monotonic
+
+    @property
+    def ready(self) -> bool:
+        return (
+            self.age < settings.HEALTH_SAMPLE_INTERVAL * 3
+            and all(self.checks[name].status == OK for name in CRITICAL_CHECKS)
+        )
+
+    @property
+    def status(self) -> str:
+        if not self.ready:
+            return "unhealthy"
+        if any(check.status != OK for check in self.checks.values()):
+            return "degraded"
+        return "healthy"
+
+
+async def _ping_database() -> None:
+    async with get_pool().acquire() as conn:
+        await conn.fetchval("SELECT 1")
+
+
+async def _ping_redis() -> None:
+    await get_redis().ping()
+
+
+async def _ping_nextcloud() -> None:
+    response = await get_http_client().get(f"{settings.NEXTCLOUD_URL}/status.php")
+    response.raise_for_status()
+    if response.json().get("maintenance"):
+        raise RuntimeError("Nextcloud is in maintenance mode")
+
+
+def _embedding_model_loaded() -> bool:
+    try:
+        return embeddings.get_embedding_service().loaded
+    except RuntimeError:
+        return False
+
+
+def _chat_model_loaded() -> bool:
+    try:
+        llm.get_backend()
+        return True
+    except RuntimeError:
+        return False
+
+
+async def _check(probe) -> DependencyCheck:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(probe(), settings.HEALTH_CHECK_TIMEOUT)
+    except asyncio.TimeoutError:
+        return DependencyCheck(UNAVAILABLE, settings.HEALTH_CHECK_TIMEOUT * 1000, "timed out")
+    except Exception as e:
+        return DependencyCheck(UNAVAILABLE, (time.perf_counter() - started) * 1000, str(e) or type(e).__name__)
+    return DependencyCheck(OK, (time.perf_counter() - started) * 1000)
+
+
+def _loaded(loaded: bool) -> DependencyCheck:
+    return DependencyCheck(OK) if loaded else DependencyCheck(UNAVAILABLE, error="not loaded")
+
+
+def _system_metrics():
+    # interval=None compares against the previous call, i.e. the last sample
+    return psutil.cpu_percent(interval=None), psutil.virtual_memory().percent, psutil.disk_usage("/").percent
+
+
+async def sample() -> HealthSnapshot:
+    """Probe everything once"""
+    database, redis, nextcloud = await asyncio.gather(
+        _check(_ping_database), _check(_ping_redis), _check(_ping_nextcloud)
+    )
+    cpu_percent, memory_percent, disk_percent = await asyncio.to_thread(_system_metrics)
+    record_pool_gauges()
+    return HealthSnapshot(
+        sampled_at=datetime.utcnow(),
+        cpu_percent=cpu_percent,
+        memory_percent=memory_percent,
+        disk_percent=disk_percent,
+        checks={
+            "database": database,
+            "redis": redis,
+            "nextcloud": nextcloud,
+            "embedding_model": _loaded(_embedding_model_loaded()),
+            "chat_model": _loaded(_chat_model_loaded()),
+        },
+    )
+
+
+_snapshot: Optional[HealthSnapshot] = None
+_sampler: Optional[asyncio.Task] = None
+
+
+async def _sample_loop() -> None:
+    global _snapshot
+    while True:
+        await asyncio.sleep(settings.HEALTH_SAMPLE_INTERVAL)
+        try:
+            snapshot = await sample()
+        except Exception:
+            logger.exception("Health sampling failed")
+            continue
+        if _snapshot is not None and snapshot.status != _snapshot.status:
+            logger.warning(f"Health changed from {_snapshot.status} to {snapshot.status}")
+        _snapshot = snapshot
+
+
+async def start_health_sampler() -> None:
+    """Take a first sample and keep sampling in the background"""
+    global _snapshot, _sampler
+    if _sampler is None:
+        psutil.cpu_percent(interval=None)
+        _snapshot = await sample()
+        _sampler = asyncio.create_task(_sample_loop())
+        logger.info(f"Health sampler started ({_snapshot.status})")
+
+
+async def stop_health_sampler() -> None:
+    """Stop background sampling"""
+    global _snapshot, _sampler
+    if _sampler is not None:
+        _sampler.cancel()
+        try:
+            await _sampler
+        except asyncio.CancelledError:
+            pass
+        _sampler = None
+        _snapshot = None
+
+
+def get_snapshot() -> Optional[HealthSnapshot]:
+    """The latest health sample, or None before the first one"""
+    return _snapshot
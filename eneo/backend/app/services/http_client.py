@@ -0,0 +1,277 @@
+"""
+Shared HTTP client for Nextcloud, OAuth2 and other upstream services
+
+One pooled httpx client per process, created in the lifespan, so logins,
+token refreshes and WebDAV calls reuse warm HTTP/2 and keep-alive connections
+instead of paying a TCP and TLS handshake per request. On top of the pool:
+
+- per-host concurrency limits, so one slow host cannot take every connection;
+  file downloads relayed to browsers have their own limit, so slow clients
+  cannot hold the slots that logins, listings and indexing need
+- retries with jittered backoff for idempotent requests on connection errors
+  and 502/503/504
+- a per-host circuit breaker: after repeated failures, calls fail fast for a
+  cool-down period instead of piling up on a degraded Nextcloud
+
+Per-host request, retry and failure counts, slot usage and circuit states are
+exported on /metrics (eneo_http_upstream_*, eneo_http_circuit_state).
+"""
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+from app.config import settings
+from app.services.metrics import (
+    HTTP_UPSTREAM_ACTIVE,
+    HTTP_UPSTREAM_FAILURES,
+    HTTP_UPSTREAM_REJECTED,
+    HTTP_UPSTREAM_REQUESTS,
+    HTTP_UPSTREAM_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PROPFIND", "PUT", "DELETE", "REPORT"}
+RETRY_STATUSES = {502, 503, 504}
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout, httpx.RemoteProtocolError)
+
+# Concurrency lanes per host
+DEFAULT_LANE = "default"
+DOWNLOAD_LANE = "download"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised without sending the request while a host's circuit is open"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after  # seconds until the breaker lets a trial request through
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, lets one trial request through after reset_timeout"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_started: Optional[float] = None
+
+    def before_request(self, host: str) -> None:
+        if self.state == OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(f"Circuit open for {host}", remaining)
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            # A trial that never reported back (e.g. cancelled) expires after reset_timeout
+            now = time.monotonic()
+            if self._trial_started is not None and now - self._trial_started < self.reset_timeout:
+                raise CircuitOpenError(
+                    f"Circuit half-open for {host}, trial request in flight",
+                    self._trial_started + self.reset_timeout - now,
+                )
+            self._trial_started = now
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self._trial_started = None
+
+    def record_failure(self, host: str) -> None:
+        self.failures += 1
+        self._trial_started = None
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"Opening circuit for {host} after {self.failures} failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+
+class HTTPClient:
+    """Pooled httpx client with per-host limits, retries and circuit breaking"""
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+        )
+        self._limits: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    def _host(self, url) -> str:
+        return httpx.URL(url).netloc.decode()
+
+    def _host_state(self, host: str, lane: str = DEFAULT_LANE):
+        if host not in self._breakers:
+            self._limits[host, DEFAULT_LANE] = asyncio.Semaphore(settings.HTTP_MAX_CONNECTIONS_PER_HOST)
+            self._limits[host, DOWNLOAD_LANE] = asyncio.Semaphore(settings.HTTP_MAX_DOWNLOADS_PER_HOST)
+            self._breakers[host] = CircuitBreaker(
+                settings.HTTP_CIRCUIT_FAILURE_THRESHOLD,
+                settings.HTTP_CIRCUIT_RESET_TIMEOUT,
+            )
+        return self._limits[host, lane], self._breakers[host]
+
+    def _retry_delay(self, attempt: int) -> float:
+        return random.uniform(0, settings.HTTP_RETRY_BASE_DELAY * 2 ** attempt)
+
+    @asynccontextmanager
+    async def _slot(self, host: str, lane: str = DEFAULT_LANE):
+        limit, _ = self._host_state(host, lane)
+        waiting = HTTP_UPSTREAM_ACTIVE.labels(host, lane, "waiting")
+        in_flight = HTTP_UPSTREAM_ACTIVE.labels(host, lane, "in_flight")
+        waiting.inc()
+        try:
+            await limit.acquire()
+        finally:
+            waiting.dec()
+        in_flight.inc()
+        try:
+            yield
+        finally:
+            in_flight.dec()
+            limit.release()
+
+    async def _send(self, method: str, url, idempotent: Optional[bool], stream: bool, **kwargs) -> httpx.Response:
+        host = self._host(url)
+        _, breaker = self._host_state(host)
+        retryable = method.upper() in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        attempts = settings.HTTP_RETRIES + 1 if retryable else 1
+
+        for attempt in range(attempts):
+            try:
+                breaker.before_request(host)
+            except CircuitOpenError:
+                HTTP_UPSTREAM_REJECTED.labels(host).inc()
+                raise
+            HTTP_UPSTREAM_REQUESTS.labels(host).inc()
+            try:
+                request = self.client.build_request(method, url, **kwargs)
+                response = await self.client.send(request, stream=stream)
+            except RETRY_EXCEPTIONS:
+                breaker.record_failure(host)
+                HTTP_UPSTREAM_FAILURES.labels(host).inc()
+                if attempt + 1 >= attempts:
+                    raise
+            except httpx.TransportError:
+                breaker.record_failure(host)
+                HTTP_UPSTREAM_FAILURES.labels(host).inc()
+                raise
+            else:
+                if response.status_code < 500:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure(host)
+                HTTP_UPSTREAM_FAILURES.labels(host).inc()
+                if response.status_code not in RETRY_STATUSES or attempt + 1 >= attempts:
+                    return response
+                await response.aclose()
+
+            HTTP_UPSTREAM_RETRIES.labels(host).inc()
+            await asyncio.sleep(self._retry_delay(attempt))
+
+    async def request(self, method: str, url, idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """
+        Send a request and read the response body
+        idempotent overrides the method-based retry decision, e.g. False for a
+        PUT that must not be repeated
+        """
+        async with self._slot(self._host(url)):
+            response = await self._send(method, url, idempotent, stream=False, **kwargs)
+        return response
+
+    async def get(self, url, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        url,
+        idempotent: Optional[bool] = None,
+        lane: str = DEFAULT_LANE,
+        **kwargs,
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        Send a request and stream the response body
+        Retries only cover getting the response headers; the per-host slot is
+        held until the body is consumed or the context exits. Bodies relayed to
+        clients at their pace go in DOWNLOAD_LANE, which has its own limit.
+        """
+        async with self._slot(self._host(url), lane):
+            response = await self._send(method, url, idempotent, stream=True, **kwargs)
+            try:
+                yield response
+            finally:
+                await response.aclose()
+
+    def _pool_usage(self) -> Optional[dict]:
+        """Open and idle connections, or None if httpx/httpcore no longer expose their private pool"""
+        try:
+            connections = self.client._transport._pool.connections
+            return {
+                "connections": len(connections),
+                "idle": sum(1 for connection in connections if connection.is_idle()),
+            }
+        except AttributeError:
+            return None
+
+    def metrics(self) -> dict:
+        """Pool usage and circuit breaker states, sampled into gauges by record_pool_gauges"""
+        return {
+            "pool": self._pool_usage(),
+            "circuits": {host: breaker.state for host, breaker in self._breakers.items()},
+        }
+
+
+_client: Optional[HTTPClient] = None
+
+
+async def init_http_client() -> HTTPClient:
+    """Create the process-wide HTTP client"""
+    global _client
+    if _client is None:
+        _client = HTTPClient()
+        logger.info(
+            f"HTTP client ready ({settings.HTTP_MAX_CONNECTIONS} connections, "
+            f"{settings.HTTP_MAX_CONNECTIONS_PER_HOST} per host)"
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the HTTP client and its connections"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def get_http_client() -> HTTPClient:
+    """Return the process-wide HTTP client"""
+    if _client is None:
+        raise RuntimeError("HTTP client is not initialized")
+    return _client
@@ -0,0 +1,274 @@
+"""
+Streaming document ingestion pipeline
+
+WebDAV download -> text extraction -> chunking -> batched embedding -> embeddings table.
+Each stage hands small pieces to the next, so worker memory stays bounded by the
+download chunk size and the embedding batch size rather than by the file size.
+
+Re-indexing is incremental. The Nextcloud ETag and mtime are checked before
+downloading, and an unchanged file is a no-op. For changed files every chunk is
+keyed by a hash of the model name and its text: chunks already stored, in this
+document or any other, reuse that embedding, and only genuinely new text is
+sent to the embedding model.
+
+A run writes its chunks as rows tagged with its run id, which search ignores,
+and swaps them for the document's live chunks in one transaction at the end.
+Until then the previous version stays searchable, and a failed run only
+deletes its own rows.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+import hashlib
+import logging
+import os
+import tempfile
+import uuid
+
+from app.config import settings
+from app.repositories import documents as documents_repo
+from app.repositories import embeddings as embeddings_repo
+from app.services.database import get_pool
+from app.services.embeddings import get_embedding_service
+from app.services.extraction import (
+    UnsupportedFileType,
+    decode_stream,
+    extract_text,
+    is_streamable,
+    is_supported,
+)
+from app.services.metrics import StageClock, timed_iter
+from app.services.search_cache import bump_index_version
+from app.services.sessions import UserSession
+from app.services.tokens import get_access_token
+from app.services.webdav import FileInfo, stat_file, stream_file
+from app.utils.chunking import TextChunker
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IndexResult:
+    """Outcome of indexing a single file"""
+    document_id: int
+    chunks: int
+    file_size: int
+    unchanged: bool = False
+    embedded: int = 0  # chunks sent to the embedding model
+    reused: int = 0  # chunks whose embedding was copied from a stored chunk
+
+
+def file_type_for(file_path: str) -> str:
+    """Derive the file type from the file extension"""
+    return os.path.splitext(file_path)[1].lstrip(".").lower()
+
+
+def chunk_hash(text: str) -> str:
+    """Key a chunk by model and text, so a model change never reuses stale vectors"""
+    return hashlib.sha256(f"{settings.EMBEDDING_MODEL}\0{text}".encode("utf-8")).hexdigest()
+
+
+class _HashingStream:
+    """Wraps a byte stream, counting and hashing the bytes passing through"""
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks
+        self._digest = hashlib.sha256()
+        self.total = 0
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        async for chunk in self._chunks:
+            self.total += len(chunk)
+            self._digest.update(chunk)
+            yield chunk
+
+    @property
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+async def _spool_to_disk(chunks: AsyncIterator[bytes], suffix: str) -> str:
+    """Write a byte stream to a temporary file and return its path"""
+    handle = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        async for chunk in chunks:
+            handle.write(chunk)
+    except BaseException:
+        handle.close()
+        os.unlink(handle.name)
+        raise
+    handle.close()
+    return handle.name
+
+
+class _ChunkWriter:
+    """
+    Writes produced chunks as rows staged under the run id, which search does
+    not see until the run is swapped in. Embeddings already stored for the
+    same chunk hash, in this document or any other, are copied; only new text
+    is sent to the embedding model
+    """
+
+    def __init__(self, document_id: int, user_id: int, run_id: str, reuse: bool):
+        self.document_id = document_id
+        self.user_id = user_id
+        self.run_id = run_id
+        self.reuse = reuse
+        self.count = 0
+        self.embedded = 0
+        self.reused = 0
+        self._batch: List[tuple] = []
+
+    async def add(self, text: str) -> None:
+        self._batch.append((self.count, text, chunk_hash(text)))
+        self.count += 1
+        if len(self._batch) >= settings.EMBEDDING_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._batch:
+            return
+
+        batch, self._batch = self._batch, []
+        vectors = {}
+        if self.reuse:
+            rows = await embeddings_repo.find_by_hashes(list({key for _, _, key in batch}))
+            vectors = {row["chunk_hash"]: row["embedding"] for row in rows}
+
+        missing = list(dict.fromkeys(key for _, _, key in batch if key not in vectors))
+        if missing:
+            texts = {key: text for _, text, key in batch}
+            computed = await get_embedding_service().embed([texts[key] for key in missing])
+            vectors.update(zip(missing, computed))
+            self.embedded += len(missing)
+        self.reused += len(batch) - len(missing)
+
+        await embeddings_repo.insert_staged_chunks(
+            self.run_id,
+            [(self.document_id, self.user_id, index, text, key, vectors[key]) for index, text, key in batch],
+        )
+
+
+@dataclass
+class _DocumentState:
+    id: int
+    etag: Optional[str]
+    mtime: Optional[datetime]
+    content_hash: Optional[str]
+    indexed: bool
+    chunks: int = 0
+    file_size: int = 0
+
+
+async def _load_document(session: UserSession, file_path: str, file_type: str, info: FileInfo) -> _DocumentState:
+    """Fetch or create the document row"""
+    row = await documents_repo.upsert_for_indexing(
+        session.user_id,
+        file_path,
+        info.file_id,
+        os.path.basename(file_path),
+        file_type,
+    )
+    return _DocumentState(
+        id=row["id"],
+        etag=row["nextcloud_etag"],
+        mtime=row["nextcloud_mtime"],
+        content_hash=row["content_hash"],
+        indexed=row["indexed_at"] is not None,
+        chunks=row["chunks"],
+        file_size=row["file_size"] or 0,
+    )
+
+
+async def index_file(session: UserSession, file_path: str, force: bool = False) -> IndexResult:
+    """
+    Stream a Nextcloud file through the indexing pipeline
+    Embeddings are written batch by batch as chunks are produced
+    With force, the ETag check and all embedding reuse are skipped
+    """
+    file_type = file_type_for(file_path)
+    if not is_supported(file_type):
+        raise UnsupportedFileType(f"Unsupported file type: {file_type or 'unknown'}")
+
+    access_token = await get_access_token(session)
+    info = await stat_file(file_path, access_token)
+    document = await _load_document(session, file_path, file_type, info)
+
+    if (
+        not force
+        and document.indexed
+        and info.etag is not None
+        and info.etag == document.etag
+        and info.modified == document.mtime
+    ):
+        logger.info(f"Skipping {file_path}: ETag unchanged")
+        return IndexResult(document_id=document.id, chunks=document.chunks, file_size=document.file_size, unchanged=True)
+
+    download = _HashingStream(timed_iter("webdav_fetch", stream_file(file_path, await get_access_token(session))))
+    chunker = TextChunker(
+        settings.CHUNK_MAX_TOKENS,
+        settings.CHUNK_OVERLAP_TOKENS,
+        count_tokens=get_embedding_service().count_tokens,
+    )
+    run_id = uuid.uuid4().hex
+    writer = _ChunkWriter(document.id, session.user_id, run_id, reuse=not force)
+    spooled_path = None
+
+    try:
+        if is_streamable(file_type):
+            texts = decode_stream(download.stream())
+        else:
+            spooled_path = await _spool_to_disk(download.stream(), f".{file_type}")
+            texts = timed_iter("extraction", extract_text(spooled_path, file_type))
+
+        # Chunking alternates with extraction and embedding, so its time is summed
+        chunking = StageClock("chunking")
+        async for text in texts:
+            with chunking.measure():
+                chunks = list(chunker.feed(text))
+            for chunk in chunks:
+                await writer.add(chunk)
+        with chunking.measure():
+            chunks = list(chunker.flush())
+        for chunk in chunks:
+            await writer.add(chunk)
+        chunking.observe()
+        await writer.flush()
+    except Exception:
+        # Only this run's staged rows; the live chunks were never touched
+        await embeddings_repo.delete_run(run_id)
+        raise
+    finally:
+        if spooled_path:
+            os.unlink(spooled_path)
+
+    async with get_pool().acquire() as conn:
+        async with conn.transaction():
+            # Updating the document row first locks it, so concurrent runs on
+            # the same document swap in one after the other
+            await documents_repo.mark_indexed(
+                document.id,
+                download.total,
+                download.hexdigest,
+                info.etag,
+                info.modified,
+                file_type,
+                writer.count,
+                conn=conn,
+            )
+            await embeddings_repo.swap_in_run(document.id, run_id, settings.INDEX_TASK_LEASE, conn=conn)
+    await bump_index_version(session.user_id)
+
+    logger.info(
+        f"Indexed {file_path}: {writer.count} chunks ({writer.embedded} embedded, "
+        f"{writer.reused} reused), {download.total} bytes"
+    )
+    return IndexResult(
+        document_id=document.id,
+        chunks=writer.count,
+        file_size=download.total,
+        unchanged=download.hexdigest == document.content_hash,
+        embedded=writer.embedded,
+        reused=writer.reused,
+    )
@@ -0,0 +1,304 @@
+"""
+Persistent job queue for batch indexing
+
+Jobs and their per-file tasks live in Postgres (index_jobs / index_tasks).
+Workers claim tasks with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+worker processes can share the queue without double-processing a file.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+import logging
+import random
+
+from app.config import settings
+from app.services.database import get_pool
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class IndexTask:
+    """A single file to index, claimed by a worker"""
+    id: int
+    job_id: int
+    user_id: int
+    file_path: str
+    attempts: int
+
+
+async def create_job(user_id: int, file_paths: List[str]) -> int:
+    """Persist a job with one pending task per file path"""
+    pool = get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            job_id = await conn.fetchval(
+                "INSERT INTO index_jobs (user_id) VALUES ($1) RETURNING id",
+                user_id,
+            )
+            await conn.copy_records_to_table(
+                "index_tasks",
+                records=[(job_id, user_id, path) for path in dict.fromkeys(file_paths)],
+                columns=["job_id", "user_id", "file_path"],
+            )
+    logger.info(f"Created index job {job_id} with {len(file_paths)} files")
+    return job_id
+
+
+async def outstanding_paths(user_id: int, files: Dict[str, Optional[datetime]]) -> Set[str]:
+    """
+    Paths among files (path -> last modified) that need no new task: one is
+    pending or running, or one failed permanently after the file last changed
+    """
+    if not files:
+        return set()
+    rows = await get_pool().fetch(
+        """
+        SELECT DISTINCT t.file_path
+        FROM index_tasks t
+        JOIN unnest($2::text[], $3::timestamp[]) AS f(path, modified) ON t.file_path = f.path
+        WHERE t.user_id = $1
+          AND (
+              t.status IN ('pending', 'running')
+              OR (t.status = 'failed' AND t.finished_at >= coalesce(f.modified, '-infinity'))
+          )
+        """,
+        user_id,
+        list(files),
+        list(files.values()),
+    )
+    return {row["file_path"] for row in rows}
+
+
+async def get_job(job_id: int, user_id: int) -> Optional[Dict]:
+    """Return progress for a job owned by the user, or None if not found"""
+    pool = get_pool()
+    job = await pool.fetchrow(
+        "SELECT id, created_at FROM index_jobs WHERE id = $1 AND user_id = $2",
+        job_id,
+        user_id,
+    )
+    if job is None:
+        return None
+
+    rows = await pool.fetch(
+        "SELECT status, count(*) AS count FROM index_tasks WHERE job_id = $1 GROUP BY status",
+        job_id,
+    )
+    counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+    counts.update({row["status"]: row["count"] for row in rows})
+    total = sum(counts.values())
+    finished = counts[DONE] + counts[FAILED]
+
+    failures = await pool.fetch(
+        """
+        SELECT file_path, last_error FROM index_tasks
+        WHERE job_id = $1 AND status = 'failed'
+        ORDER BY id
+        LIMIT 100
+        """,
+        job_id,
+    )
+
+    return {
+        "job_id": str(job["id"]),
+        "status": "completed" if finished == total else ("running" if finished or counts[RUNNING] else "queued"),
+        "created_at": job["created_at"],
+        "total": total,
+        "pending": counts[PENDING],
+        "running": counts[RUNNING],
+        "done": counts[DONE],
+        "failed": counts[FAILED],
+        "errors": [{"file_path": row["file_path"], "error": row["last_error"]} for row in failures],
+    }
+
+
+async def list_jobs(user_id: int, limit: int = 50) -> List[Dict]:
+    """List recent jobs for a user with aggregated task counts"""
+    rows = await get_pool().fetch(
+        """
+        SELECT j.id, j.created_at,
+               count(t.id) AS total,
+               count(t.id) FILTER (WHERE t.status = 'done') AS done,
+               count(t.id) FILTER (WHERE t.status = 'failed') AS failed
+        FROM index_jobs j
+        LEFT JOIN index_tasks t ON t.job_id = j.id
+        WHERE j.user_id = $1
+        GROUP BY j.id
+        ORDER BY j.id DESC
+        LIMIT $2
+        """,
+        user_id,
+        limit,
+    )
+    return [
+        {
+            "job_id": str(row["id"]),
+            "created_at": row["created_at"],
+            "total": row["total"],
+            "done": row["done"],
+            "failed": row["failed"],
+            "completed": row["done"] + row["failed"] == row["total"],
+        }
+        for row in rows
+    ]
+
+
+async def claim_task() -> Optional[IndexTask]:
+    """
+    Claim the next runnable task
+    Users already at INDEX_MAX_TASKS_PER_USER running tasks are skipped, so one
+    large batch cannot occupy every worker slot
+    """
+    pool = get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            candidate = await conn.fetchrow(
+                """
+                SELECT t.id, t.user_id FROM index_tasks t
+                WHERE t.status = 'pending'
+                  AND t.next_attempt_at <= CURRENT_TIMESTAMP
+                  AND (
+                      SELECT count(*) FROM index_tasks r
+                      WHERE r.user_id = t.user_id AND r.status = 'running'
+                  ) < $1
+                ORDER BY t.next_attempt_at, t.id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+                """,
+                settings.INDEX_MAX_TASKS_PER_USER,
+            )
+            if candidate is None:
+                return None
+
+            # Serialize claims per user so concurrent workers cannot overshoot the limit
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", candidate["user_id"])
+            running = await conn.fetchval(
+                "SELECT count(*) FROM index_tasks WHERE user_id = $1 AND status = 'running'",
+                candidate["user_id"],
+            )
+            if running >= settings.INDEX_MAX_TASKS_PER_USER:
+                return None
+
+            row = await conn.fetchrow(
+                """
+                UPDATE index_tasks
+                SET status = 'running',
+                    attempts = attempts + 1,
+                    started_at = CURRENT_TIMESTAMP,
+                    locked_until = CURRENT_TIMESTAMP + make_interval(secs => $2)
+                WHERE id = $1
+                RETURNING id, job_id, user_id, file_path, attempts
+                """,
+                candidate["id"],
+                float(settings.INDEX_TASK_LEASE),
+            )
+    return IndexTask(**dict(row))
+
+
+async def complete_task(task: IndexTask, document_id: int, chunks: int) -> None:
+    """Mark a task as successfully indexed"""
+    await get_pool().execute(
+        """
+        UPDATE index_tasks
+        SET status = 'done', document_id = $2, chunks = $3,
+            last_error = NULL, locked_until = NULL, finished_at = CURRENT_TIMESTAMP
+        WHERE id = $1
+        """,
+        task.id,
+        document_id,
+        chunks,
+    )
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, so failing tasks do not retry in lockstep"""
+    ceiling = min(settings.INDEX_RETRY_BASE_DELAY * 2 ** (attempts - 1), settings.INDEX_RETRY_MAX_DELAY)
+    return random.uniform(ceiling / 2, ceiling)
+
+
+async def fail_task(task: IndexTask, error: str, retryable: bool = True) -> None:
+    """Record a failure, rescheduling the task with backoff while attempts remain"""
+    if retryable and task.attempts < settings.INDEX_MAX_ATTEMPTS:
+        delay = retry_delay(task.attempts)
+        await get_pool().execute(
+            """
+            UPDATE index_tasks
+            SET status = 'pending', last_error = $2, locked_until = NULL,
+                next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => $3)
+            WHERE id = $1
+            """,
+            task.id,
+            error,
+            delay,
+        )
+        logger.warning(f"Task {task.id} failed (attempt {task.attempts}), retrying in {delay:.0f}s: {error}")
+    else:
+        await get_pool().execute(
+            """
+            UPDATE index_tasks
+            SET status = 'failed', last_error = $2, locked_until = NULL, finished_at = CURRENT_TIMESTAMP
+            WHERE id = $1
+            """,
+            task.id,
+            error,
+        )
+        logger.error(f"Task {task.id} failed permanently: {error}")
+
+
+async def extend_lease(task: IndexTask) -> None:
+    """Push back the lease of a task that is still being worked on"""
+    await get_pool().execute(
+        """
+        UPDATE index_tasks
+        SET locked_until = CURRENT_TIMESTAMP + make_interval(secs => $2)
+        WHERE id = $1 AND status = 'running'
+        """,
+        task.id,
+        float(settings.INDEX_TASK_LEASE),
+    )
+
+
+async def requeue_abandoned_tasks() -> int:
+    """
+    Return tasks whose lease expired (crashed worker) to the queue
+    Tasks that have used up their attempts are failed instead, so a file that
+    crashes the worker cannot loop forever
+    """
+    result = await get_pool().execute(
+        """
+        UPDATE index_tasks
+        SET status = CASE WHEN attempts >= $1 THEN 'failed' ELSE 'pending' END,
+            last_error = COALESCE(last_error, 'Worker lease expired'),
+            finished_at = CASE WHEN attempts >= $1 THEN CURRENT_TIMESTAMP END,
+            locked_until = NULL,
+            next_attempt_at = CURRENT_TIMESTAMP
+        WHERE status = 'running' AND locked_until < CURRENT_TIMESTAMP
+        """,
+        settings.INDEX_MAX_ATTEMPTS,
+    )
+    count = int(result.split()[-1])
+    if count:
+        logger.warning(f"Requeued {count} abandoned index tasks")
+    return count
+
+
+async def queue_depth() -> Dict[str, int]:
+    """Tasks that are ready to run, waiting for a retry, and running"""
+    row = await get_pool().fetchrow(
+        """
+        SELECT
+            count(*) FILTER (WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP) AS ready,
+            count(*) FILTER (WHERE status = 'pending' AND next_attempt_at > CURRENT_TIMESTAMP) AS delayed,
+            count(*) FILTER (WHERE status = 'running') AS running
+        FROM index_tasks
+        WHERE status IN ('pending', 'running')
+        """
+    )
+    return dict(row)
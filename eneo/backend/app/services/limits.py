@@ -0,0 +1,109 @@
+"""
+Per-user rate limits and load shedding for expensive endpoints
+
+Rate limits are token buckets in Redis, shared by all API processes, with a
+separate budget per kind of work: chat generations, search queries and files
+submitted for indexing (a batch costs one token per file). A bucket holds up
+to its burst size and refills continuously; the update runs as one Lua script
+on Redis time, so concurrent workers and clock skew cannot overspend it.
+When Redis is unavailable, requests are let through.
+
+Admission control is global and per process: when the oldest request waiting
+for the chat model or the embedding model has waited longer than its latency
+target, new work is refused with 429 and Retry-After rather than queued behind
+it.
+"""
+
+from dataclasses import dataclass
+import logging
+import math
+
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.services.embeddings import get_embedding_service
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY_PREFIX = "eneo:ratelimit:"
+
+# Returns {allowed, seconds until the cost is affordable}
+TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+
+@dataclass(frozen=True)
+class Budget:
+    """A token bucket configuration"""
+    name: str
+    unit: str  # what a token stands for, for error messages
+    burst: int
+    per_second: float
+
+
+CHAT = Budget("chat", "chat messages", settings.RATE_LIMIT_CHAT_BURST, settings.RATE_LIMIT_CHAT_PER_MINUTE / 60)
+SEARCH = Budget("search", "searches", settings.RATE_LIMIT_SEARCH_BURST, settings.RATE_LIMIT_SEARCH_PER_MINUTE / 60)
+INDEX_FILES = Budget(
+    "index", "files to index", settings.RATE_LIMIT_INDEX_FILES_BURST, settings.RATE_LIMIT_INDEX_FILES_PER_HOUR / 3600
+)
+
+_script = None
+
+
+def _too_many(detail: str, wait: float) -> HTTPException:
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(max(math.ceil(wait), 1))})
+
+
+async def consume(user_id: int, budget: Budget, cost: int = 1) -> None:
+    """
+    Take cost tokens from the user's bucket
+    Raises 429 with Retry-After when the bucket is short, 413 when cost exceeds the burst size
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    if cost > budget.burst:
+        raise HTTPException(status_code=413, detail=f"At most {budget.burst} {budget.unit} per request")
+
+    global _script
+    try:
+        redis = get_redis()
+        if _script is None or _script.registered_client is not redis:
+            _script = redis.register_script(TOKEN_BUCKET)
+        allowed, wait = await _script(
+            keys=[f"{BUCKET_KEY_PREFIX}{budget.name}:{user_id}"],
+            args=[budget.burst, budget.per_second, cost],
+        )
+    except RedisError as e:
+        logger.warning(f"Rate limit check failed, allowing request: {e}")
+        return
+    if not int(allowed):
+        raise _too_many(f"Too many {budget.unit}, try again later", float(wait))
+
+
+def check_embedding_load() -> None:
+    """Refuse new work while the embedding queue is over its latency target"""
+    wait = get_embedding_service().oldest_wait
+    if wait > settings.ADMISSION_EMBEDDING_WAIT_SLO:
+        raise _too_many("Embedding model is overloaded", wait)
@@ -0,0 +1,154 @@
+"""
+Cached Nextcloud folder listings
+
+Listings are cached in Redis per user and folder. Nextcloud changes a folder's
+ETag whenever anything below it changes, so a cached listing is revalidated
+with a cheap Depth: 0 PROPFIND rather than re-listed:
+
+- within LISTING_FRESH_SECONDS of the last check, the cache is served as is
+- if the folder ETag is unchanged, the cache is still valid
+- if it changed and a sync token is known, a sync-collection REPORT returns
+  only the members that changed, which are patched into the cached listing
+- otherwise (first visit, token expired, server without sync support) the
+  folder is re-listed with a streamed Depth: 1 PROPFIND
+
+Only the folder being viewed is fetched; subfolders are listed when opened,
+so an unchanged subtree is never walked. Depth: infinity is never used.
+"""
+
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.services.redis_client import get_redis
+from app.services.sessions import UserSession
+from app.services.tokens import get_access_token
+from app.services.webdav import (
+    DirEntry,
+    SyncNotSupported,
+    iter_directory,
+    normalize_folder,
+    stat_file,
+    sync_collection,
+)
+
+logger = logging.getLogger(__name__)
+
+LISTING_KEY_PREFIX = "eneo:listing:"
+
+
+@dataclass
+class Listing:
+    """A folder's direct members, sorted folders first"""
+    path: str
+    etag: Optional[str]
+    sync_token: Optional[str]
+    entries: List[dict] = field(default_factory=list)
+    validated_at: float = 0.0
+
+
+def _entry_dict(entry: DirEntry) -> dict:
+    data = asdict(entry)
+    del data["sync_token"], data["deleted"]
+    if data["modified"] is not None:
+        data["modified"] = data["modified"].isoformat()
+    return data
+
+
+def _sort(entries: List[dict]) -> List[dict]:
+    return sorted(entries, key=lambda entry: (not entry["is_dir"], entry["name"].casefold()))
+
+
+def _key(user_id: int, path: str) -> str:
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()
+    return f"{LISTING_KEY_PREFIX}{user_id}:{digest}"
+
+
+async def _load(user_id: int, path: str) -> Optional[Listing]:
+    try:
+        value = await get_redis().get(_key(user_id, path))
+    except RedisError as e:
+        logger.warning(f"Listing cache unavailable: {e}")
+        return None
+    return Listing(**json.loads(value)) if value else None
+
+
+async def _save(user_id: int, listing: Listing) -> None:
+    try:
+        await get_redis().set(_key(user_id, listing.path), json.dumps(asdict(listing)), ex=settings.CACHE_TTL)
+    except RedisError as e:
+        logger.warning(f"Could not cache listing for {listing.path}: {e}")
+
+
+async def _full_listing(path: str, access_token: str) -> Listing:
+    listing = Listing(path=path, etag=None, sync_token=None)
+    async for entry in iter_directory(path, access_token):
+        if entry.path == path:
+            listing.etag = entry.etag
+            listing.sync_token = entry.sync_token
+        else:
+            listing.entries.append(_entry_dict(entry))
+    listing.entries = _sort(listing.entries)
+    return listing
+
+
+async def _apply_changes(listing: Listing, path: str, access_token: str) -> Listing:
+    changes, sync_token = await sync_collection(path, access_token, listing.sync_token)
+    entries: Dict[str, dict] = {entry["path"]: entry for entry in listing.entries}
+    for change in changes:
+        entries.pop(change.path, None)
+        if not change.deleted:
+            entries[change.path] = _entry_dict(change)
+    listing.entries = _sort(list(entries.values()))
+    listing.sync_token = sync_token
+    logger.info(f"Patched listing of {path} with {len(changes)} changes")
+    return listing
+
+
+async def _refresh(session: UserSession, path: str) -> Listing:
+    cached = await _load(session.user_id, path)
+    if cached is not None and time.time() - cached.validated_at < settings.LISTING_FRESH_SECONDS:
+        return cached
+
+    access_token = await get_access_token(session)
+    listing = None
+    if cached is not None:
+        info = await stat_file(path, access_token)
+        if info.etag is not None and info.etag == cached.etag:
+            listing = cached
+        elif cached.sync_token:
+            try:
+                listing = await _apply_changes(cached, path, access_token)
+                listing.etag = info.etag
+            except SyncNotSupported as e:
+                logger.info(f"Re-listing {path}: {e}")
+
+    if listing is None:
+        listing = await _full_listing(path, access_token)
+
+    listing.validated_at = time.time()
+    await _save(session.user_id, listing)
+    return listing
+
+
+_in_flight: Dict[Tuple[int, str], asyncio.Future] = {}
+
+
+async def list_folder(session: UserSession, path: str) -> Listing:
+    """A folder listing, served from cache when Nextcloud reports no change"""
+    path = normalize_folder(path)
+    key = (session.user_id, path)
+    future = _in_flight.get(key)
+    if future is None:
+        # Concurrent requests for the same folder share one PROPFIND
+        future = asyncio.ensure_future(_refresh(session, path))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(future)
@@ -0,0 +1,108 @@
+"""
+Chat model backends
+
+AI_MODEL_TYPE selects the backend, which is created and loaded once in the
+lifespan and shared by all requests in the process:
+
+- local: GGUF model through llama-cpp with a fair per-user generation queue
+- openai: any OpenAI-compatible chat completions API over a pooled client
+- stub: deterministic canned replies, for load tests without a GPU or network
+"""
+
+from typing import AsyncIterator, Dict, List, Optional
+import logging
+
+from app.config import settings
+from app.services.llm.base import LLMBackend, LLMOverloaded  # noqa: F401
+from app.services.metrics import timed_generation
+
+logger = logging.getLogger(__name__)
+
+_backend: Optional[LLMBackend] = None
+
+
+def _create_backend() -> LLMBackend:
+    if settings.AI_MODEL_TYPE == "openai":
+        from app.services.llm.openai_compat import OpenAICompatibleBackend
+
+        return OpenAICompatibleBackend(settings.OPENAI_BASE_URL, settings.OPENAI_API_KEY, settings.OPENAI_MODEL)
+    if settings.AI_MODEL_TYPE == "stub":
+        from app.services.llm.stub import StubBackend
+
+        return StubBackend(settings.LLM_STUB_TOKEN_DELAY_MS)
+    if settings.AI_MODEL_TYPE == "local":
+        from app.services.llm.local import LocalBackend
+
+        return LocalBackend(
+            settings.AI_MODEL_PATH,
+            max_queued=settings.LLM_MAX_QUEUED,
+            max_queued_per_user=settings.LLM_MAX_QUEUED_PER_USER,
+        )
+    raise ValueError(f"Unknown AI_MODEL_TYPE: {settings.AI_MODEL_TYPE}")
+
+
+async def start_llm() -> LLMBackend:
+    """Create and load the configured chat model backend"""
+    global _backend
+    if _backend is None:
+        _backend = _create_backend()
+        await _backend.load()
+        logger.info(f"Chat model ready ({_backend.name})")
+    return _backend
+
+
+async def stop_llm() -> None:
+    """Release the chat model backend"""
+    global _backend
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
+
+
+def get_backend() -> LLMBackend:
+    """Return the process-wide chat model backend"""
+    if _backend is None:
+        raise RuntimeError("Chat model is not loaded")
+    return _backend
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens for a text under the loaded model's tokenizer"""
+    return get_backend().count_tokens(text)
+
+
+def check_admission(user_id: Optional[int] = None) -> None:
+    """Raise LLMOverloaded if a generation for the user would be rejected right now"""
+    get_backend().check_admission(user_id)
+
+
+class ChatStream:
+    """Generated text of one admitted generation, timed for the LLM metrics"""
+
+    def __init__(self, tokens: AsyncIterator[str], count_tokens):
+        self._tokens = tokens
+        self._timed = timed_generation(tokens, count_tokens)
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._timed
+
+    async def aclose(self) -> None:
+        """Stop the generation, or take it out of the queue if it has not started"""
+        # Closing a generator that was never iterated skips its cleanup, so the
+        # backend's stream is closed directly as well
+        await self._timed.aclose()
+        await self._tokens.aclose()
+
+
+def stream_chat(
+    messages: List[Dict[str, str]],
+    user_id: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+) -> ChatStream:
+    """
+    Generate a reply to a list of chat messages, yielding text as it is produced
+    Admission is checked by the call itself; once it returns, the caller must
+    iterate the stream to the end or aclose() it
+    """
+    backend = get_backend()
+    return ChatStream(backend.stream(messages, max_tokens or settings.AI_MAX_TOKENS, user_id), backend.count_tokens)
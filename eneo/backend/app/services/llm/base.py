@@ -0,0 +1,55 @@
+"""
+Chat model backend interface
+"""
+
+from typing import AsyncIterator, Dict, List, Optional
+import math
+
+
+class LLMOverloaded(Exception):
+    """Raised when a generation cannot be admitted right now; retry later"""
+
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMBackend:
+    """
+    A chat model loaded once per process
+    stream() must check admission eagerly, so LLMOverloaded is raised by the
+    call itself rather than on first iteration
+    """
+
+    name = "base"
+
+    async def load(self) -> None:
+        """Load the model or open connections; called once from lifespan"""
+
+    async def close(self) -> None:
+        """Release the model or connections"""
+
+    @property
+    def queued(self) -> int:
+        """Generations waiting for the model"""
+        return 0
+
+    def count_tokens(self, text: str) -> int:
+        """Prompt tokens for a text; backends without a local tokenizer estimate ~3.5 characters per token"""
+        return math.ceil(len(text) / 3.5)
+
+    def check_admission(self, user_id: Optional[int]) -> None:
+        """Raise LLMOverloaded if a generation for this user would be rejected"""
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        user_id: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Generate a reply, yielding text as it is produced
+        The returned iterator's aclose() must stop or dequeue the generation
+        even if iteration has not started
+        """
+        raise NotImplementedError
@@ -0,0 +1,216 @@
+"""
+Local GGUF models through llama-cpp, with fair per-user scheduling
+
+One llama-cpp context generates one sequence at a time, so concurrent chats
+are queued rather than each loading its own copy of the model. The queue is
+bounded overall and per user, and the dispatcher serves users round-robin:
+a user with several queued requests cannot starve everyone else. New requests
+are refused while the oldest queued one has waited past ADMISSION_LLM_WAIT_SLO.
+Tokens are handed from the generation thread to the event loop as they are
+produced. Closing a request's token stream, which the chat endpoints do when
+the client goes away, drops it from the queue or stops it at the next token,
+also when nothing has read from the stream yet.
+"""
+
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, List, Optional
+import asyncio
+import logging
+import math
+import threading
+import time
+
+from app.config import settings
+from app.services.llm.base import LLMBackend, LLMOverloaded
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class _Generation:
+    user_id: Optional[int]
+    messages: List[Dict[str, str]]
+    max_tokens: int
+    tokens: asyncio.Queue = field(default_factory=asyncio.Queue)
+    stop: threading.Event = field(default_factory=threading.Event)
+    started: bool = False
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class _TokenStream:
+    """
+    The text of one queued generation
+    A class rather than an async generator: aclose() on a generator that was
+    never iterated does not run its cleanup, and a generation is queued before
+    its consumer starts reading
+    """
+
+    def __init__(self, backend: "LocalBackend", generation: _Generation):
+        self._backend = backend
+        self._generation = generation
+        self._closed = False
+
+    def __aiter__(self) -> "_TokenStream":
+        return self
+
+    async def __anext__(self) -> str:
+        if self._closed:
+            raise StopAsyncIteration
+        try:
+            item = await self._generation.tokens.get()
+        except BaseException:
+            # The consumer was cancelled mid-stream
+            await self.aclose()
+            raise
+        if item is _DONE:
+            await self.aclose()
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            await self.aclose()
+            raise item
+        return item
+
+    async def aclose(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._backend._cancel(self._generation)
+
+
+class LocalBackend(LLMBackend):
+    """A llama-cpp model shared by all requests in the process"""
+
+    name = "local"
+
+    def __init__(self, model_path: str, max_queued: int, max_queued_per_user: int):
+        self.model_path = model_path
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self._llama = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm")
+        # user -> queued generations; dict order is the round-robin order
+        self._pending: "OrderedDict[Optional[int], Deque[_Generation]]" = OrderedDict()
+        self._ready: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._pending.values())
+
+    @property
+    def oldest_wait(self) -> float:
+        """Seconds the longest-waiting queued generation has been waiting"""
+        now = time.monotonic()
+        return max((now - queue[0].enqueued_at for queue in self._pending.values()), default=0.0)
+
+    def _load(self) -> None:
+        from llama_cpp import Llama
+
+        logger.info(f"Loading local model: {self.model_path}")
+        self._llama = Llama(model_path=self.model_path, n_ctx=settings.AI_CONTEXT_TOKENS, verbose=False)
+
+    async def load(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+        self._ready = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        self._executor.shutdown(wait=False)
+
+    def count_tokens(self, text: str) -> int:
+        if self._llama is None:
+            return super().count_tokens(text)
+        return len(self._llama.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def check_admission(self, user_id: Optional[int]) -> None:
+        if self.queued >= self.max_queued:
+            raise LLMOverloaded(f"Generation queue is full ({self.max_queued} waiting)")
+        if len(self._pending.get(user_id, ())) >= self.max_queued_per_user:
+            raise LLMOverloaded("Too many generations waiting for this user")
+        # A new request would wait at least as long as the oldest one already has
+        wait = self.oldest_wait
+        if wait > settings.ADMISSION_LLM_WAIT_SLO:
+            raise LLMOverloaded(f"Generations are waiting {wait:.0f} s for the model", retry_after=math.ceil(wait))
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        user_id: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        if self._ready is None:
+            raise RuntimeError("Local model is not loaded")
+        self.check_admission(user_id)
+        generation = _Generation(user_id=user_id, messages=messages, max_tokens=max_tokens)
+        self._pending.setdefault(user_id, deque()).append(generation)
+        self._ready.set()
+        return _TokenStream(self, generation)
+
+    def _cancel(self, generation: _Generation) -> None:
+        generation.stop.set()
+        if not generation.started:
+            self._discard(generation)
+
+    def _discard(self, generation: _Generation) -> None:
+        queue = self._pending.get(generation.user_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(generation)
+        except ValueError:
+            return
+        if not queue:
+            del self._pending[generation.user_id]
+
+    async def _next(self) -> _Generation:
+        """Take the oldest generation of the user who has waited longest for a turn"""
+        while not self._pending:
+            self._ready.clear()
+            await self._ready.wait()
+        user_id, queue = self._pending.popitem(last=False)
+        generation = queue.popleft()
+        if queue:
+            self._pending[user_id] = queue
+        return generation
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            generation = await self._next()
+            if generation.stop.is_set():
+                continue
+            generation.started = True
+
+            def emit(item, generation=generation) -> None:
+                loop.call_soon_threadsafe(generation.tokens.put_nowait, item)
+
+            await loop.run_in_executor(self._executor, self._generate, generation, emit)
+
+    def _generate(self, generation: _Generation, emit) -> None:
+        try:
+            chunks = self._llama.create_chat_completion(
+                messages=generation.messages,
+                max_tokens=generation.max_tokens,
+                stream=True,
+            )
+            for chunk in chunks:
+                if generation.stop.is_set():
+                    break
+                text = chunk["choices"][0]["delta"].get("content")
+                if text:
+                    emit(text)
+            chunks.close()
+        except Exception as e:
+            emit(e)
+        finally:
+            emit(_DONE)
@@ -0,0 +1,62 @@
+"""
+OpenAI-compatible chat completions API (OpenAI, vLLM, llama.cpp server, ...)
+"""
+
+from typing import AsyncIterator, Dict, List, Optional
+import logging
+
+from app.services.http_client import get_http_client
+from app.services.llm.base import LLMBackend
+
+logger = logging.getLogger(__name__)
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Streams chat completions over the process-wide pooled HTTP client"""
+
+    name = "openai"
+
+    def __init__(self, base_url: str, api_key: str, model: str):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self._client = None
+
+    async def load(self) -> None:
+        from openai import AsyncOpenAI
+
+        self._client = AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            http_client=get_http_client().client,
+        )
+
+    async def close(self) -> None:
+        # The HTTP client is shared and closed in the lifespan, not here
+        self._client = None
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        user_id: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        if self._client is None:
+            raise RuntimeError("OpenAI backend is not loaded")
+        return self._stream(messages, max_tokens)
+
+    async def _stream(self, messages: List[Dict[str, str]], max_tokens: int) -> AsyncIterator[str]:
+        response = await self._client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        try:
+            async for chunk in response:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    yield text
+        finally:
+            # Closing the HTTP response is how generation is cancelled upstream
+            await response.response.aclose()
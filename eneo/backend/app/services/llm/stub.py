@@ -0,0 +1,44 @@
+"""
+Deterministic stub model for load tests and development without a GPU or network
+"""
+
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import hashlib
+
+from app.services.llm.base import LLMBackend
+
+WORDS = (
+    "enligt dokumentet ska ärendet hanteras av förvaltningen inom fyra veckor "
+    "och beslutet dokumenteras i diariet kommunen ansvarar för att underlaget "
+    "finns tillgängligt för berörda medarbetare"
+).split()
+
+
+class StubBackend(LLMBackend):
+    """
+    Emits a reply derived from a hash of the prompt, one word per token_delay
+    The same prompt always gives the same reply
+    """
+
+    name = "stub"
+
+    def __init__(self, token_delay_ms: float = 20.0):
+        self.token_delay = token_delay_ms / 1000
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        user_id: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        return self._stream(messages, max_tokens)
+
+    async def _stream(self, messages: List[Dict[str, str]], max_tokens: int) -> AsyncIterator[str]:
+        seed = hashlib.sha256("\0".join(m["content"] for m in messages).encode("utf-8")).digest()
+        count = min(max_tokens, 16 + seed[0] % 48)
+        for i in range(count):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            word = WORDS[seed[i % len(seed)] % len(WORDS)]
+            yield word if i == 0 else f" {word}"
@@ -0,0 +1,205 @@
+"""
+Logging setup
+
+Records are handed to a bounded queue and written by a listener thread, so a
+request never waits on formatting or on stdout. The caller only builds the
+message; JSON encoding, redaction and I/O happen on the listener. When the
+queue is full, records are dropped and counted rather than blocking.
+
+- LOG_FORMAT=json writes one JSON object per line, otherwise plain text
+- every record carries the request ID (X-Request-ID, or generated per
+  request) or, in the indexing worker, the task it belongs to
+- DEBUG records are sampled per request at LOG_DEBUG_SAMPLE_RATE, so a sampled
+  request keeps all of its debug lines
+- bearer tokens, OAuth2 tokens, secrets and passwords are masked in messages,
+  and message bodies passed as extra fields (body, query, content, prompt)
+  are reduced to their length
+"""
+
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import uuid
+import zlib
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+REQUEST_ID_HEADER = "X-Request-ID"
+VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+SECRET_PATTERNS = [
+    re.compile(r"(?i)(bearer\s+)[A-Za-z0-9._~+/=-]+"),
+    re.compile(
+        r"(?i)([\"']?(?:access_token|refresh_token|id_token|client_secret|password|api_key)[\"']?"
+        r"\s*[:=]\s*[\"']?)[^\"'\s,;&}]+"
+    ),
+    # OAuth2 authorization codes and state in callback URLs
+    re.compile(r"([?&](?:code|state)=)[^&\s]+"),
+]
+BODY_FIELDS = {"body", "query", "content", "prompt", "reply"}
+
+# Attributes every LogRecord has; anything else was passed in extra=
+STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "request_id"}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def redact(text: str) -> str:
+    """Mask credentials in a log message"""
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(r"\1[REDACTED]", text)
+    return text
+
+
+class _ContextFilter(logging.Filter):
+    """Runs in the caller: attaches the request ID and samples debug records"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        current = request_id.get()
+        record.request_id = current or "-"
+        if record.levelno <= logging.DEBUG and settings.LOG_DEBUG_SAMPLE_RATE < 1:
+            # Keyed by request, so a request's debug lines are kept or dropped together
+            draw = zlib.crc32(current.encode()) / 2 ** 32 if current else random.random()
+            return draw < settings.LOG_DEBUG_SAMPLE_RATE
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Enqueues without waiting; formatting is left to the listener"""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            type(self).dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve everything that cannot cross to another thread, nothing more
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _Listener(QueueListener):
+    """A QueueListener that can be stopped while its queue is full"""
+
+    def enqueue_sentinel(self) -> None:
+        # The default put_nowait raises queue.Full when a burst filled the
+        # queue; the listener thread is draining it, so waiting is safe
+        self.queue.put(self._sentinel)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in vars(record).items():
+            if key in STANDARD_ATTRIBUTES:
+                continue
+            if key in BODY_FIELDS and isinstance(value, str):
+                value = f"[{len(value)} chars]"
+            entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging() -> None:
+    """Route all logging through the queue; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(TextFormatter(TEXT_FORMAT))
+
+    handler = _NonBlockingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(getattr(logging, settings.LOG_LEVEL))
+    # uvicorn installs its own stream handlers before importing the app
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+
+    _listener = _Listener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        if _NonBlockingQueueHandler.dropped:
+            print(f"{_NonBlockingQueueHandler.dropped} log records dropped on a full queue", file=sys.stderr)
+
+
+class RequestIdMiddleware:
+    """Binds a request ID to everything logged while handling a request and echoes it in the response"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                incoming = value.decode("latin-1")
+                break
+        current = incoming if incoming and VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = current
+            await send(message)
+
+        # Not reset afterwards: each request runs in its own task, and the
+        # exception handler, which logs outside this middleware, still needs it
+        request_id.set(current)
+        await self.app(scope, receive, send_with_id)
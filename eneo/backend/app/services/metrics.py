@@ -0,0 +1,307 @@
+"""
+Prometheus metrics
+
+- eneo_http_request_duration_seconds: per method, route template and status,
+  measured until the last body byte is sent, so streamed chat replies and file
+  downloads count in full
+- eneo_stage_duration_seconds: named pipeline stages (webdav_fetch,
+  extraction, chunking, embedding, vector_query, lexical_query)
+- eneo_llm_time_to_first_token_seconds and eneo_llm_tokens_per_second
+- eneo_http_upstream_*_total: outbound requests, retries, failures and
+  circuit-breaker rejections per host
+- eneo_search_cache_lookups_total: query embedding and search result cache
+  lookups by outcome (local_hit, redis_hit, miss)
+- gauges for connection pools, queues and cache sizes, refreshed by the
+  health sampler in API processes and by the indexing worker
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by them (wiped before start); every process then writes its
+samples there and /metrics aggregates all of them. Without it each process
+reports only its own numbers. The indexing worker serves its metrics on
+WORKER_METRICS_PORT.
+"""
+
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, Optional, Tuple, TypeVar
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+T = TypeVar("T")
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+REQUEST_SECONDS = Histogram(
+    "eneo_http_request_duration_seconds",
+    "HTTP request latency until the response is fully sent",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "eneo_http_requests_in_progress",
+    "HTTP requests being handled",
+    multiprocess_mode="livesum",
+)
+STAGE_SECONDS = Histogram(
+    "eneo_stage_duration_seconds",
+    "Time spent in a pipeline stage, per document, batch or query",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "eneo_llm_time_to_first_token_seconds",
+    "Time from starting a generation to its first text",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0),
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "eneo_llm_tokens_per_second",
+    "Generation speed after the first token",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 200),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "eneo_db_pool_connections",
+    "Database pool connections by state",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+HTTP_POOL_CONNECTIONS = Gauge(
+    "eneo_http_pool_connections",
+    "Outbound HTTP pool connections by state",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+HTTP_UPSTREAM_REQUESTS = Counter(
+    "eneo_http_upstream_requests_total",
+    "Outbound requests sent per host, retries included",
+    ["host"],
+)
+HTTP_UPSTREAM_RETRIES = Counter(
+    "eneo_http_upstream_retries_total",
+    "Outbound requests retried after a connection error or 502/503/504",
+    ["host"],
+)
+HTTP_UPSTREAM_FAILURES = Counter(
+    "eneo_http_upstream_failures_total",
+    "Outbound requests that failed to connect or got a 5xx response",
+    ["host"],
+)
+HTTP_UPSTREAM_REJECTED = Counter(
+    "eneo_http_upstream_rejected_total",
+    "Outbound requests failed fast by an open circuit breaker",
+    ["host"],
+)
+HTTP_UPSTREAM_ACTIVE = Gauge(
+    "eneo_http_upstream_active_requests",
+    "Outbound requests holding (in_flight) or queued for (waiting) a per-host slot",
+    ["host", "lane", "state"],
+    multiprocess_mode="livesum",
+)
+HTTP_CIRCUIT_STATE = Gauge(
+    "eneo_http_circuit_state",
+    "Circuit breaker state per host: 0 closed, 1 half open, 2 open (worst worker)",
+    ["host"],
+    multiprocess_mode="livemax",
+)
+EMBEDDING_QUEUE_DEPTH = Gauge(
+    "eneo_embedding_queue_depth",
+    "Embedding requests waiting for a batch",
+    multiprocess_mode="livesum",
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "eneo_llm_queue_depth",
+    "Generations waiting for the chat model",
+    multiprocess_mode="livesum",
+)
+SEARCH_CACHE_LOOKUPS = Counter(
+    "eneo_search_cache_lookups_total",
+    "Query embedding and search result cache lookups by outcome",
+    ["cache", "result"],
+)
+SEARCH_CACHE_ENTRIES = Gauge(
+    "eneo_search_cache_entries",
+    "Entries held in the per-worker cache LRUs",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+INDEX_QUEUE_DEPTH = Gauge(
+    "eneo_index_queue_depth",
+    "Indexing tasks by state",
+    ["state"],
+    multiprocess_mode="livemax",
+)
+
+
+# Ordered by severity, so livemax shows the worst state any worker sees
+CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Record the duration of the enclosed block as one observation of a stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+
+class StageClock:
+    """Accumulates the time of a stage that is interleaved with others, observed once at the end"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.elapsed = 0.0
+
+    @contextmanager
+    def measure(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+    def observe(self) -> None:
+        STAGE_SECONDS.labels(self.stage).observe(self.elapsed)
+
+
+async def timed_iter(stage: str, source: AsyncIterator[T]) -> AsyncIterator[T]:
+    """Pass items through, recording the time spent waiting on the source as one observation"""
+    clock = StageClock(stage)
+    iterator = source.__aiter__()
+    try:
+        while True:
+            with clock.measure():
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+            yield item
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+        clock.observe()
+
+
+async def timed_generation(tokens: AsyncIterator[str], count_tokens) -> AsyncIterator[str]:
+    """Pass generated text through, recording time to first token and generation speed"""
+    started = time.perf_counter()
+    first_at: Optional[float] = None
+    parts = []
+    try:
+        async for text in tokens:
+            if first_at is None:
+                first_at = time.perf_counter()
+                LLM_TIME_TO_FIRST_TOKEN.observe(first_at - started)
+            parts.append(text)
+            yield text
+    finally:
+        if hasattr(tokens, "aclose"):
+            await tokens.aclose()
+        if first_at is not None and len(parts) > 1:
+            elapsed = time.perf_counter() - first_at
+            if elapsed > 0:
+                # The first token's cost is in the time to first token
+                LLM_TOKENS_PER_SECOND.observe(max(count_tokens("".join(parts[1:])), 1) / elapsed)
+
+
+def _route_template(scope: Scope) -> str:
+    # Templates rather than raw paths, so ids and file paths do not create a series each
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            REQUEST_SECONDS.labels(scope["method"], _route_template(scope), str(status)).observe(
+                time.perf_counter() - started
+            )
+
+
+def record_pool_gauges() -> None:
+    """Refresh pool and queue gauges from this process's services"""
+    # Imported here: the services import this module for their stage timers
+    from app.services import database, embeddings, http_client, llm, search_cache
+
+    try:
+        pool = database.get_pool()
+        idle = pool.get_idle_size()
+        DB_POOL_CONNECTIONS.labels("in_use").set(pool.get_size() - idle)
+        DB_POOL_CONNECTIONS.labels("idle").set(idle)
+    except RuntimeError:
+        pass
+    try:
+        client = http_client.get_http_client().metrics()
+        connections = client["pool"]
+        if connections is not None:
+            HTTP_POOL_CONNECTIONS.labels("in_use").set(connections["connections"] - connections["idle"])
+            HTTP_POOL_CONNECTIONS.labels("idle").set(connections["idle"])
+        for host, state in client["circuits"].items():
+            HTTP_CIRCUIT_STATE.labels(host).set(CIRCUIT_STATE_VALUES[state])
+    except RuntimeError:
+        pass
+    try:
+        EMBEDDING_QUEUE_DEPTH.set(embeddings.get_embedding_service().queued)
+    except RuntimeError:
+        pass
+    try:
+        LLM_QUEUE_DEPTH.set(llm.get_backend().queued)
+    except RuntimeError:
+        pass
+    for name, entries in search_cache.sizes().items():
+        SEARCH_CACHE_ENTRIES.labels(name).set(entries)
+
+
+def render() -> Tuple[bytes, str]:
+    """Metrics in the Prometheus text format, aggregated over all worker processes"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """Drop this process's live gauges from the aggregate; call on shutdown"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
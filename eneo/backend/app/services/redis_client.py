@@ -0,0 +1,54 @@
+"""
+Redis connection
+"""
+
+from typing import Optional
+import logging
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_redis: Optional[aioredis.Redis] = None
+
+
+async def init_redis() -> aioredis.Redis:
+    """
+    Create the process-wide Redis client
+    Redis is a cache and message bus here, so an unreachable server is logged
+    rather than fatal; the client reconnects on its own once it is back
+    """
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            health_check_interval=30,
+        )
+        try:
+            await _redis.ping()
+            logger.info(f"Redis connected: {settings.REDIS_HOST}:{settings.REDIS_PORT}")
+        except RedisError as e:
+            logger.warning(f"Redis unavailable at startup, falling back to Postgres: {e}")
+    return _redis
+
+
+async def close_redis() -> None:
+    """Close the Redis client"""
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+        logger.info("Redis connection closed")
+
+
+def get_redis() -> aioredis.Redis:
+    """Return the Redis client, failing if it has not been initialized"""
+    if _redis is None:
+        raise RuntimeError("Redis is not initialized")
+    return _redis
@@ -0,0 +1,236 @@
+"""
+Permission-filtered vector search
+
+Running a global ANN top-k and then dropping rows the user may not see returns
+short or empty result lists when the user owns a small share of the corpus.
+The planner first resolves the set of searchable documents (ownership,
+file_paths filter, file_permissions grants) and its chunk count, then picks:
+
+- exact: the candidate set is small, or there is no ANN index - scan only the
+  candidate chunks via the document_id index and sort by true distance
+- filtered_ann: the candidates are a large share of the corpus - use the global
+  index with the filter applied, searched wider by 1 / selectivity
+- partition: the user has a per-user partial index - use it, widened by the
+  candidates' share of the user's own chunks
+
+Hybrid search runs a Swedish full-text query over the same candidate documents
+in parallel with the vector query and merges both lists with reciprocal-rank
+fusion (score = sum of 1 / (k + rank)). Exact identifiers such as diarienummer
+and paragraph numbers, which MiniLM embeds poorly, are then still found.
+
+Query embeddings and fused results are cached (search_cache.py).
+"""
+
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+import asyncio
+import logging
+
+import asyncpg
+
+from app.config import settings
+from app.repositories import documents as documents_repo
+from app.repositories import embeddings as embeddings_repo
+from app.services import search_cache, vector_index
+from app.services.database import get_pool
+from app.services.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+EMPTY = "empty"
+EXACT = "exact"
+FILTERED_ANN = "filtered_ann"
+PARTITION = "partition"
+
+
+@dataclass
+class SearchPlan:
+    """How a search will be executed"""
+    strategy: str
+    document_ids: List[int] = field(default_factory=list)
+    candidate_chunks: int = 0
+    selectivity: float = 0.0
+
+
+async def plan_search(conn: asyncpg.Connection, user_id: int, file_paths: Optional[List[str]]) -> SearchPlan:
+    """Choose a strategy from the estimated selectivity of the user's filter"""
+    documents = await documents_repo.searchable_documents(user_id, file_paths, conn=conn)
+    document_ids = [row["id"] for row in documents]
+    candidate_chunks = sum(row["chunk_count"] for row in documents)
+    if not candidate_chunks:
+        return SearchPlan(strategy=EMPTY)
+
+    state = await vector_index.index_state(conn)
+    total = max(await vector_index.estimated_rows(conn), candidate_chunks)
+    selectivity = candidate_chunks / total
+
+    if state.params is None or candidate_chunks <= settings.SEARCH_EXACT_MAX_CHUNKS:
+        strategy = EXACT
+    elif selectivity >= settings.SEARCH_FILTERED_MIN_SELECTIVITY:
+        strategy = FILTERED_ANN
+    elif user_id in state.partitioned_users:
+        strategy = PARTITION
+    else:
+        # Small share without a partition: an exact scan is slower but never loses results
+        strategy = EXACT
+
+    return SearchPlan(
+        strategy=strategy,
+        document_ids=document_ids,
+        candidate_chunks=candidate_chunks,
+        selectivity=selectivity,
+    )
+
+
+async def _vector_search(
+    conn: asyncpg.Connection,
+    plan: SearchPlan,
+    query_vector,
+    user_id: int,
+    limit: int,
+    recall_target: float,
+) -> List[asyncpg.Record]:
+    """Execute a plan; must run inside a transaction so SET LOCAL stays scoped"""
+    if plan.strategy == EMPTY:
+        return []
+
+    if plan.strategy == EXACT:
+        # ANN indexes only support plain index scans; the document_id
+        # btree is still reachable through a bitmap scan
+        await conn.execute("SET LOCAL enable_indexscan = off")
+        return await embeddings_repo.search_in_documents(query_vector, plan.document_ids, limit, conn=conn)
+
+    if plan.strategy == PARTITION:
+        user_chunks = await documents_repo.user_chunk_count(user_id, conn=conn)
+        share = plan.candidate_chunks / max(user_chunks, plan.candidate_chunks)
+        await vector_index.tune_query(conn, recall_target, limit, share, params=vector_index.PARTITION_PARAMS)
+        return await embeddings_repo.search_in_partition(query_vector, user_id, plan.document_ids, limit, conn=conn)
+
+    await vector_index.tune_query(conn, recall_target, limit, plan.selectivity)
+    return await embeddings_repo.search_in_documents(query_vector, plan.document_ids, limit, conn=conn)
+
+
+async def search_chunks(
+    query_vector,
+    user_id: int,
+    file_paths: Optional[List[str]],
+    limit: int,
+    recall_target: float,
+) -> List[asyncpg.Record]:
+    """Top-k chunks the user may see, with ANN accuracy tuned to the recall target"""
+    async with get_pool().acquire() as conn:
+        async with conn.transaction():
+            plan = await plan_search(conn, user_id, file_paths)
+            return await _vector_search(conn, plan, query_vector, user_id, limit, recall_target)
+
+
+@dataclass
+class SearchHit:
+    """A chunk in the fused result list, with each signal's share of its score"""
+    chunk_id: int
+    document_id: int
+    file_path: str
+    title: str
+    excerpt: str
+    score: float  # fused RRF score, normalized so 1.0 = ranked first by both signals
+    semantic_rank: Optional[int] = None
+    semantic_score: Optional[float] = None  # cosine similarity
+    semantic_contribution: float = 0.0  # part of score from the vector search
+    lexical_rank: Optional[int] = None
+    lexical_score: Optional[float] = None  # ts_rank_cd
+    lexical_contribution: float = 0.0  # part of score from the full-text search
+
+
+def reciprocal_rank_fusion(
+    semantic: List[asyncpg.Record],
+    lexical: List[asyncpg.Record],
+    limit: int,
+    k: int = 60,
+) -> List[SearchHit]:
+    """
+    Merge two ranked lists; each appearance at rank r adds 1 / (k + r)
+    Scores and contributions are divided by the best possible score, so the
+    two contributions of a hit add up to its score
+    """
+    best = 2 / (k + 1)
+    hits: Dict[int, SearchHit] = {}
+
+    def hit_for(row) -> SearchHit:
+        hit = hits.get(row["chunk_id"])
+        if hit is None:
+            hit = SearchHit(
+                chunk_id=row["chunk_id"],
+                document_id=row["id"],
+                file_path=row["nextcloud_file_path"],
+                title=row["title"] or "",
+                excerpt=row["chunk_text"],
+                score=0.0,
+            )
+            hits[row["chunk_id"]] = hit
+        return hit
+
+    for rank, row in enumerate(semantic, start=1):
+        hit = hit_for(row)
+        hit.semantic_rank = rank
+        hit.semantic_score = row["score"]
+        hit.semantic_contribution = 1 / (k + rank) / best
+    for rank, row in enumerate(lexical, start=1):
+        hit = hit_for(row)
+        hit.lexical_rank = rank
+        hit.lexical_score = row["score"]
+        hit.lexical_contribution = 1 / (k + rank) / best
+
+    for hit in hits.values():
+        hit.score = hit.semantic_contribution + hit.lexical_contribution
+    return sorted(hits.values(), key=lambda hit: hit.score, reverse=True)[:limit]
+
+
+async def _lexical_search(query: str, plan: SearchPlan, depth: int) -> List[asyncpg.Record]:
+    if plan.strategy == EMPTY:
+        return []
+    with stage_timer("lexical_query"):
+        return await embeddings_repo.lexical_search(query, plan.document_ids, depth)
+
+
+async def hybrid_search(
+    query: str,
+    user_id: int,
+    file_paths: Optional[List[str]],
+    limit: int,
+    recall_target: float,
+) -> List[SearchHit]:
+    """
+    Vector and full-text search over the user's documents, fused by rank
+    The query embedding, planning, and the two searches overlap where they can
+    """
+    version = await search_cache.index_version(user_id)
+    cache_key = None
+    if version is not None:
+        cache_key = search_cache.result_key(user_id, version, query, file_paths, limit, recall_target)
+        cached = await search_cache.get_results(cache_key)
+        if cached is not None:
+            return [SearchHit(**hit) for hit in cached]
+
+    depth = max(limit * settings.SEARCH_HYBRID_DEPTH, 20)
+    embedding = asyncio.create_task(search_cache.embed_query(query))
+    try:
+        async with get_pool().acquire() as conn:
+            async with conn.transaction():
+                plan = await plan_search(conn, user_id, file_paths)
+                lexical = asyncio.create_task(_lexical_search(query, plan, depth))
+                try:
+                    query_vector = await embedding
+                    with stage_timer("vector_query"):
+                        semantic = await _vector_search(conn, plan, query_vector, user_id, depth, recall_target)
+                    lexical_rows = await lexical
+                finally:
+                    if not lexical.done():
+                        lexical.cancel()
+    finally:
+        if not embedding.done():
+            embedding.cancel()
+
+    hits = reciprocal_rank_fusion(semantic, lexical_rows, limit, settings.SEARCH_RRF_K)
+    if cache_key is not None:
+        await search_cache.put_results(cache_key, [asdict(hit) for hit in hits])
+    return hits
@@ -0,0 +1,178 @@
+"""
+Query embedding and search result caches
+
+Both are two-level: a per-worker LRU in front of Redis, so a repeated question
+skips the embedding model and the database, and a result computed by one
+worker is reused by the others.
+
+- Query embeddings are keyed by model and normalized query text (NFKC,
+  case-folded, whitespace collapsed). MiniLM is uncased, so all forms that
+  normalize alike embed alike.
+- Search results are keyed by user, the user's index version and every
+  search parameter. Documents and grants belong to one user, so the user is
+  the permission scope. The version is a Redis counter bumped whenever one of
+  the user's documents is indexed or deleted or a grant is added, which
+  orphans every cached result in that scope at once; orphans expire after
+  CACHE_TTL.
+
+Without Redis, embeddings are cached per worker only and results are not
+cached, since workers could not agree on the index version.
+
+Lookups are counted by outcome in eneo_search_cache_lookups_total on /metrics.
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import base64
+import hashlib
+import json
+import logging
+import time
+import unicodedata
+
+import numpy as np
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.services.embeddings import get_embedding_service
+from app.services.metrics import SEARCH_CACHE_LOOKUPS
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = "eneo:cache:"
+VERSION_KEY_PREFIX = "eneo:index-version:"
+
+
+class TwoLevelCache:
+    """A per-worker LRU in front of Redis, both holding string values for ttl seconds"""
+
+    def __init__(self, name: str, max_size: int, ttl: int):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_local(self, key: str, value: str) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self._get_local(key)
+        if value is not None:
+            SEARCH_CACHE_LOOKUPS.labels(self.name, "local_hit").inc()
+            return value
+        try:
+            value = await get_redis().get(f"{CACHE_KEY_PREFIX}{self.name}:{key}")
+        except RedisError as e:
+            logger.warning(f"Redis {self.name} cache lookup failed: {e}")
+        if value is None:
+            SEARCH_CACHE_LOOKUPS.labels(self.name, "miss").inc()
+            return None
+        SEARCH_CACHE_LOOKUPS.labels(self.name, "redis_hit").inc()
+        self._put_local(key, value)
+        return value
+
+    async def put(self, key: str, value: str) -> None:
+        self._put_local(key, value)
+        try:
+            await get_redis().set(f"{CACHE_KEY_PREFIX}{self.name}:{key}", value, ex=self.ttl)
+        except RedisError as e:
+            logger.warning(f"Could not store {self.name} cache entry in Redis: {e}")
+
+
+_embeddings = TwoLevelCache("query-embedding", settings.CACHE_MAX_SIZE, settings.CACHE_TTL)
+_results = TwoLevelCache("search", settings.CACHE_MAX_SIZE, settings.CACHE_TTL)
+
+
+def normalize_query(query: str) -> str:
+    """The form of a query used for cache keys"""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+async def embed_query(query: str):
+    """The query's embedding, from cache or computed and cached"""
+    key = _digest(settings.EMBEDDING_MODEL, normalize_query(query))
+    cached = await _embeddings.get(key)
+    if cached is not None:
+        return np.frombuffer(base64.b64decode(cached), dtype=np.float32)
+    vector = await get_embedding_service().embed_query(query)
+    await _embeddings.put(key, base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii"))
+    return vector
+
+
+async def index_version(user_id: int) -> Optional[str]:
+    """Current version of the user's searchable index, or None if Redis is unavailable"""
+    key = f"{VERSION_KEY_PREFIX}{user_id}"
+    try:
+        redis = get_redis()
+        version = await redis.get(key)
+        if version is None:
+            # Seeded from the clock, so a Redis restart cannot bring back a version
+            # that older cached results were stored under
+            await redis.set(key, time.time_ns(), nx=True)
+            version = await redis.get(key)
+        return version
+    except RedisError as e:
+        logger.warning(f"Index version unavailable, not caching search results: {e}")
+        return None
+
+
+async def bump_index_version(user_id: int) -> None:
+    """Invalidate every cached search result for the user"""
+    try:
+        await get_redis().incr(f"{VERSION_KEY_PREFIX}{user_id}")
+    except RedisError as e:
+        logger.warning(f"Could not invalidate cached search results for user {user_id}: {e}")
+
+
+def result_key(
+    user_id: int,
+    version: str,
+    query: str,
+    file_paths: Optional[List[str]],
+    limit: int,
+    recall_target: float,
+) -> str:
+    """Cache key for one search"""
+    return _digest(
+        user_id,
+        version,
+        settings.EMBEDDING_MODEL,
+        normalize_query(query),
+        sorted(file_paths) if file_paths is not None else None,
+        limit,
+        recall_target,
+    )
+
+
+async def get_results(key: str) -> Optional[List[dict]]:
+    """Cached search hits, as dicts"""
+    cached = await _results.get(key)
+    return json.loads(cached) if cached is not None else None
+
+
+async def put_results(key: str, hits: List[dict]) -> None:
+    await _results.put(key, json.dumps(hits, ensure_ascii=False))
+
+
+def sizes() -> Dict[str, int]:
+    """Entries in this worker's LRUs, per cache"""
+    return {cache.name: len(cache._entries) for cache in (_embeddings, _results)}
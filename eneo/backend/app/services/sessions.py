@@ -0,0 +1,327 @@
+"""
+Session resolution for authenticated requests
+
+Sessions are stored in three tiers:
+
+- a per-worker TTL/LRU cache, so the hot path costs no network round-trip
+- Redis, the primary shared store, with a TTL matching the session lifetime
+- Postgres, the durable fallback when Redis is down or has evicted the key
+
+The cookie carries the session token plus an HMAC signature, so forged or
+mangled cookies are rejected before any lookup. Logout and token updates are
+broadcast over Redis pub/sub and every worker drops its cached copy; the short
+cache TTL bounds staleness if a message is missed.
+"""
+
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+
+from fastapi import HTTPException, Request
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.repositories import sessions as sessions_repo
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY_PREFIX = "eneo:session:"
+INVALIDATION_CHANNEL = "eneo:sessions:invalidate"
+
+
+@dataclass
+class UserSession:
+    """Authenticated user session"""
+    session_token: str
+    user_id: int
+    nextcloud_user_id: str
+    access_token: Optional[str]
+    refresh_token: Optional[str]
+    expires_at: Optional[datetime]  # access token expiry
+    created_at: Optional[datetime] = None
+
+    @property
+    def session_expires_at(self) -> Optional[datetime]:
+        if self.created_at is None:
+            return None
+        return self.created_at + timedelta(seconds=settings.SESSION_LIFETIME)
+
+
+def _from_row(row) -> UserSession:
+    return UserSession(
+        session_token=row["session_token"],
+        user_id=row["user_id"],
+        nextcloud_user_id=row["nextcloud_user_id"],
+        access_token=row["access_token"],
+        refresh_token=row["refresh_token"],
+        expires_at=row["expires_at"],
+        created_at=row["created_at"],
+    )
+
+
+def _to_json(session: UserSession) -> str:
+    data = asdict(session)
+    for key in ("expires_at", "created_at"):
+        if data[key] is not None:
+            data[key] = data[key].isoformat()
+    return json.dumps(data)
+
+
+def _from_json(value: str) -> UserSession:
+    data = json.loads(value)
+    for key in ("expires_at", "created_at"):
+        if data.get(key):
+            data[key] = datetime.fromisoformat(data[key])
+    return UserSession(**data)
+
+
+# Cookie signing
+
+def _signature(session_token: str) -> str:
+    digest = hmac.new(settings.API_SECRET_KEY.encode(), session_token.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:24]).decode().rstrip("=")
+
+
+def sign_session_token(session_token: str) -> str:
+    """Cookie value for a session token"""
+    return f"{session_token}.{_signature(session_token)}"
+
+
+def unsign_session_token(cookie: str) -> Optional[str]:
+    """Session token from a cookie value, or None if the signature does not match"""
+    session_token, _, signature = cookie.rpartition(".")
+    if not session_token or not hmac.compare_digest(signature, _signature(session_token)):
+        return None
+    return session_token
+
+
+# Per-worker cache
+
+class _SessionCache:
+    """Small LRU of resolved sessions, each entry valid for at most ttl seconds"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, UserSession]]" = OrderedDict()
+
+    def get(self, session_token: str) -> Optional[UserSession]:
+        entry = self._entries.get(session_token)
+        if entry is None:
+            return None
+        valid_until, session = entry
+        if valid_until < time.monotonic():
+            del self._entries[session_token]
+            return None
+        self._entries.move_to_end(session_token)
+        return session
+
+    def put(self, session: UserSession) -> None:
+        self._entries[session.session_token] = (time.monotonic() + self.ttl, session)
+        self._entries.move_to_end(session.session_token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, session_token: str) -> None:
+        self._entries.pop(session_token, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+_cache = _SessionCache(settings.SESSION_CACHE_SIZE, settings.SESSION_CACHE_TTL)
+
+
+# Redis tier
+
+def _ttl(session: UserSession) -> int:
+    expires = session.session_expires_at
+    if expires is None:
+        return settings.SESSION_LIFETIME
+    return int((expires - datetime.utcnow()).total_seconds())
+
+
+async def _store(session: UserSession) -> None:
+    ttl = _ttl(session)
+    if ttl <= 0:
+        return
+    try:
+        await get_redis().set(f"{SESSION_KEY_PREFIX}{session.session_token}", _to_json(session), ex=ttl)
+    except RedisError as e:
+        logger.warning(f"Could not store session in Redis: {e}")
+
+
+async def _load(session_token: str) -> Optional[UserSession]:
+    """Redis first, then Postgres; a Postgres hit is written back to Redis"""
+    try:
+        value = await get_redis().get(f"{SESSION_KEY_PREFIX}{session_token}")
+        if value is not None:
+            return _from_json(value)
+    except RedisError as e:
+        logger.warning(f"Redis session lookup failed, using Postgres: {e}")
+
+    row = await sessions_repo.get_session(session_token)
+    if row is None:
+        return None
+    session = _from_row(row)
+    await _store(session)
+    return session
+
+
+async def _invalidate(session_token: str) -> None:
+    """Drop a session from Redis and from every worker's cache"""
+    _cache.discard(session_token)
+    try:
+        redis = get_redis()
+        await redis.delete(f"{SESSION_KEY_PREFIX}{session_token}")
+        await redis.publish(INVALIDATION_CHANNEL, session_token)
+    except RedisError as e:
+        logger.warning(f"Could not broadcast session invalidation: {e}")
+
+
+async def resolve_session(session_token: str) -> Optional[UserSession]:
+    """Look up a live session by token through the cache tiers"""
+    session = _cache.get(session_token)
+    if session is None:
+        session = await _load(session_token)
+        if session is None:
+            return None
+        _cache.put(session)
+    expires = session.session_expires_at
+    if expires is not None and expires < datetime.utcnow():
+        _cache.discard(session_token)
+        return None
+    return session
+
+
+async def get_current_session(request: Request) -> UserSession:
+    """
+    Resolve the session referenced by the session cookie
+    Raises 401 if the cookie is missing, forged, unknown or expired
+    """
+    cookie = request.cookies.get(settings.SESSION_COOKIE_NAME)
+    if not cookie:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    session_token = unsign_session_token(cookie)
+    if session_token is None:
+        raise HTTPException(status_code=401, detail="Invalid session")
+
+    session = await resolve_session(session_token)
+    if session is None:
+        raise HTTPException(status_code=401, detail="Session not found or expired")
+    return session
+
+
+async def get_latest_session(user_id: int) -> Optional[UserSession]:
+    """
+    Return the most recent session holding an access token for a user
+    Used by background workers that act on behalf of a user
+    """
+    row = await sessions_repo.get_latest_session(user_id)
+    if row is None:
+        return None
+    return _from_row(row)
+
+
+async def create_session(
+    user_id: int,
+    nextcloud_user_id: str,
+    access_token: str,
+    refresh_token: Optional[str],
+    expires_in: Optional[int],
+) -> str:
+    """Store a new session for a logged-in user and return its token"""
+    session = UserSession(
+        session_token=secrets.token_urlsafe(32),
+        user_id=user_id,
+        nextcloud_user_id=nextcloud_user_id,
+        access_token=access_token,
+        refresh_token=refresh_token,
+        expires_at=datetime.utcnow() + timedelta(seconds=expires_in) if expires_in else None,
+        created_at=datetime.utcnow(),
+    )
+    await sessions_repo.create_session(
+        user_id,
+        session.session_token,
+        access_token,
+        refresh_token,
+        session.expires_at,
+    )
+    await _store(session)
+    return session.session_token
+
+
+async def update_session_tokens(
+    session: UserSession,
+    access_token: str,
+    refresh_token: Optional[str],
+    expires_at: Optional[datetime],
+) -> UserSession:
+    """Store refreshed OAuth2 tokens in all tiers and tell other workers to reload"""
+    await sessions_repo.update_tokens(session.session_token, access_token, refresh_token, expires_at)
+    session.access_token = access_token
+    session.refresh_token = refresh_token
+    session.expires_at = expires_at
+    await _invalidate(session.session_token)
+    await _store(session)
+    _cache.put(session)
+    return session
+
+
+async def end_session(session_token: str) -> None:
+    """Invalidate a session everywhere"""
+    await sessions_repo.delete_session(session_token)
+    await _invalidate(session_token)
+
+
+async def _listen_for_invalidations() -> None:
+    """Evict sessions from this worker's cache as other workers invalidate them"""
+    while True:
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            try:
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        _cache.discard(message["data"])
+            finally:
+                await pubsub.aclose()
+        except RedisError as e:
+            logger.warning(f"Session invalidation listener disconnected: {e}")
+            # Entries cached while we were not listening could be stale
+            _cache.clear()
+            await asyncio.sleep(5)
+
+
+_listener: Optional[asyncio.Task] = None
+
+
+def start_session_listener() -> None:
+    """Start following session invalidations from other workers"""
+    global _listener
+    if _listener is None:
+        _listener = asyncio.create_task(_listen_for_invalidations())
+
+
+async def stop_session_listener() -> None:
+    """Stop the invalidation listener"""
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
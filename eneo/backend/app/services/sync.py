@@ -0,0 +1,239 @@
+"""
+Change-driven sync of paths granted for indexing
+
+The indexing worker scans every path a user has granted with permission_type
+'index' each SYNC_INTERVAL, and queues only what changed since the last pass:
+
+- a Depth: 0 PROPFIND on the root; an unchanged ETag ends the scan, since
+  Nextcloud propagates ETag changes up through every parent folder
+- with a sync token, a sync-collection REPORT lists the files changed or
+  removed anywhere below the root
+- otherwise the tree is walked, descending only into folders whose ETag
+  differs from the one stored at the last walk
+
+New and modified files become index tasks; documents for removed files and
+folders are deleted together with their embeddings. State is stored only once
+a pass has completed, so a failed pass is simply repeated.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+import asyncio
+import logging
+
+import asyncpg
+
+from app.config import settings
+from app.repositories import documents as documents_repo
+from app.repositories import sync as sync_repo
+from app.services import jobs
+from app.services.database import get_pool
+from app.services.extraction import is_supported
+from app.services.ingestion import file_type_for
+from app.services.search_cache import bump_index_version
+from app.services.sessions import get_latest_session
+from app.services.tokens import get_access_token
+from app.services.webdav import (
+    DirEntry,
+    SyncNotSupported,
+    WebDAVError,
+    iter_directory,
+    normalize_folder,
+    stat_entry,
+    sync_collection,
+)
+
+logger = logging.getLogger(__name__)
+
+# Any constant works, it only has to be the same in every worker process
+SYNC_LOCK_ID = 0x656E7379
+
+
+@dataclass
+class SyncResult:
+    """Outcome of scanning one root"""
+    queued: int = 0
+    deleted: int = 0
+    walked: int = 0  # folders listed
+    unchanged: bool = False
+
+
+@dataclass
+class _Changes:
+    files: Dict[str, DirEntry] = field(default_factory=dict)  # present files, possibly modified
+    known: Dict[str, Optional[str]] = field(default_factory=dict)  # indexed path -> ETag
+    deleted_files: Set[str] = field(default_factory=set)
+    deleted_folders: Set[str] = field(default_factory=set)  # with a trailing slash
+    folder_etags: Dict[str, Optional[str]] = field(default_factory=dict)  # stored once the pass completes
+    gone_folders: List[str] = field(default_factory=list)
+
+
+def _vanished(path: str, listed: Dict[str, Set[str]]) -> bool:
+    """True if the deepest listed folder above path no longer contains it"""
+    parts = path.strip("/").split("/")
+    for depth in range(len(parts) - 1, -1, -1):
+        parent = normalize_folder("/".join(parts[:depth]))
+        if parent in listed:
+            return parts[depth] not in listed[parent]
+    return False
+
+
+async def _changes_since(user_id: int, folder: str, access_token: str, sync_token: str):
+    """Changes reported by sync-collection, and the token for the next pass"""
+    entries, new_token = await sync_collection(folder, access_token, sync_token, depth="infinite")
+    changes = _Changes()
+    for entry in entries:
+        if entry.deleted:
+            # A removed member's href does not always say whether it was a folder
+            changes.deleted_files.add(entry.path.rstrip("/"))
+            changes.deleted_folders.add(normalize_folder(entry.path))
+        elif not entry.is_dir:
+            changes.files[entry.path] = entry
+    changes.known = await documents_repo.etags_for_paths(user_id, list(changes.files))
+    return changes, new_token
+
+
+async def _walk(root_id: int, user_id: int, folder: str, access_token: str, result: SyncResult) -> _Changes:
+    """List the folders below root whose ETag changed since the last walk"""
+    previous = await sync_repo.folder_etags(root_id)
+    changes = _Changes()
+    listed: Dict[str, Set[str]] = {}
+    pending = [folder]
+    while pending:
+        current = pending.pop()
+        names: Set[str] = set()
+        async for entry in iter_directory(current, access_token):
+            if entry.path == current:
+                continue
+            names.add(entry.name)
+            if entry.is_dir:
+                changes.folder_etags[entry.path] = entry.etag
+                if entry.etag is None or previous.get(entry.path) != entry.etag:
+                    pending.append(entry.path)
+            else:
+                changes.files[entry.path] = entry
+        listed[current] = names
+
+    # Anything stored below a listed folder that the listing no longer shows was removed
+    changes.known = await documents_repo.etags_under(user_id, folder)
+    changes.deleted_files = {path for path in changes.known if _vanished(path, listed)}
+    changes.gone_folders = [path for path in previous if _vanished(path, listed)]
+    result.walked = len(listed)
+    return changes
+
+
+async def _apply(user_id: int, changes: _Changes, result: SyncResult) -> None:
+    """Delete removed documents and queue new and modified files"""
+    if changes.deleted_files:
+        result.deleted += await documents_repo.delete_by_paths(user_id, sorted(changes.deleted_files))
+    for prefix in sorted(changes.deleted_folders):
+        result.deleted += await documents_repo.delete_under(user_id, prefix)
+    if result.deleted:
+        await bump_index_version(user_id)
+
+    candidates = {
+        path: entry.modified
+        for path, entry in changes.files.items()
+        if is_supported(file_type_for(path))
+        and (path not in changes.known or changes.known[path] != entry.etag)
+    }
+    if not candidates:
+        return
+    outstanding = await jobs.outstanding_paths(user_id, candidates)
+    paths = [path for path in candidates if path not in outstanding]
+    if paths:
+        await jobs.create_job(user_id, paths)
+        result.queued = len(paths)
+
+
+async def _save(root_id: int, etag: Optional[str], sync_token: Optional[str], changes: _Changes) -> None:
+    async with get_pool().acquire() as conn:
+        async with conn.transaction():
+            await sync_repo.forget_folders(root_id, changes.gone_folders, conn=conn)
+            await sync_repo.save_folder_etags(root_id, changes.folder_etags, conn=conn)
+            await sync_repo.mark_synced(root_id, etag, sync_token, conn=conn)
+
+
+async def sync_root(root: asyncpg.Record) -> SyncResult:
+    """Bring the index for one granted path up to date with Nextcloud"""
+    root_id, user_id, path = root["id"], root["user_id"], root["root_path"]
+    session = await get_latest_session(user_id)
+    if session is None:
+        raise RuntimeError("No active session with an access token for user")
+    access_token = await get_access_token(session)
+    result = SyncResult()
+
+    try:
+        entry = await stat_entry(path, access_token)
+    except WebDAVError as e:
+        if e.status_code != 404:
+            raise
+        # The granted path itself was removed or renamed
+        changes = _Changes(deleted_files={path}, deleted_folders={normalize_folder(path)})
+        changes.gone_folders = [normalize_folder(path)]
+        await _apply(user_id, changes, result)
+        await _save(root_id, None, None, changes)
+        return result
+
+    if not entry.is_dir:
+        changes = _Changes(files={path: entry})
+        changes.known = await documents_repo.etags_for_paths(user_id, [path])
+        await _apply(user_id, changes, result)
+        await _save(root_id, entry.etag, None, changes)
+        return result
+
+    if entry.etag is not None and entry.etag == root["etag"]:
+        result.unchanged = True
+        await _save(root_id, entry.etag, root["sync_token"], _Changes())
+        return result
+
+    folder = normalize_folder(path)
+    changes = None
+    # Taken before scanning, so changes made during the scan are picked up next pass
+    sync_token = entry.sync_token
+    if root["sync_token"]:
+        try:
+            changes, sync_token = await _changes_since(user_id, folder, access_token, root["sync_token"])
+        except SyncNotSupported as e:
+            logger.info(f"Walking {folder} instead of sync-collection: {e}")
+    if changes is None:
+        changes = await _walk(root_id, user_id, folder, access_token, result)
+
+    await _apply(user_id, changes, result)
+    await _save(root_id, entry.etag, sync_token, changes)
+    return result
+
+
+async def _sync_one(root: asyncpg.Record, limit: asyncio.Semaphore) -> None:
+    async with limit:
+        try:
+            result = await sync_root(root)
+        except Exception as e:
+            logger.warning(f"Sync of {root['root_path']} for user {root['user_id']} failed: {e}")
+            await sync_repo.mark_failed(root["id"], f"{type(e).__name__}: {e}")
+            return
+    if not result.unchanged:
+        logger.info(
+            f"Synced {root['root_path']} for user {root['user_id']}: "
+            f"{result.queued} queued, {result.deleted} removed, {result.walked} folders listed"
+        )
+
+
+async def sync_all() -> bool:
+    """
+    Scan every granted root once
+    Only one worker process scans at a time; returns False if another holds the lock
+    """
+    conn = await asyncpg.connect(dsn=settings.DATABASE_URL)
+    try:
+        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", SYNC_LOCK_ID):
+            return False
+        try:
+            roots = await sync_repo.refresh_roots(conn=conn)
+            limit = asyncio.Semaphore(settings.SYNC_CONCURRENCY)
+            await asyncio.gather(*(_sync_one(root, limit) for root in roots))
+            return True
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", SYNC_LOCK_ID)
+    finally:
+        await conn.close()
@@ -0,0 +1,182 @@
+"""
+OAuth2 access token management
+
+Nextcloud rotates the refresh token on every use, so two concurrent refreshes
+for the same session leave one of them holding a revoked token. Refreshes are
+therefore single-flight: within a process, callers for the same session share
+one in-progress refresh, and across workers a Redis lock per user lets one
+process refresh while the others wait and then read the stored result.
+
+Tokens are renewed TOKEN_REFRESH_MARGIN seconds before expires_at, so calls
+made while a token is about to expire do not fail first and refresh after.
+
+The token request is sent once, without retries, and given up after
+TOKEN_REFRESH_TIMEOUT, so it always ends while the lock is still held; a
+second worker can only take over once the first has stopped using the
+refresh token.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import asyncio
+import logging
+import secrets
+import time
+
+import httpx
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.repositories import sessions as sessions_repo
+from app.services.http_client import get_http_client
+from app.services.redis_client import get_redis
+from app.services.sessions import UserSession, update_session_tokens
+
+logger = logging.getLogger(__name__)
+
+LOCK_PREFIX = "eneo:token-refresh:"
+
+# Delete the lock only if we still own it
+RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class TokenRefreshError(Exception):
+    """Raised when an access token cannot be renewed; the user has to log in again"""
+
+
+def needs_refresh(session: UserSession) -> bool:
+    """True when the access token expires within the refresh margin"""
+    if session.expires_at is None:
+        return False
+    return session.expires_at - timedelta(seconds=settings.TOKEN_REFRESH_MARGIN) <= datetime.utcnow()
+
+
+async def _request_tokens(refresh_token: str) -> dict:
+    try:
+        # The overall bound also covers waiting for a connection slot
+        response = await asyncio.wait_for(
+            get_http_client().post(
+                settings.OAUTH2_TOKEN_URL,
+                idempotent=False,
+                timeout=settings.TOKEN_REFRESH_TIMEOUT,
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": refresh_token,
+                    "client_id": settings.OAUTH2_CLIENT_ID,
+                    "client_secret": settings.OAUTH2_CLIENT_SECRET,
+                },
+            ),
+            settings.TOKEN_REFRESH_TIMEOUT,
+        )
+    except asyncio.TimeoutError as e:
+        raise TokenRefreshError("Token endpoint timed out") from e
+    except httpx.RequestError as e:
+        raise TokenRefreshError(f"Token endpoint unreachable: {e}") from e
+    if response.status_code != 200:
+        raise TokenRefreshError(f"Token refresh rejected: {response.status_code}")
+    return response.json()
+
+
+async def _reload(session: UserSession) -> UserSession:
+    """Pick up tokens another worker may have stored"""
+    row = await sessions_repo.get_session(session.session_token)
+    if row is None:
+        raise TokenRefreshError("Session no longer exists")
+    session.access_token = row["access_token"]
+    session.refresh_token = row["refresh_token"]
+    session.expires_at = row["expires_at"]
+    return session
+
+
+async def _refresh(session: UserSession) -> UserSession:
+    await _reload(session)
+    if not needs_refresh(session):
+        # Someone else renewed it while we were waiting
+        return session
+    if not session.refresh_token:
+        raise TokenRefreshError("Session has no refresh token")
+
+    token_data = await _request_tokens(session.refresh_token)
+    expires_in = token_data.get("expires_in")
+    logger.info(f"Refreshed access token for user {session.user_id}")
+    return await update_session_tokens(
+        session,
+        token_data["access_token"],
+        token_data.get("refresh_token", session.refresh_token),
+        datetime.utcnow() + timedelta(seconds=expires_in) if expires_in else None,
+    )
+
+
+async def _acquire_lock(key: str, owner: str) -> Optional[bool]:
+    """True if acquired, False if held elsewhere, None if Redis is unavailable"""
+    try:
+        return bool(await get_redis().set(key, owner, nx=True, px=int(settings.TOKEN_REFRESH_LOCK_TTL * 1000)))
+    except RedisError as e:
+        logger.warning(f"Token refresh lock unavailable, refreshing without it: {e}")
+        return None
+
+
+async def _release_lock(key: str, owner: str) -> None:
+    try:
+        await get_redis().eval(RELEASE_LOCK, 1, key, owner)
+    except RedisError as e:
+        logger.warning(f"Could not release token refresh lock {key}: {e}")
+
+
+async def _refresh_across_workers(session: UserSession) -> UserSession:
+    key = f"{LOCK_PREFIX}{session.user_id}"
+    owner = secrets.token_hex(8)
+    # Past the lock TTL a crashed holder's lock has expired and we take over
+    deadline = time.monotonic() + 2 * settings.TOKEN_REFRESH_LOCK_TTL
+
+    while True:
+        acquired = await _acquire_lock(key, owner)
+        if acquired is None:
+            return await _refresh(session)
+        if acquired:
+            try:
+                return await _refresh(session)
+            finally:
+                await _release_lock(key, owner)
+
+        # Another worker is refreshing; wait for its result
+        await asyncio.sleep(0.1)
+        await _reload(session)
+        if not needs_refresh(session):
+            return session
+        if time.monotonic() > deadline:
+            raise TokenRefreshError("Timed out waiting for a token refresh in another worker")
+
+
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+async def refresh_session(session: UserSession) -> UserSession:
+    """Renew a session's tokens; concurrent callers for the same session share one refresh"""
+    token = session.session_token
+    future = _in_flight.get(token)
+    if future is None:
+        future = asyncio.ensure_future(_refresh_across_workers(session))
+        _in_flight[token] = future
+        future.add_done_callback(lambda _: _in_flight.pop(token, None))
+    # Shielded so one cancelled caller does not cancel the refresh for everyone else
+    refreshed = await asyncio.shield(future)
+    if refreshed is not session:
+        session.access_token = refreshed.access_token
+        session.refresh_token = refreshed.refresh_token
+        session.expires_at = refreshed.expires_at
+    return session
+
+
+async def get_access_token(session: UserSession) -> str:
+    """A valid access token for the session, renewed first if it is about to expire"""
+    if needs_refresh(session):
+        await refresh_session(session)
+    if not session.access_token:
+        raise TokenRefreshError("Session has no access token")
+    return session.access_token
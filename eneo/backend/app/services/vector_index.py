@@ -0,0 +1,298 @@
+"""
+ANN index management for the embeddings table
+
+The right pgvector index depends on corpus size: below a few thousand rows an
+exact scan is fastest, ivfflat builds quickly and works well up to around a
+million rows when lists ~ rows / 1000, and HNSW gives better recall/latency at
+larger sizes. The manager compares the live index with the target for the
+current row count and rebuilds it with CREATE INDEX CONCURRENTLY, swapping the
+new index in by name so searches never run without one.
+
+Query-time accuracy (ivfflat.probes / hnsw.ef_search) is derived per query from
+the caller's recall target.
+
+Users who own a large but small-share slice of the corpus also get a partial
+HNSW index (WHERE user_id = N), so their searches scan only their own vectors
+instead of filtering a global top-k.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Set, Tuple
+import logging
+import math
+import re
+import time
+
+import asyncpg
+
+from app.config import settings
+from app.repositories import documents as documents_repo
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "embeddings_vector_idx"
+BUILD_NAME = "embeddings_vector_idx_build"
+PARTITION_PREFIX = "embeddings_user_"
+PARTITION_SUFFIX = "_vector_idx"
+
+# Any constant works, it only has to be the same in every process
+REBUILD_LOCK_ID = 0x656E656F
+
+# (recall target, fraction of ivfflat lists to probe)
+IVFFLAT_PROBE_CURVE: List[Tuple[float, float]] = [
+    (0.5, 0.005), (0.8, 0.01), (0.9, 0.03), (0.95, 0.06), (0.99, 0.15),
+]
+
+# (recall target, hnsw.ef_search as a multiple of k)
+HNSW_EF_CURVE: List[Tuple[float, float]] = [
+    (0.5, 1.0), (0.8, 2.0), (0.9, 4.0), (0.95, 8.0), (0.99, 16.0),
+]
+
+
+@dataclass
+class IndexParams:
+    """Parameters of an ANN index on embeddings.embedding"""
+    method: str  # 'ivfflat' or 'hnsw'
+    lists: int = 0
+    m: int = 0
+    ef_construction: int = 0
+
+    def ddl(self, name: str, table: str = "embeddings") -> str:
+        if self.method == "ivfflat":
+            options = f"lists = {int(self.lists)}"
+        else:
+            options = f"m = {int(self.m)}, ef_construction = {int(self.ef_construction)}"
+        return (
+            f"CREATE INDEX CONCURRENTLY {name} ON {table} "
+            f"USING {self.method} (embedding vector_cosine_ops) WITH ({options})"
+        )
+
+
+def choose_params(row_count: int) -> Optional[IndexParams]:
+    """Target index for a row count, or None when an exact scan is cheaper"""
+    if row_count < settings.VECTOR_INDEX_MIN_ROWS:
+        return None
+
+    method = settings.VECTOR_INDEX_METHOD
+    if method == "auto":
+        method = "hnsw" if row_count >= settings.VECTOR_INDEX_HNSW_MIN_ROWS else "ivfflat"
+
+    if method == "ivfflat":
+        lists = row_count // 1000 if row_count <= 1_000_000 else int(math.sqrt(row_count))
+        return IndexParams(method="ivfflat", lists=max(lists, 10))
+    if row_count >= 5_000_000:
+        return IndexParams(method="hnsw", m=24, ef_construction=128)
+    return IndexParams(method="hnsw", m=16, ef_construction=64)
+
+
+def needs_rebuild(current: Optional[IndexParams], target: Optional[IndexParams]) -> bool:
+    """Rebuild when the method changes or ivfflat lists drift more than 2x from the target"""
+    if target is None:
+        return False
+    if current is None or current.method != target.method:
+        return True
+    if target.method == "ivfflat":
+        return not (target.lists / 2 <= current.lists <= target.lists * 2)
+    return current.m < target.m
+
+
+def _parse_index(indexdef: str) -> Optional[IndexParams]:
+    method = re.search(r"USING (ivfflat|hnsw)", indexdef)
+    if method is None:
+        return None
+    options = dict(re.findall(r"(\w+)='?(\d+)'?", indexdef.split("WITH", 1)[-1]))
+    return IndexParams(
+        method=method.group(1),
+        lists=int(options.get("lists", 100 if method.group(1) == "ivfflat" else 0)),
+        m=int(options.get("m", 16 if method.group(1) == "hnsw" else 0)),
+        ef_construction=int(options.get("ef_construction", 64 if method.group(1) == "hnsw" else 0)),
+    )
+
+
+async def current_index(conn: asyncpg.Connection) -> Optional[IndexParams]:
+    """Parameters of the live ANN index, if any"""
+    indexdef = await conn.fetchval(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = 'embeddings' AND indexname = $1",
+        INDEX_NAME,
+    )
+    return _parse_index(indexdef) if indexdef else None
+
+
+async def estimated_rows(conn: asyncpg.Connection) -> int:
+    """Planner row estimate for embeddings - cheap, unlike count(*)"""
+    estimate = await conn.fetchval("SELECT reltuples::bigint FROM pg_class WHERE relname = 'embeddings'")
+    return max(int(estimate or 0), 0)
+
+
+async def partitioned_users(conn: asyncpg.Connection) -> Set[int]:
+    """Users that have a per-user partial ANN index"""
+    rows = await conn.fetch(
+        """
+        SELECT i.indexname FROM pg_indexes i
+        JOIN pg_class c ON c.relname = i.indexname
+        JOIN pg_index x ON x.indexrelid = c.oid
+        WHERE i.tablename = 'embeddings' AND i.indexname LIKE 'embeddings\\_user\\_%' AND x.indisvalid
+        """
+    )
+    users = set()
+    for row in rows:
+        name = row["indexname"]
+        if name.endswith(PARTITION_SUFFIX):
+            users.add(int(name[len(PARTITION_PREFIX):-len(PARTITION_SUFFIX)]))
+    return users
+
+
+async def supports_iterative_scan(conn: asyncpg.Connection) -> bool:
+    """pgvector 0.8+ can keep scanning the index until enough rows pass a filter"""
+    version = await conn.fetchval("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+    if not version:
+        return False
+    major, minor = (int(part) for part in version.split(".")[:2])
+    return (major, minor) >= (0, 8)
+
+
+@dataclass
+class IndexState:
+    """Cached view of the ANN indexes, so planning does not hit the catalog per search"""
+    params: Optional[IndexParams]
+    partitioned_users: Set[int]
+    iterative_scan: bool
+
+
+_cached: Tuple[float, Optional[IndexState]] = (0.0, None)
+
+
+async def index_state(conn: asyncpg.Connection) -> IndexState:
+    """Live index state, refreshed at most once a minute"""
+    global _cached
+    checked_at, state = _cached
+    if state is None or time.monotonic() - checked_at > 60:
+        state = IndexState(
+            params=await current_index(conn),
+            partitioned_users=await partitioned_users(conn),
+            iterative_scan=await supports_iterative_scan(conn),
+        )
+        _cached = (time.monotonic(), state)
+    return state
+
+
+def _interpolate(curve: List[Tuple[float, float]], x: float) -> float:
+    if x <= curve[0][0]:
+        return curve[0][1]
+    for (x0, y0), (x1, y1) in zip(curve, curve[1:]):
+        if x <= x1:
+            return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+    return curve[-1][1]
+
+
+def query_settings(
+    params: Optional[IndexParams],
+    recall_target: float,
+    k: int,
+    selectivity: float = 1.0,
+) -> List[Tuple[str, int]]:
+    """
+    GUC values that give roughly the requested recall for a top-k query
+    With a filter that keeps only a fraction of rows, the index is searched
+    wider by 1 / selectivity so enough candidates survive the filter
+    """
+    if params is None:
+        return []
+    widen = 1 / max(selectivity, 0.001)
+    if params.method == "ivfflat":
+        probes = math.ceil(params.lists * _interpolate(IVFFLAT_PROBE_CURVE, recall_target) * widen)
+        return [("ivfflat.probes", min(max(probes, 1), params.lists))]
+    ef_search = math.ceil(k * _interpolate(HNSW_EF_CURVE, recall_target) * widen)
+    return [("hnsw.ef_search", min(max(ef_search, k, 10), 1000))]
+
+
+async def tune_query(
+    conn: asyncpg.Connection,
+    recall_target: float,
+    k: int,
+    selectivity: float = 1.0,
+    params: Optional[IndexParams] = None,
+) -> None:
+    """Apply per-query ANN settings; must run inside the search transaction"""
+    state = await index_state(conn)
+    params = params or state.params
+    for name, value in query_settings(params, recall_target, k, selectivity):
+        # SET does not take bind parameters; value is always an int from query_settings
+        await conn.execute(f"SET LOCAL {name} = {int(value)}")
+    if selectivity < 1.0 and state.iterative_scan and params is not None:
+        await conn.execute(f"SET LOCAL {params.method}.iterative_scan = relaxed_order")
+
+
+async def ensure_index() -> bool:
+    """
+    Build or rebuild the ANN index if the corpus has outgrown it
+    Runs on a dedicated connection since a concurrent build can take hours;
+    returns True if a rebuild happened
+    """
+    conn = await asyncpg.connect(dsn=settings.DATABASE_URL)
+    try:
+        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", REBUILD_LOCK_ID):
+            return False
+        try:
+            rows = await estimated_rows(conn)
+            current = await current_index(conn)
+            target = choose_params(rows)
+            if not needs_rebuild(current, target):
+                return False
+
+            logger.info(f"Rebuilding vector index for ~{rows} rows: {current} -> {target}")
+            started = time.monotonic()
+            # A crashed concurrent build leaves an INVALID index behind
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {BUILD_NAME}")
+            await conn.execute(f"SET maintenance_work_mem = '{settings.VECTOR_INDEX_BUILD_MEMORY}'")
+            await conn.execute(target.ddl(BUILD_NAME))
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}")
+            await conn.execute(f"ALTER INDEX {BUILD_NAME} RENAME TO {INDEX_NAME}")
+            logger.info(f"Vector index rebuilt in {time.monotonic() - started:.0f}s")
+            return True
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", REBUILD_LOCK_ID)
+    finally:
+        await conn.close()
+
+
+# Per-user partial indexes are always HNSW with these parameters
+PARTITION_PARAMS = IndexParams(method="hnsw", m=16, ef_construction=64)
+
+
+def partition_name(user_id: int) -> str:
+    return f"{PARTITION_PREFIX}{int(user_id)}{PARTITION_SUFFIX}"
+
+
+async def ensure_partitions() -> List[int]:
+    """
+    Create partial HNSW indexes for users with many chunks but a small share
+    of the corpus - the case where a filtered global ANN scan loses recall
+    Returns the users that got a new index
+    """
+    conn = await asyncpg.connect(dsn=settings.DATABASE_URL)
+    created = []
+    try:
+        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", REBUILD_LOCK_ID):
+            return created
+        try:
+            total = await estimated_rows(conn)
+            existing = await partitioned_users(conn)
+            candidates = await documents_repo.users_with_chunks(settings.SEARCH_PARTITION_MIN_CHUNKS, conn=conn)
+            await conn.execute(f"SET maintenance_work_mem = '{settings.VECTOR_INDEX_BUILD_MEMORY}'")
+            for row in candidates:
+                user_id = row["user_id"]
+                if user_id is None or user_id in existing:
+                    continue
+                if total and row["chunks"] / total >= settings.SEARCH_FILTERED_MIN_SELECTIVITY:
+                    continue
+                name = partition_name(user_id)
+                logger.info(f"Creating partial vector index {name} for {row['chunks']} chunks")
+                await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                await conn.execute(f"{PARTITION_PARAMS.ddl(name)} WHERE user_id = {int(user_id)}")
+                created.append(user_id)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", REBUILD_LOCK_ID)
+    finally:
+        await conn.close()
+    return created
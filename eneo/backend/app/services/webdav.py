@@ -0,0 +1,297 @@
+"""
+Nextcloud WebDAV client
+
+Directory listings are parsed incrementally: the multistatus body is fed to
+an XMLPullParser as it streams in, and each <d:response> is turned into an
+entry and cleared, so a folder with tens of thousands of entries never sits
+in memory as one XML tree.
+"""
+
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote, urlparse
+import logging
+import xml.etree.ElementTree as ET
+
+import httpx
+
+from app.config import settings
+from app.services.http_client import DEFAULT_LANE, get_http_client
+
+logger = logging.getLogger(__name__)
+
+
+class WebDAVError(Exception):
+    """Raised when a WebDAV request fails"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+DAV_NS = "{DAV:}"
+OC_NS = "{http://owncloud.org/ns}"
+
+LIST_PROPS = """
+    <d:getetag/>
+    <d:getlastmodified/>
+    <d:getcontentlength/>
+    <d:getcontenttype/>
+    <d:resourcetype/>
+    <d:sync-token/>
+    <oc:fileid/>
+    <oc:size/>"""
+
+LIST_PROPFIND_BODY = f"""<?xml version="1.0"?>
+<d:propfind xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns">
+  <d:prop>{LIST_PROPS}
+  </d:prop>
+</d:propfind>"""
+
+SYNC_COLLECTION_BODY = """<?xml version="1.0"?>
+<d:sync-collection xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns">
+  <d:sync-token>{sync_token}</d:sync-token>
+  <d:sync-level>{level}</d:sync-level>
+  <d:prop>{props}
+  </d:prop>
+</d:sync-collection>"""
+
+
+class SyncNotSupported(Exception):
+    """The server does not support sync-collection for this folder, or the sync token expired"""
+
+
+@dataclass
+class FileInfo:
+    """File metadata from a WebDAV PROPFIND"""
+    etag: Optional[str]
+    modified: Optional[datetime]
+    size: Optional[int]
+    file_id: Optional[str]
+
+
+@dataclass
+class DirEntry:
+    """One member of a WebDAV collection"""
+    path: str  # Nextcloud path, folders with a trailing slash
+    name: str
+    is_dir: bool
+    etag: Optional[str] = None
+    modified: Optional[datetime] = None
+    size: Optional[int] = None
+    content_type: Optional[str] = None
+    file_id: Optional[str] = None
+    sync_token: Optional[str] = None
+    deleted: bool = False  # reported as removed by sync-collection
+
+
+def webdav_url(file_path: str) -> str:
+    """Build the WebDAV URL for a Nextcloud file path"""
+    return f"{settings.NEXTCLOUD_WEBDAV_URL}/{quote(file_path.lstrip('/'))}"
+
+
+def path_from_href(href: str) -> str:
+    """Nextcloud path for an href in a multistatus response"""
+    path = unquote(urlparse(href).path)
+    prefix = settings.NEXTCLOUD_WEBDAV_PATH.rstrip("/")
+    if path.startswith(prefix):
+        path = path[len(prefix):]
+    return path or "/"
+
+
+def normalize_folder(path: str) -> str:
+    """Folder paths are compared with a leading and trailing slash"""
+    return "/" + path.strip("/") + "/" if path.strip("/") else "/"
+
+
+def _parse_response(element: ET.Element) -> Optional[DirEntry]:
+    href = element.findtext(f"{DAV_NS}href")
+    if not href:
+        return None
+    path = path_from_href(href)
+    name = path.rstrip("/").rsplit("/", 1)[-1]
+
+    status = element.findtext(f"{DAV_NS}status")
+    if status and " 404 " in status:
+        return DirEntry(path=path, name=name, is_dir=path.endswith("/"), deleted=True)
+
+    # Only the propstat with 200 OK carries values; missing props come back as 404
+    prop = None
+    for propstat in element.findall(f"{DAV_NS}propstat"):
+        if " 200 " in (propstat.findtext(f"{DAV_NS}status") or ""):
+            prop = propstat.find(f"{DAV_NS}prop")
+            break
+    if prop is None:
+        return DirEntry(path=path, name=name, is_dir=path.endswith("/"))
+
+    def text(tag: str) -> Optional[str]:
+        value = prop.findtext(tag)
+        return value if value else None
+
+    resourcetype = prop.find(f"{DAV_NS}resourcetype")
+    is_dir = resourcetype is not None and resourcetype.find(f"{DAV_NS}collection") is not None
+    modified = text(f"{DAV_NS}getlastmodified")
+    size = text(f"{DAV_NS}getcontentlength") or text(f"{OC_NS}size")
+    return DirEntry(
+        path=path,
+        name=name,
+        is_dir=is_dir,
+        etag=text(f"{DAV_NS}getetag"),
+        modified=parsedate_to_datetime(modified).replace(tzinfo=None) if modified else None,
+        size=int(size) if size else None,
+        content_type=text(f"{DAV_NS}getcontenttype"),
+        file_id=text(f"{OC_NS}fileid"),
+        sync_token=text(f"{DAV_NS}sync-token"),
+    )
+
+
+async def _iter_multistatus(response) -> AsyncIterator[Tuple[Optional[DirEntry], Optional[str]]]:
+    """
+    Parse a streamed multistatus body
+    Yields (entry, None) per <d:response> and (None, token) for a top-level <d:sync-token>
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    depth = 0
+    async for chunk in response.aiter_bytes(settings.WEBDAV_CHUNK_SIZE):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            # Only direct children of <d:multistatus> are complete records
+            if depth != 1:
+                continue
+            if element.tag == f"{DAV_NS}response":
+                entry = _parse_response(element)
+                if entry is not None:
+                    yield entry, None
+            elif element.tag == f"{DAV_NS}sync-token":
+                yield None, element.text
+            element.clear()
+    parser.close()
+
+
+async def iter_directory(folder_path: str, access_token: str) -> AsyncIterator[DirEntry]:
+    """
+    List a folder with a Depth: 1 PROPFIND, yielding entries as they are parsed
+    The first entry is the folder itself, carrying its ETag and sync token
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Depth": "1",
+        "Content-Type": "application/xml",
+    }
+    url = webdav_url(normalize_folder(folder_path))
+    async with get_http_client().stream("PROPFIND", url, headers=headers, content=LIST_PROPFIND_BODY) as response:
+        if response.status_code != 207:
+            raise WebDAVError(response.status_code, f"WebDAV PROPFIND {folder_path} failed: {response.status_code}")
+        async for entry, _ in _iter_multistatus(response):
+            yield entry
+
+
+async def sync_collection(
+    folder_path: str,
+    access_token: str,
+    sync_token: str,
+    depth: str = "1",
+) -> Tuple[List[DirEntry], str]:
+    """
+    Members changed or removed since sync_token (RFC 6578), and the new token
+    depth is the sync-level: "1" for direct members, "infinite" for the subtree
+    Raises SyncNotSupported when the server cannot answer from this token
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/xml",
+    }
+    body = SYNC_COLLECTION_BODY.format(sync_token=sync_token, level=depth, props=LIST_PROPS)
+    url = webdav_url(normalize_folder(folder_path))
+    changes: List[DirEntry] = []
+    new_token = None
+    async with get_http_client().stream("REPORT", url, headers=headers, content=body) as response:
+        if response.status_code in (400, 403, 405, 409, 415, 501, 507):
+            raise SyncNotSupported(f"sync-collection on {folder_path} returned {response.status_code}")
+        if response.status_code != 207:
+            raise WebDAVError(response.status_code, f"WebDAV REPORT {folder_path} failed: {response.status_code}")
+        async for entry, token in _iter_multistatus(response):
+            if token is not None:
+                new_token = token
+            elif entry.path != normalize_folder(folder_path):
+                changes.append(entry)
+    if new_token is None:
+        raise SyncNotSupported(f"sync-collection on {folder_path} returned no sync token")
+    return changes, new_token
+
+
+async def stat_entry(path: str, access_token: str) -> DirEntry:
+    """A file or folder's own properties with a Depth: 0 PROPFIND"""
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Depth": "0",
+        "Content-Type": "application/xml",
+    }
+    response = await get_http_client().request(
+        "PROPFIND", webdav_url(path), headers=headers, content=LIST_PROPFIND_BODY
+    )
+    if response.status_code != 207:
+        raise WebDAVError(response.status_code, f"WebDAV PROPFIND {path} failed: {response.status_code}")
+    element = ET.fromstring(response.content).find(f"{DAV_NS}response")
+    entry = _parse_response(element) if element is not None else None
+    if entry is None:
+        raise WebDAVError(response.status_code, f"WebDAV PROPFIND {path} returned no entry")
+    return entry
+
+
+async def stat_file(file_path: str, access_token: str) -> FileInfo:
+    """Fetch ETag, modification time, size and Nextcloud file id with a Depth: 0 PROPFIND"""
+    entry = await stat_entry(file_path, access_token)
+    return FileInfo(etag=entry.etag, modified=entry.modified, size=entry.size, file_id=entry.file_id)
+
+
+# Statuses a proxied GET may legitimately return once Range and conditional
+# headers are passed through
+PROXY_STATUSES = {200, 206, 304, 412, 416}
+
+
+@asynccontextmanager
+async def open_file(
+    file_path: str,
+    access_token: str,
+    headers: Optional[Dict[str, str]] = None,
+    lane: str = DEFAULT_LANE,
+) -> AsyncIterator[httpx.Response]:
+    """
+    GET a file and yield the response with its body not yet read
+    headers may carry Range and If-* headers, in which case the response can
+    be 206, 304, 412 or 416 as well as 200; other statuses raise WebDAVError.
+    Downloads relayed to a client pass lane=DOWNLOAD_LANE.
+    """
+    request_headers = {**(headers or {}), "Authorization": f"Bearer {access_token}"}
+    timeout = httpx.Timeout(settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT, read=120.0)
+    async with get_http_client().stream(
+        "GET", webdav_url(file_path), headers=request_headers, timeout=timeout, lane=lane
+    ) as response:
+        if response.status_code not in PROXY_STATUSES:
+            raise WebDAVError(response.status_code, f"WebDAV GET {file_path} failed: {response.status_code}")
+        yield response
+
+
+async def stream_file(
+    file_path: str,
+    access_token: str,
+    chunk_size: int | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Download a file from Nextcloud as a stream of byte chunks
+    Only one chunk is held in memory at a time
+    """
+    chunk_size = chunk_size or settings.WEBDAV_CHUNK_SIZE
+    async with open_file(file_path, access_token) as response:
+        if response.status_code != 200:
+            raise WebDAVError(response.status_code, f"WebDAV GET {file_path} failed: {response.status_code}")
+        async for chunk in response.aiter_bytes(chunk_size):
+            yield chunk
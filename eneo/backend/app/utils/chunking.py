@@ -0,0 +1,226 @@
+"""
+Structure-aware text chunking
+
+Text is split into blocks at blank lines (headings, paragraphs, lists and
+tables), blocks into units (sentences, list items, table rows), and units are
+packed into chunks of at most max_tokens model tokens:
+
+- a heading always starts a new chunk, so sections are not mixed
+- a chunk only ends inside a sentence if that sentence alone is too long
+- consecutive chunks of a section share up to overlap_tokens of whole units
+
+Boundaries are content-defined. Once a chunk holds min_tokens, it ends after
+any unit whose hash falls below a threshold proportional to the unit's size.
+Whether a unit qualifies depends only on its own text, so an edit changes the
+chunks around it and the boundaries after it fall back into step at the next
+qualifying unit. Chunks elsewhere keep their exact text, and with it their
+chunk hash, so their embeddings are reused on re-indexing.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional
+import hashlib
+import math
+import re
+
+BLOCK_BREAK = re.compile(r"\n[ \t]*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+(?=[\"'(\[«»]?[A-ZÅÄÖ0-9])")
+MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+\S")
+BULLET = re.compile(r"^\s*(?:[-*•–]|\d+[.)])\s+")
+TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$|\S \| \S")
+
+# Characters held while waiting for a blank line before a block is cut anyway
+MAX_BUFFER = 64 * 1024
+MAX_HEADING_WORDS = 12
+
+
+def approximate_tokens(text: str) -> int:
+    """Rough WordPiece token count, for when no tokenizer is available"""
+    return math.ceil(len(text) / 3.5)
+
+
+@dataclass
+class _Unit:
+    text: str
+    tokens: int
+    separator: str  # put before the unit when it follows another in a chunk
+    heading: bool = False
+    block_end: bool = False
+
+
+def _is_heading(line: str) -> bool:
+    if MARKDOWN_HEADING.match(line):
+        return True
+    words = line.split()
+    return (
+        0 < len(words) <= MAX_HEADING_WORDS
+        and (line[0].isupper() or line[0].isdigit())
+        and any(char.isalpha() for char in line)
+        and line.rstrip()[-1] not in ".,;:!?"
+        and not BULLET.match(line)
+    )
+
+
+class TextChunker:
+    """
+    Splits a stream of text into chunks of at most max_tokens tokens
+    Text is fed piece by piece; only the unfinished block and chunk are buffered
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        overlap_tokens: int,
+        count_tokens: Optional[Callable[[str], int]] = None,
+        min_tokens: Optional[int] = None,
+    ):
+        if overlap_tokens >= max_tokens // 2:
+            raise ValueError("overlap_tokens must be less than half of max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min_tokens if min_tokens is not None else max_tokens // 4
+        self.count_tokens = count_tokens or approximate_tokens
+        # Expected tokens past min_tokens before a boundary is drawn
+        self._boundary_span = max((max_tokens - self.min_tokens) / 2, 1)
+        self._buffer = ""
+        self._units: List[_Unit] = []
+        self._tokens = 0
+        self._carried = 0  # leading units repeated from the previous chunk
+
+    def feed(self, text: str) -> Iterator[str]:
+        """Add text and yield every chunk that is now complete"""
+        self._buffer += text
+        last_break = None
+        for last_break in BLOCK_BREAK.finditer(self._buffer):
+            pass
+        if last_break is not None:
+            complete, self._buffer = self._buffer[:last_break.start()], self._buffer[last_break.end():]
+            for block in BLOCK_BREAK.split(complete):
+                yield from self._add_block(block)
+        elif len(self._buffer) > MAX_BUFFER:
+            # No blank line in sight (e.g. a text file without paragraphs): cut at a line or word break
+            cut = max(self._buffer.rfind("\n"), self._buffer.rfind(" "))
+            if cut <= 0:
+                cut = len(self._buffer)
+            block, self._buffer = self._buffer[:cut], self._buffer[cut:]
+            yield from self._add_block(block)
+
+    def flush(self) -> Iterator[str]:
+        """Yield whatever remains"""
+        buffer, self._buffer = self._buffer, ""
+        for block in BLOCK_BREAK.split(buffer):
+            yield from self._add_block(block)
+        if self._units:
+            yield from self._emit(overlap=False)
+
+    # Blocks -> units
+
+    def _add_block(self, block: str) -> Iterator[str]:
+        lines = [line.strip() for line in block.strip().splitlines() if line.strip()]
+        if not lines:
+            return
+        if MARKDOWN_HEADING.match(lines[0]) or (len(lines) == 1 and _is_heading(lines[0])):
+            heading = lines.pop(0)
+            yield from self._add(_Unit(heading, self.count_tokens(heading), "\n\n", heading=True, block_end=True))
+            if not lines:
+                return
+
+        if sum(1 for line in lines if TABLE_ROW.search(line)) * 2 >= len(lines):
+            units = self._rows(lines, "\n")
+        elif sum(1 for line in lines if BULLET.match(line)) * 2 >= len(lines):
+            units = [unit for line in lines for unit in self._sentences(line, "\n")]
+        else:
+            units = self._sentences(" ".join(lines), " ")
+
+        units[0].separator = "\n\n"
+        units[-1].block_end = True
+        for unit in units:
+            yield from self._add(unit)
+
+    def _rows(self, lines: List[str], separator: str) -> List[_Unit]:
+        units = []
+        for line in lines:
+            tokens = self.count_tokens(line)
+            if tokens > self.max_tokens:
+                units.extend(self._split_words(line, separator))
+            else:
+                units.append(_Unit(line, tokens, separator))
+        return units
+
+    def _sentences(self, text: str, separator: str) -> List[_Unit]:
+        units = []
+        for index, sentence in enumerate(SENTENCE_END.split(text)):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            tokens = self.count_tokens(sentence)
+            # Sentences after the first of a list item continue it on the same line
+            unit_separator = separator if index == 0 else " "
+            if tokens > self.max_tokens:
+                units.extend(self._split_words(sentence, unit_separator))
+            else:
+                units.append(_Unit(sentence, tokens, unit_separator))
+        return units
+
+    def _split_words(self, text: str, separator: str) -> List[_Unit]:
+        """Windows of whole words for a sentence or row longer than a chunk"""
+        units = []
+        words: List[str] = []
+        tokens = 0
+        for word in text.split():
+            # WordPiece tokenizes word by word, so per-word counts add up
+            word_tokens = self.count_tokens(word)
+            if words and tokens + word_tokens > self.max_tokens:
+                units.append(_Unit(" ".join(words), tokens, separator if not units else " "))
+                words, tokens = [], 0
+            words.append(word)
+            tokens += word_tokens
+        if words:
+            units.append(_Unit(" ".join(words), tokens, separator if not units else " "))
+        return units
+
+    # Units -> chunks
+
+    def _is_boundary(self, unit: _Unit) -> bool:
+        digest = hashlib.blake2b(unit.text.encode("utf-8"), digest_size=8).digest()
+        draw = int.from_bytes(digest, "big") / 2 ** 64
+        # Block ends are twice as likely to close a chunk as sentences mid-paragraph
+        weight = 2 if unit.block_end else 1
+        return draw < weight * unit.tokens / self._boundary_span
+
+    def _add(self, unit: _Unit) -> Iterator[str]:
+        if unit.heading:
+            # Consecutive headings stay together with the text that follows
+            if any(not existing.heading for existing in self._units):
+                yield from self._emit(overlap=False)
+        elif self._tokens + unit.tokens > self.max_tokens:
+            yield from self._emit(overlap=True)
+            while self._units and self._tokens + unit.tokens > self.max_tokens:
+                self._tokens -= self._units.pop(0).tokens
+                self._carried -= 1
+
+        self._units.append(unit)
+        self._tokens += unit.tokens
+        if not unit.heading and self._tokens >= self.min_tokens and self._is_boundary(unit):
+            yield from self._emit(overlap=True)
+
+    def _emit(self, overlap: bool) -> Iterator[str]:
+        units = self._units
+        if len(units) == self._carried:
+            # Nothing new since the last chunk
+            self._units, self._tokens, self._carried = [], 0, 0
+            return
+        text = units[0].text + "".join(unit.separator + unit.text for unit in units[1:])
+
+        carried: List[_Unit] = []
+        if overlap:
+            tokens = 0
+            for unit in reversed(units[1:]):
+                if unit.heading or tokens + unit.tokens > self.overlap_tokens:
+                    break
+                carried.insert(0, unit)
+                tokens += unit.tokens
+        self._units = carried
+        self._tokens = sum(unit.tokens for unit in carried)
+        self._carried = len(carried)
+        yield text
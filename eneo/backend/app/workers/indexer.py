@@ -0,0 +1,178 @@
+"""
+Indexing worker - processes batch indexing tasks outside the API processes
+and keeps folders granted for indexing in sync with Nextcloud
+
+Run with: python -m app.workers.indexer
+"""
+
+import asyncio
+import logging
+import signal
+
+from prometheus_client import start_http_server
+
+from app.config import settings
+from app.services import database, embeddings, extraction, http_client, jobs, logs, metrics, redis_client, sync, vector_index
+from app.services.extraction import ExtractionError, UnsupportedFileType
+from app.services.ingestion import index_file
+from app.services.sessions import get_latest_session
+from app.services.tokens import TokenRefreshError
+from app.services.webdav import WebDAVError
+
+logs.configure_logging()
+logger = logging.getLogger(__name__)
+
+# WebDAV statuses that will not succeed on retry
+PERMANENT_WEBDAV_ERRORS = {403, 404, 405, 410}
+
+
+async def _keep_lease(task: jobs.IndexTask) -> None:
+    """Renew the task lease while indexing is in progress"""
+    while True:
+        await asyncio.sleep(settings.INDEX_TASK_LEASE / 3)
+        await jobs.extend_lease(task)
+
+
+async def process_task(task: jobs.IndexTask) -> None:
+    """Index one file and record the outcome"""
+    logs.request_id.set(f"task-{task.id}")
+    session = await get_latest_session(task.user_id)
+    if session is None:
+        await jobs.fail_task(task, "No active session with an access token for user")
+        return
+
+    lease = asyncio.create_task(_keep_lease(task))
+    try:
+        result = await index_file(session, task.file_path)
+    except UnsupportedFileType as e:
+        await jobs.fail_task(task, str(e), retryable=False)
+    except ExtractionError as e:
+        await jobs.fail_task(task, str(e), retryable=e.retryable)
+    except TokenRefreshError as e:
+        # Retried with backoff; a fresh login gives the user a new session
+        await jobs.fail_task(task, str(e))
+    except WebDAVError as e:
+        await jobs.fail_task(task, str(e), retryable=e.status_code not in PERMANENT_WEBDAV_ERRORS)
+    except Exception as e:
+        logger.exception(f"Indexing {task.file_path} failed")
+        await jobs.fail_task(task, f"{type(e).__name__}: {e}")
+    else:
+        await jobs.complete_task(task, result.document_id, result.chunks)
+    finally:
+        lease.cancel()
+
+
+async def worker_loop(stop: asyncio.Event, slot: int) -> None:
+    """Claim and process tasks until asked to stop"""
+    while not stop.is_set():
+        try:
+            task = await jobs.claim_task()
+        except Exception:
+            logger.exception(f"Worker slot {slot} failed to claim a task")
+            task = None
+
+        if task is None:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=settings.INDEX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        logger.info(f"Slot {slot} indexing {task.file_path} (task {task.id}, attempt {task.attempts})")
+        try:
+            await process_task(task)
+        except Exception:
+            # Recording the outcome failed; the task is requeued when its lease expires
+            logger.exception(f"Worker slot {slot} failed to process task {task.id}")
+
+
+async def maintenance_loop(stop: asyncio.Event) -> None:
+    """Periodically requeue tasks abandoned by crashed workers"""
+    while not stop.is_set():
+        try:
+            await jobs.requeue_abandoned_tasks()
+        except Exception:
+            logger.exception("Failed to requeue abandoned tasks")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=60)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def index_maintenance_loop(stop: asyncio.Event) -> None:
+    """Periodically resize the vector index and per-user partitions to match the corpus"""
+    while not stop.is_set():
+        try:
+            await vector_index.ensure_index()
+            await vector_index.ensure_partitions()
+        except Exception:
+            logger.exception("Vector index maintenance failed")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.VECTOR_INDEX_CHECK_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def sync_loop(stop: asyncio.Event) -> None:
+    """Periodically queue changes below the paths users granted for indexing"""
+    while not stop.is_set():
+        try:
+            await sync.sync_all()
+        except Exception:
+            logger.exception("Sync pass failed")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.SYNC_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def metrics_loop(stop: asyncio.Event) -> None:
+    """Periodically refresh the queue and pool gauges"""
+    while not stop.is_set():
+        try:
+            for state, count in (await jobs.queue_depth()).items():
+                metrics.INDEX_QUEUE_DEPTH.labels(state).set(count)
+            metrics.record_pool_gauges()
+        except Exception:
+            logger.exception("Failed to sample queue depth")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.HEALTH_SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main() -> None:
+    """Run the worker pool until SIGTERM/SIGINT"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await database.init_pool()
+    await database.apply_migrations()
+    await redis_client.init_redis()
+    await http_client.init_http_client()
+    await embeddings.start_embedding_service()
+    extraction.start_extraction_pool()
+    if settings.WORKER_METRICS_PORT:
+        start_http_server(settings.WORKER_METRICS_PORT)
+    logger.info(f"Indexing worker started with {settings.INDEX_WORKER_CONCURRENCY} slots")
+    try:
+        await asyncio.gather(
+            maintenance_loop(stop),
+            index_maintenance_loop(stop),
+            sync_loop(stop),
+            metrics_loop(stop),
+            *(worker_loop(stop, slot) for slot in range(settings.INDEX_WORKER_CONCURRENCY)),
+        )
+    finally:
+        extraction.stop_extraction_pool()
+        await embeddings.stop_embedding_service()
+        await http_client.close_http_client()
+        await redis_client.close_redis()
+        await database.close_pool()
+        logger.info("Indexing worker stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+"""
+Helpers shared by the benchmark scripts
+"""
+
+from typing import List, Sequence
+import random
+
+SUBJECTS = [
+    "Kommunfullmäktige", "Kommunstyrelsen", "Miljönämnden", "Barn- och utbildningsnämnden",
+    "Socialnämnden", "Stadsbyggnadsnämnden", "Kultur- och fritidsnämnden", "Revisionen",
+]
+VERBS = ["beslutar att", "föreslår att", "har utrett om", "återremitterar frågan om", "godkänner att"]
+OBJECTS = [
+    "anta klimatplanen för perioden 2024-2030", "utöka budgeten för gång- och cykelvägar",
+    "revidera riktlinjerna för upphandling", "bygga en ny förskola i Skönsberg",
+    "sänka energianvändningen i kommunens lokaler", "se över taxan för bygglov",
+    "inrätta ett råd för funktionshinderfrågor", "förlänga avtalet om kollektivtrafik",
+]
+TAILS = [
+    "Ärendet har diarienummer KS-{year}-{number}.", "Beslutet gäller från den 1 januari {year}.",
+    "Kostnaden beräknas till {number} tkr per år.", "Se bilaga {number} för underlag.",
+    "Yttrandet ska lämnas senast {number} dagar efter beslut.", "Paragraf {number} justerades omedelbart.",
+]
+
+
+def sentence(rng: random.Random) -> str:
+    """One municipal-minutes style sentence"""
+    tail = rng.choice(TAILS).format(year=rng.randint(2015, 2025), number=rng.randint(1, 999))
+    return f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)}. {tail}"
+
+
+def paragraphs(count: int, sentences: int = 6, seed: int = 0) -> List[str]:
+    """count paragraphs of distinct text, about 60 model tokens per two sentences"""
+    rng = random.Random(seed)
+    return [" ".join(sentence(rng) for _ in range(sentences)) for _ in range(count)]
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile, 0 for no values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def print_table(headers: Sequence[str], rows: Sequence[Sequence]) -> None:
+    """Print rows as an aligned plain-text table"""
+    cells = [[str(header) for header in headers]] + [
+        [f"{value:.2f}" if isinstance(value, float) else str(value) for value in row] for row in rows
+    ]
+    widths = [max(len(row[column]) for row in cells) for column in range(len(headers))]
+    for index, row in enumerate(cells):
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+        if index == 0:
+            print("  ".join("-" * width for width in widths))
@@ -0,0 +1,129 @@
+"""
+Chunking throughput and edit stability on large structured documents
+
+Generates municipal-style documents of the requested sizes (headings,
+paragraphs, bullet lists and tables), feeds each to TextChunker in
+WEBDAV_CHUNK_SIZE pieces as ingestion does, and reports MB/s, the number of
+chunks and their average and largest size in tokens. It then inserts one
+sentence at a few random places in the smallest document and counts how many
+chunks are new after each edit, the chunks that would be re-embedded on
+re-indexing.
+
+    python -m benchmarks.chunking
+    python -m benchmarks.chunking --megabytes 1,10,100 --tokenizer
+
+Token counts are approximated from the text length unless --tokenizer is
+given, which loads the tokenizer of EMBEDDING_MODEL (downloaded on first use)
+and counts real model tokens, as indexing does. The approximation rounds per
+sentence, so recounting a whole chunk can come out a token or two above
+CHUNK_MAX_TOKENS; model token counts add up and stay within it.
+"""
+
+from typing import Callable, List, Optional
+import argparse
+import random
+import time
+
+from app.config import settings
+from app.utils.chunking import TextChunker, approximate_tokens
+from benchmarks._common import paragraphs, print_table, sentence
+
+MB = 1024 * 1024
+
+
+def document(size: int, seed: int = 0) -> str:
+    """About size characters of headings, paragraphs, lists and tables"""
+    rng = random.Random(seed)
+    texts = iter(paragraphs(size // 300 + 10, sentences=rng.randint(3, 8), seed=seed))
+    blocks: List[str] = []
+    length = 0
+    section = 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.1:
+            section += 1
+            block = f"{section} {rng.choice(['Bakgrund', 'Förslag till beslut', 'Ekonomi', 'Yttranden'])}"
+        elif kind < 0.2:
+            block = "\n".join(f"- {sentence(rng)}" for _ in range(rng.randint(3, 8)))
+        elif kind < 0.27:
+            rows = [f"| Nämnd | Budget {rng.randint(2020, 2025)} | Utfall |", "|---|---|---|"]
+            rows += [f"| Nämnd {index} | {rng.randint(100, 99999)} tkr | {rng.randint(100, 99999)} tkr |"
+                     for index in range(rng.randint(5, 40))]
+            block = "\n".join(rows)
+        else:
+            block = next(texts, None) or " ".join(sentence(rng) for _ in range(6))
+        blocks.append(block)
+        length += len(block) + 2
+    return "\n\n".join(blocks)
+
+
+def chunk(text: str, count_tokens: Callable[[str], int]) -> List[str]:
+    chunker = TextChunker(settings.CHUNK_MAX_TOKENS, settings.CHUNK_OVERLAP_TOKENS, count_tokens=count_tokens)
+    chunks: List[str] = []
+    for start in range(0, len(text), settings.WEBDAV_CHUNK_SIZE):
+        chunks.extend(chunker.feed(text[start:start + settings.WEBDAV_CHUNK_SIZE]))
+    chunks.extend(chunker.flush())
+    return chunks
+
+
+def insert_sentence(text: str, rng: random.Random) -> str:
+    """text with one new sentence after a random sentence end"""
+    position = text.find(". ", rng.randrange(len(text)))
+    if position < 0:
+        position = text.find(". ")
+    return f"{text[:position + 2]}{sentence(rng)} {text[position + 2:]}"
+
+
+def load_tokenizer() -> Callable[[str], int]:
+    # The same fast tokenizer EmbeddingService counts with
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(settings.EMBEDDING_MODEL).backend_tokenizer
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--megabytes", type=lambda value: [float(size) for size in value.split(",")],
+                        default=[1, 10, 50])
+    parser.add_argument("--tokenizer", action="store_true", help="count real model tokens")
+    parser.add_argument("--edits", type=int, default=10, help="single-sentence edits to test for stability")
+    args = parser.parse_args()
+
+    count_tokens = load_tokenizer() if args.tokenizer else approximate_tokens
+    rows = []
+    smallest: Optional[str] = None
+    for megabytes in sorted(args.megabytes):
+        text = document(int(megabytes * MB))
+        smallest = smallest or text
+        started = time.perf_counter()
+        chunks = chunk(text, count_tokens)
+        elapsed = time.perf_counter() - started
+        sizes = [count_tokens(text) for text in chunks]
+        rows.append((
+            f"{len(text.encode('utf-8')) / MB:.1f}",
+            len(text.encode("utf-8")) / MB / elapsed,
+            len(chunks),
+            sum(sizes) / len(sizes),
+            max(sizes),
+        ))
+
+    print(
+        f"max {settings.CHUNK_MAX_TOKENS} tokens, overlap {settings.CHUNK_OVERLAP_TOKENS}, "
+        f"{'model tokenizer' if args.tokenizer else 'approximate token counts'}"
+    )
+    print_table(["MB", "MB/s", "chunks", "avg tokens", "max tokens"], rows)
+
+    rng = random.Random(1)
+    original = chunk(smallest, count_tokens)
+    known = set(original)
+    changed = [sum(1 for text in chunk(insert_sentence(smallest, rng), count_tokens) if text not in known)
+               for _ in range(args.edits)]
+    print(
+        f"\nOne inserted sentence in {len(original)} chunks: "
+        f"{sum(changed) / len(changed):.1f} chunks changed on average, {max(changed)} at most"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Embedding throughput by micro-batch size
+
+Loads the embedding model once through EmbeddingService, then runs one round
+per EMBEDDING_MAX_BATCH_SIZE value. In each round, indexing-style callers
+embed EMBEDDING_BATCH_SIZE chunks per call and search-style callers embed one
+query at a time, all concurrently, for a fixed duration. Reported per round:
+chunks embedded per second, the average batch the model actually received,
+and query latency percentiles.
+
+    python -m benchmarks.embedding_batch
+    python -m benchmarks.embedding_batch --batch-sizes 1,16,64,256 --indexers 4 --seconds 30
+
+Uses EMBEDDING_MODEL (downloaded on first use) on whatever device
+sentence-transformers picks; run on the hardware you want numbers for.
+"""
+
+from typing import List
+import argparse
+import asyncio
+import time
+
+from app.config import settings
+from app.services.embeddings import EmbeddingService
+from benchmarks._common import paragraphs, percentile, print_table
+
+
+class CountingService(EmbeddingService):
+    """Records the size of every batch sent to the model"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches: List[int] = []
+
+    def _encode(self, texts: List[str]):
+        self.batches.append(len(texts))
+        return super()._encode(texts)
+
+
+async def _indexer(service: EmbeddingService, texts: List[str], batch: int, until: float, done: List[int]) -> None:
+    position = 0
+    while time.monotonic() < until:
+        chunk = texts[position:position + batch] or texts[:batch]
+        position = (position + batch) % len(texts)
+        await service.embed(chunk)
+        done.append(len(chunk))
+
+
+async def _searcher(service: EmbeddingService, queries: List[str], pause: float, until: float, latencies: List[float]) -> None:
+    position = 0
+    while time.monotonic() < until:
+        started = time.perf_counter()
+        await service.embed_query(queries[position % len(queries)])
+        latencies.append((time.perf_counter() - started) * 1000)
+        position += 1
+        await asyncio.sleep(pause)
+
+
+async def run(args) -> None:
+    service = CountingService(settings.EMBEDDING_MODEL, max_batch_size=1, max_latency_ms=args.max_latency_ms)
+    await service.start()
+    chunks = paragraphs(2000, sentences=6, seed=1)
+    queries = [text.split(". ")[0] for text in paragraphs(500, sentences=1, seed=2)]
+    # Warm up kernels and the tokenizer
+    await service.embed(chunks[:64])
+
+    rows = []
+    for batch_size in args.batch_sizes:
+        service.max_batch_size = batch_size
+        service.batches = []
+        done: List[int] = []
+        latencies: List[float] = []
+        started = time.monotonic()
+        until = started + args.seconds
+        await asyncio.gather(
+            *(_indexer(service, chunks, settings.EMBEDDING_BATCH_SIZE, until, done) for _ in range(args.indexers)),
+            *(_searcher(service, queries, args.query_pause, until, latencies) for _ in range(args.searchers)),
+        )
+        elapsed = time.monotonic() - started
+        rows.append((
+            batch_size,
+            sum(done) / elapsed,
+            sum(service.batches) / max(len(service.batches), 1),
+            percentile(latencies, 50),
+            percentile(latencies, 99),
+        ))
+    await service.stop()
+
+    print(
+        f"{settings.EMBEDDING_MODEL}: {args.indexers} indexers x {settings.EMBEDDING_BATCH_SIZE} chunks, "
+        f"{args.searchers} searchers, max latency {args.max_latency_ms} ms, {args.seconds} s per round"
+    )
+    print_table(["max batch", "chunks/s", "avg batch", "query p50 ms", "query p99 ms"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch-sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        default=[1, 4, 8, 16, 32, 64, 128])
+    parser.add_argument("--indexers", type=int, default=settings.INDEX_WORKER_CONCURRENCY,
+                        help="concurrent ingestion-style callers")
+    parser.add_argument("--searchers", type=int, default=2, help="concurrent query callers")
+    parser.add_argument("--query-pause", type=float, default=0.05, help="seconds between a searcher's queries")
+    parser.add_argument("--max-latency-ms", type=float, default=settings.EMBEDDING_MAX_LATENCY_MS)
+    parser.add_argument("--seconds", type=float, default=15.0, help="duration of each round")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Per-record logging cost for the caller: direct stream handler vs the log queue
+
+Logs a burst of request-style records (an f-string with a user message, plus
+a body passed as an extra field) through two setups and times each logging
+call in the calling thread:
+
+- direct: a StreamHandler with the plain-text format, as logging.basicConfig
+  set up before; formatting and the write happen in the caller
+- queue: the handler, filter and listener thread that configure_logging
+  installs, writing JSON through the same redaction
+
+Each setup writes to /dev/null and to a pipe whose reader drains only
+--drain-kbps, a log collector that has fallen behind. The direct handler then
+blocks on every full pipe buffer; the queue absorbs the burst and drops
+records once LOG_QUEUE_SIZE are waiting. Records are logged in one burst by
+default, the worst case for the listener thread, or paced with --rate.
+
+    python -m benchmarks.logging_overhead
+    python -m benchmarks.logging_overhead --records 10000 --rate 2000 --drain-kbps 64
+"""
+
+from typing import List, Optional, Tuple
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+
+from app.config import settings
+from app.services import logs
+from benchmarks._common import paragraphs, percentile, print_table
+
+
+class SlowReader(threading.Thread):
+    """Drains a pipe at a limited rate until told to catch up"""
+
+    def __init__(self, fd: int, kbps: float):
+        super().__init__(daemon=True)
+        self.fd = fd
+        self.kbps = kbps
+        self.unlimited = threading.Event()
+
+    def run(self) -> None:
+        while True:
+            data = os.read(self.fd, 4096)
+            if not data:
+                return
+            if not self.unlimited.is_set():
+                time.sleep(len(data) / (self.kbps * 1024))
+
+
+def direct_handler(stream) -> Tuple[logging.Handler, None]:
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    return handler, None
+
+
+def queue_handler(stream) -> Tuple[logging.Handler, logs._Listener]:
+    output = logging.StreamHandler(stream)
+    output.setFormatter(logs.JSONFormatter())
+    handler = logs._NonBlockingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    handler.addFilter(logs._ContextFilter())
+    listener = logs._Listener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    return handler, listener
+
+
+def measure(
+    setup,
+    stream,
+    messages: List[str],
+    records: int,
+    rate: float,
+) -> Tuple[List[float], Optional[logs._Listener]]:
+    """Caller time per record in microseconds, and the listener to stop if any"""
+    logger = logging.getLogger("benchmark")
+    logger.handlers, logger.propagate = [], False
+    logger.setLevel(logging.INFO)
+    handler, listener = setup(stream)
+    logger.addHandler(handler)
+    logs._NonBlockingQueueHandler.dropped = 0
+    logs.request_id.set("benchmark")
+
+    timings = []
+    begin = time.perf_counter()
+    for index in range(records):
+        if rate:
+            # Paced like request traffic instead of one tight loop
+            time.sleep(max(0.0, begin + index / rate - time.perf_counter()))
+        message = messages[index % len(messages)]
+        started = time.perf_counter_ns()
+        logger.info(f"Chat message from user 42: {message}", extra={"query": message})
+        timings.append((time.perf_counter_ns() - started) / 1000)
+
+    return timings, listener
+
+
+def run_case(name: str, setup, target: str, args, messages: List[str]) -> tuple:
+    reader = None
+    if target == "/dev/null":
+        stream = open(os.devnull, "w")
+    else:
+        read_fd, write_fd = os.pipe()
+        reader = SlowReader(read_fd, args.drain_kbps)
+        reader.start()
+        stream = os.fdopen(write_fd, "w")
+
+    started = time.perf_counter()
+    timings, listener = measure(setup, stream, messages, args.records, args.rate)
+    elapsed = time.perf_counter() - started
+    dropped = logs._NonBlockingQueueHandler.dropped if listener else 0
+
+    # Let the reader catch up so the listener can flush and exit
+    if reader is not None:
+        reader.unlimited.set()
+    if listener is not None:
+        listener.stop()
+    stream.close()
+    if reader is not None:
+        reader.join()
+
+    return (
+        name,
+        target,
+        sum(timings) / len(timings),
+        percentile(timings, 50),
+        percentile(timings, 99),
+        max(timings) / 1000,
+        args.records / elapsed,
+        dropped,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--records", type=int, default=20_000, help="records logged per case")
+    parser.add_argument("--rate", type=float, default=0, help="records per second, 0 for one burst")
+    parser.add_argument("--drain-kbps", type=float, default=256, help="read rate of the slow pipe reader")
+    args = parser.parse_args()
+
+    messages = paragraphs(200, sentences=3, seed=3)
+    rows = [
+        run_case(name, setup, target, args, messages)
+        for name, setup in (("direct", direct_handler), ("queue", queue_handler))
+        for target in ("/dev/null", f"pipe @ {args.drain_kbps:g} KB/s")
+    ]
+    pace = f"{args.rate:g} records/s" if args.rate else "one burst"
+    print(f"{args.records} records per case, {pace}, LOG_QUEUE_SIZE={settings.LOG_QUEUE_SIZE}")
+    print_table(["handler", "output", "mean us", "p50 us", "p99 us", "max ms", "records/s", "dropped"], rows)
+
+
+if __name__ == "__main__":
+    main()
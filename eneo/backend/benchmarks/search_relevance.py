@@ -0,0 +1,134 @@
+"""
+Offline relevance and latency of vector, lexical and hybrid search
+
+Reads a JSONL file of judged queries, one object per line:
+
+    {"query": "klimatpolicyn utsläppsmål 2030", "relevant": ["/Policy/klimatpolicy.pdf"]}
+
+and runs each query against one user's indexed documents in three modes:
+vector only, full-text only, and the reciprocal-rank fusion of both that
+/documents/search returns. Results are ranked by document (a file's first
+chunk counts), and scored per mode with recall@k, MRR and binary nDCG@k,
+plus retrieval latency percentiles. Query embeddings are computed once up
+front and cached results are never used, so latencies cover planning and the
+database queries only; the hybrid mode runs its two queries concurrently as
+the endpoint does.
+
+    python -m benchmarks.search_relevance --queries benchmarks/queries.example.jsonl --user-id 1
+    python -m benchmarks.search_relevance --queries judged.jsonl --user-id 7 --k 5 --repeat 5
+
+Needs the Postgres at DATABASE_URL with the user's documents indexed, and
+EMBEDDING_MODEL.
+"""
+
+from typing import Dict, List, Sequence
+import argparse
+import asyncio
+import json
+import math
+import time
+
+from app.config import settings
+from app.services import database, embeddings
+from app.services.search import _lexical_search, _vector_search, plan_search, reciprocal_rank_fusion
+from benchmarks._common import percentile, print_table
+
+MODES = ["vector", "lexical", "hybrid"]
+
+
+def ranked_paths(paths: Sequence[str]) -> List[str]:
+    """Distinct file paths in order of first appearance"""
+    return list(dict.fromkeys(paths))
+
+
+def recall_at(ranked: List[str], relevant: set, k: int) -> float:
+    return len(relevant & set(ranked[:k])) / len(relevant)
+
+
+def reciprocal_rank(ranked: List[str], relevant: set) -> float:
+    return next((1 / rank for rank, path in enumerate(ranked, start=1) if path in relevant), 0.0)
+
+
+def ndcg_at(ranked: List[str], relevant: set, k: int) -> float:
+    dcg = sum(1 / math.log2(rank + 1) for rank, path in enumerate(ranked[:k], start=1) if path in relevant)
+    ideal = sum(1 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal
+
+
+async def search(mode: str, query: str, query_vector, user_id: int, k: int, recall_target: float) -> List[str]:
+    """Ranked file paths for one query, mirroring hybrid_search without its cache"""
+    depth = max(k * settings.SEARCH_HYBRID_DEPTH, 20)
+    async with database.get_pool().acquire() as conn:
+        async with conn.transaction():
+            plan = await plan_search(conn, user_id, None)
+            if mode == "lexical":
+                rows = await _lexical_search(query, plan, depth)
+                return ranked_paths(row["nextcloud_file_path"] for row in rows)
+            lexical = asyncio.create_task(_lexical_search(query, plan, depth)) if mode == "hybrid" else None
+            semantic = await _vector_search(conn, plan, query_vector, user_id, depth, recall_target)
+            if lexical is None:
+                return ranked_paths(row["nextcloud_file_path"] for row in semantic)
+            hits = reciprocal_rank_fusion(semantic, await lexical, depth, settings.SEARCH_RRF_K)
+            return ranked_paths(hit.file_path for hit in hits)
+
+
+async def run(args) -> None:
+    with open(args.queries, encoding="utf-8") as file:
+        judged = [json.loads(line) for line in file if line.strip()]
+    if not judged or any(not item.get("relevant") for item in judged):
+        raise SystemExit(f"{args.queries}: every line needs a query and at least one relevant path")
+
+    await database.init_pool()
+    service = await embeddings.start_embedding_service()
+    try:
+        started = time.perf_counter()
+        vectors = [await service.embed_query(item["query"]) for item in judged]
+        embed_ms = (time.perf_counter() - started) * 1000 / len(judged)
+
+        scores: Dict[str, Dict[str, List[float]]] = {
+            mode: {"recall": [], "mrr": [], "ndcg": [], "latency": []} for mode in MODES
+        }
+        for item, vector in zip(judged, vectors):
+            relevant = set(item["relevant"])
+            for mode in MODES:
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    ranked = await search(mode, item["query"], vector, args.user_id, args.k, args.recall_target)
+                    scores[mode]["latency"].append((time.perf_counter() - started) * 1000)
+                scores[mode]["recall"].append(recall_at(ranked, relevant, args.k))
+                scores[mode]["mrr"].append(reciprocal_rank(ranked, relevant))
+                scores[mode]["ndcg"].append(ndcg_at(ranked, relevant, args.k))
+    finally:
+        await embeddings.stop_embedding_service()
+        await database.close_pool()
+
+    rows = [
+        (
+            mode,
+            sum(scores[mode]["recall"]) / len(judged),
+            sum(scores[mode]["mrr"]) / len(judged),
+            sum(scores[mode]["ndcg"]) / len(judged),
+            percentile(scores[mode]["latency"], 50),
+            percentile(scores[mode]["latency"], 99),
+        )
+        for mode in MODES
+    ]
+    print(
+        f"{len(judged)} queries for user {args.user_id}, k={args.k}, recall target {args.recall_target}, "
+        f"RRF k={settings.SEARCH_RRF_K}; query embedding {embed_ms:.1f} ms on average, not included below"
+    )
+    print_table(["mode", f"recall@{args.k}", "MRR", f"nDCG@{args.k}", "p50 ms", "p99 ms"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--queries", required=True, help="JSONL file of {query, relevant} objects")
+    parser.add_argument("--user-id", type=int, required=True, help="user whose documents are searched")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--recall-target", type=float, default=0.9)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per query and mode")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
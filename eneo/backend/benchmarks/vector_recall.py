@@ -0,0 +1,159 @@
+"""
+ANN recall@k against query latency on synthetic 384-dim data
+
+Loads clustered, normalized random vectors (a rough stand-in for MiniLM
+embeddings of related documents) into a scratch table, computes the exact
+top-k for a set of held-out queries with numpy, then builds each ANN index the
+way the index manager would for that row count and runs the queries at the
+probes / ef_search that query_settings picks for each recall target. Reported
+per index and target: the GUC value used, measured recall@k and latency
+percentiles. An exact scan with no index is the baseline.
+
+    python -m benchmarks.vector_recall
+    python -m benchmarks.vector_recall --rows 1000000 --methods hnsw --k 20
+
+Needs a Postgres with pgvector at DATABASE_URL. The scratch table
+(bench_vectors) is dropped afterwards unless --keep is given; building an index
+on a million rows takes minutes and VECTOR_INDEX_BUILD_MEMORY of RAM.
+"""
+
+from typing import List, Optional, Tuple
+import argparse
+import asyncio
+import time
+
+import asyncpg
+import numpy as np
+from pgvector.asyncpg import register_vector
+
+from app.config import settings
+from app.services.vector_index import IndexParams, choose_params, query_settings
+from benchmarks._common import percentile, print_table
+
+TABLE = "bench_vectors"
+INDEX = "bench_vectors_idx"
+
+
+def clustered(rows: int, clusters: int, spread: float, seed: int) -> np.ndarray:
+    """rows unit vectors scattered around clusters random centres"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, settings.VECTOR_DIMENSION)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, rows)]
+    vectors += spread * rng.standard_normal(vectors.shape).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def exact_top_k(data: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    """Ids (1-based, as loaded) of the k nearest rows by cosine distance"""
+    truth = []
+    for query in queries:
+        scores = data @ query
+        top = np.argpartition(-scores, k)[:k]
+        truth.append({int(index) + 1 for index in top})
+    return truth
+
+
+async def load(conn: asyncpg.Connection, data: np.ndarray) -> None:
+    await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    await conn.execute(f"CREATE TABLE {TABLE} (id INTEGER PRIMARY KEY, embedding vector({data.shape[1]}))")
+    batch = 10_000
+    for start in range(0, len(data), batch):
+        await conn.copy_records_to_table(
+            TABLE,
+            records=((start + offset + 1, vector) for offset, vector in enumerate(data[start:start + batch])),
+            columns=["id", "embedding"],
+        )
+    await conn.execute(f"ANALYZE {TABLE}")
+
+
+async def build(conn: asyncpg.Connection, params: IndexParams) -> float:
+    await conn.execute(f"DROP INDEX IF EXISTS {INDEX}")
+    await conn.execute(f"SET maintenance_work_mem = '{settings.VECTOR_INDEX_BUILD_MEMORY}'")
+    started = time.monotonic()
+    await conn.execute(params.ddl(INDEX, table=TABLE))
+    return time.monotonic() - started
+
+
+async def measure(
+    conn: asyncpg.Connection,
+    queries: np.ndarray,
+    truth: List[set],
+    k: int,
+    gucs: List[Tuple[str, int]],
+) -> Tuple[float, float, float]:
+    """Average recall@k and p50/p99 latency in ms for one setting"""
+    recalls, latencies = [], []
+    for query, expected in zip(queries, truth):
+        async with conn.transaction():
+            for name, value in gucs:
+                await conn.execute(f"SET LOCAL {name} = {int(value)}")
+            started = time.perf_counter()
+            rows = await conn.fetch(f"SELECT id FROM {TABLE} ORDER BY embedding <=> $1 LIMIT $2", query, k)
+            latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len(expected & {row["id"] for row in rows}) / k)
+    return sum(recalls) / len(recalls), percentile(latencies, 50), percentile(latencies, 99)
+
+
+def target_params(method: str, rows: int) -> Optional[IndexParams]:
+    """What the index manager would build for rows with VECTOR_INDEX_METHOD=method"""
+    configured = settings.VECTOR_INDEX_METHOD, settings.VECTOR_INDEX_MIN_ROWS
+    settings.VECTOR_INDEX_METHOD, settings.VECTOR_INDEX_MIN_ROWS = method, 0
+    try:
+        return choose_params(rows)
+    finally:
+        settings.VECTOR_INDEX_METHOD, settings.VECTOR_INDEX_MIN_ROWS = configured
+
+
+async def run(args) -> None:
+    data = clustered(args.rows, args.clusters, args.spread, seed=1)
+    # Held-out queries: perturbed copies of random rows, so they fall inside the clusters
+    queries = data[np.random.default_rng(2).integers(0, args.rows, args.queries)]
+    queries = queries + args.spread * np.random.default_rng(3).standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = exact_top_k(data, queries, args.k)
+
+    conn = await asyncpg.connect(dsn=settings.DATABASE_URL)
+    await register_vector(conn)
+    try:
+        started = time.monotonic()
+        await load(conn, data)
+        print(f"Loaded {args.rows} vectors in {time.monotonic() - started:.0f}s")
+
+        rows = []
+        recall, p50, p99 = await measure(conn, queries, truth, args.k, [])
+        rows.append(("exact", "-", "-", recall, p50, p99))
+        for method in args.methods:
+            params = target_params(method, args.rows)
+            seconds = await build(conn, params)
+            print(f"Built {params} in {seconds:.0f}s")
+            for target in args.targets:
+                gucs = query_settings(params, target, args.k)
+                recall, p50, p99 = await measure(conn, queries, truth, args.k, gucs)
+                setting = ", ".join(f"{name}={value}" for name, value in gucs)
+                rows.append((method, target, setting, recall, p50, p99))
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await conn.close()
+
+    print(f"{args.rows} rows, {args.clusters} clusters, {args.queries} queries, k={args.k}")
+    print_table(["index", "target", "setting", f"recall@{args.k}", "p50 ms", "p99 ms"], rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--spread", type=float, default=0.6, help="noise around each cluster centre")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--methods", type=lambda value: value.split(","), default=["ivfflat", "hnsw"])
+    parser.add_argument("--targets", type=lambda value: [float(part) for part in value.split(",")], default=[0.5, 0.8, 0.9, 0.95, 0.99],
+                        help="recall targets passed to query_settings")
+    parser.add_argument("--keep", action="store_true", help="leave the scratch table in place")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
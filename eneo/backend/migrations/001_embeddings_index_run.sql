@@ -0,0 +1,3 @@
+-- Stage re-indexed chunks under a run id and swap them in when the run completes
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS index_run VARCHAR(32);
+CREATE INDEX IF NOT EXISTS idx_embeddings_index_run ON embeddings(index_run) WHERE index_run IS NOT NULL;
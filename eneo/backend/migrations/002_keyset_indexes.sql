@@ -0,0 +1,10 @@
+-- Keyset pagination reads each owner's rows in id order; the indexes it needs
+-- get new names, since IF NOT EXISTS would keep the old single-column ones
+CREATE INDEX IF NOT EXISTS idx_documents_user_id_id ON documents(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_conversations_user_id_id ON conversations(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_id_id ON messages(conversation_id, id);
+CREATE INDEX IF NOT EXISTS idx_file_permissions_user_id_id ON file_permissions(user_id, id);
+DROP INDEX IF EXISTS idx_documents_user_id;
+DROP INDEX IF EXISTS idx_conversations_user_id;
+DROP INDEX IF EXISTS idx_messages_conversation_id;
+DROP INDEX IF EXISTS idx_file_permissions_user_id;
@@ -0,0 +1,19 @@
+-- Change detection on documents and chunk-hash reuse on embeddings
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS nextcloud_etag VARCHAR(255);
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS nextcloud_mtime TIMESTAMP;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS chunk_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id) ON DELETE CASCADE;
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS chunk_hash VARCHAR(64);
+CREATE INDEX IF NOT EXISTS idx_embeddings_chunk_hash ON embeddings(chunk_hash);
+
+-- Search plans by chunk_count and filters on embeddings.user_id, so fill both
+-- in for rows indexed before they existed. Chunks without a hash are simply
+-- never reused and get one when their document is next re-indexed.
+UPDATE embeddings e SET user_id = d.user_id
+FROM documents d
+WHERE e.document_id = d.id AND e.user_id IS NULL;
+
+UPDATE documents d SET chunk_count = counts.chunks
+FROM (SELECT document_id, count(*) AS chunks FROM embeddings GROUP BY document_id) counts
+WHERE d.id = counts.document_id AND d.chunk_count = 0;
@@ -0,0 +1,16 @@
+-- One document row per user and Nextcloud path, which indexing upserts on.
+-- Keep the most recently indexed row of any duplicates; the others' embeddings
+-- go with them.
+DELETE FROM documents
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, row_number() OVER (
+            PARTITION BY user_id, nextcloud_file_path
+            ORDER BY indexed_at DESC NULLS LAST, id DESC
+        ) AS position
+        FROM documents
+        WHERE nextcloud_file_path IS NOT NULL
+    ) ranked
+    WHERE position > 1
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_user_path ON documents(user_id, nextcloud_file_path);
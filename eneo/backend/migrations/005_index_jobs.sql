@@ -0,0 +1,27 @@
+-- Persistent batch indexing jobs, one task per file, claimed by eneo-worker
+CREATE TABLE IF NOT EXISTS index_jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS index_tasks (
+    id SERIAL PRIMARY KEY,
+    job_id INTEGER REFERENCES index_jobs(id) ON DELETE CASCADE,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    file_path TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',  -- 'pending', 'running', 'done', 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    document_id INTEGER REFERENCES documents(id) ON DELETE SET NULL,
+    chunks INTEGER,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_index_jobs_user_id ON index_jobs(user_id);
+CREATE INDEX IF NOT EXISTS idx_index_tasks_job_id ON index_tasks(job_id);
+CREATE INDEX IF NOT EXISTS idx_index_tasks_pending ON index_tasks(next_attempt_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_index_tasks_running ON index_tasks(user_id) WHERE status = 'running';
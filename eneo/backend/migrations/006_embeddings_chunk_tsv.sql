@@ -0,0 +1,5 @@
+-- Full-text side of hybrid search. Adding a stored generated column rewrites
+-- the table and computes it for every existing chunk.
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS chunk_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('swedish', coalesce(chunk_text, ''))) STORED;
+CREATE INDEX IF NOT EXISTS idx_embeddings_chunk_tsv ON embeddings USING gin(chunk_tsv);
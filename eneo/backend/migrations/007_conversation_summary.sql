@@ -0,0 +1,3 @@
+-- Rolling summary of older messages, folded into chat prompts
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary_message_id INTEGER;
@@ -0,0 +1,21 @@
+-- Change tracking per folder granted for indexing
+CREATE TABLE IF NOT EXISTS sync_roots (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    root_path TEXT NOT NULL,
+    etag VARCHAR(255),  -- root ETag at the last completed pass
+    sync_token TEXT,  -- sync-collection token from the last completed pass
+    last_synced_at TIMESTAMP,
+    last_error TEXT,
+    UNIQUE (user_id, root_path)
+);
+
+-- Subfolder ETags, so unchanged subtrees are not walked
+CREATE TABLE IF NOT EXISTS sync_folders (
+    root_id INTEGER REFERENCES sync_roots(id) ON DELETE CASCADE,
+    folder_path TEXT NOT NULL,
+    etag VARCHAR(255),
+    PRIMARY KEY (root_id, folder_path)
+);
+
+CREATE INDEX IF NOT EXISTS idx_index_tasks_user_path ON index_tasks(user_id, file_path);
@@ -0,0 +1,4 @@
+-- Chunks are read per document in chunk_index order; the composite index
+-- also serves every document_id lookup the old one did
+CREATE INDEX IF NOT EXISTS idx_embeddings_document_chunk ON embeddings(document_id, chunk_index);
+DROP INDEX IF EXISTS idx_embeddings_document_id;
@@ -0,0 +1,105 @@
+"""
+Shared fixtures
+
+Tests run without Postgres, Redis or the models: services are replaced with
+in-memory stand-ins, and Nextcloud with a local WebDAV server.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator
+import threading
+
+import pytest
+
+from app.config import settings
+from app.services import http_client
+
+WEBDAV_CHUNK = 64 * 1024
+
+
+class StandInWebDAV(BaseHTTPRequestHandler):
+    """Serves files registered in `files` as path -> (size, generator of byte chunks)"""
+
+    files: Dict[str, Callable[[], Iterator[bytes]]] = {}
+    sizes: Dict[str, int] = {}
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _file(self):
+        prefix = settings.NEXTCLOUD_WEBDAV_PATH
+        path = self.path[len(prefix):] if self.path.startswith(prefix) else self.path
+        return path, self.files.get(path)
+
+    def do_PROPFIND(self):
+        path, generate = self._file()
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        if generate is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = f"""<?xml version="1.0"?>
+<d:multistatus xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns">
+  <d:response>
+    <d:href>{settings.NEXTCLOUD_WEBDAV_PATH}{path}</d:href>
+    <d:propstat>
+      <d:prop>
+        <d:getetag>"etag-{self.sizes[path]}"</d:getetag>
+        <d:getlastmodified>Mon, 01 Jan 2024 00:00:00 GMT</d:getlastmodified>
+        <d:getcontentlength>{self.sizes[path]}</d:getcontentlength>
+        <oc:fileid>{abs(hash(path)) % 100000}</oc:fileid>
+      </d:prop>
+      <d:status>HTTP/1.1 200 OK</d:status>
+    </d:propstat>
+  </d:response>
+</d:multistatus>""".encode()
+        self.send_response(207)
+        self.send_header("Content-Type", "application/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path, generate = self._file()
+        if generate is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(self.sizes[path]))
+        self.end_headers()
+        for chunk in generate():
+            self.wfile.write(chunk)
+
+
+@pytest.fixture
+def webdav_server(monkeypatch):
+    """A local WebDAV server; register files with server.add(path, size, generate)"""
+    StandInWebDAV.files = {}
+    StandInWebDAV.sizes = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInWebDAV)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(settings, "NEXTCLOUD_URL", f"http://127.0.0.1:{server.server_address[1]}")
+
+    def add(path: str, size: int, generate: Callable[[], Iterator[bytes]]) -> None:
+        StandInWebDAV.files[path] = generate
+        StandInWebDAV.sizes[path] = size
+
+    server.add = add
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+async def shared_http_client():
+    """The process-wide HTTP client, as created in the lifespan"""
+    client = await http_client.init_http_client()
+    yield client
+    await http_client.close_http_client()
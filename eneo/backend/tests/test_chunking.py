@@ -0,0 +1,107 @@
+"""
+Chunking: size limits, section boundaries, overlap and stable boundaries under edits
+"""
+
+from typing import List
+import random
+
+import pytest
+
+from app.utils.chunking import TextChunker
+
+MAX_TOKENS = 120
+OVERLAP_TOKENS = 30
+WORDS = [
+    "kommunen", "beslutar", "budget", "nämnden", "förslag", "klimat", "skolan", "vården",
+    "ekonomi", "plan", "riktlinjer", "uppföljning", "bygglov", "trafik", "miljö", "avtal",
+]
+
+
+def count_words(text: str) -> int:
+    # Adds up exactly over joined units, unlike the length-based approximation
+    return len(text.split())
+
+
+def sentence(rng: random.Random, n: int) -> str:
+    words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 12)))
+    return f"Punkt {n} gäller {words}."
+
+
+def document(paragraphs: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    blocks = []
+    n = 0
+    for index in range(paragraphs):
+        if index % 10 == 0:
+            blocks.append(f"Avsnitt {index // 10 + 1}")
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            sentences.append(sentence(rng, n))
+            n += 1
+        blocks.append(" ".join(sentences))
+    return "\n\n".join(blocks)
+
+
+def chunk(text: str, piece: int = 0) -> List[str]:
+    chunker = TextChunker(MAX_TOKENS, OVERLAP_TOKENS, count_tokens=count_words)
+    pieces = [text[start:start + piece] for start in range(0, len(text), piece)] if piece else [text]
+    chunks = [text for part in pieces for text in chunker.feed(part)]
+    return chunks + list(chunker.flush())
+
+
+def test_chunks_stay_within_max_tokens():
+    chunks = chunk(document(100))
+    assert len(chunks) > 20
+    assert all(count_words(text) <= MAX_TOKENS for text in chunks)
+
+
+def test_overlong_sentence_is_split_at_words():
+    text = " ".join(["ord"] * (3 * MAX_TOKENS)) + "."
+    chunks = chunk(text)
+    assert len(chunks) >= 3
+    assert all(count_words(text) <= MAX_TOKENS for text in chunks)
+
+
+def test_feeding_in_pieces_gives_the_same_chunks():
+    text = document(60)
+    assert chunk(text, piece=100) == chunk(text)
+    assert chunk(text, piece=7) == chunk(text)
+
+
+def test_headings_start_a_new_chunk():
+    chunks = chunk(document(60))
+    for index in range(1, 7):
+        heading = f"Avsnitt {index}"
+        containing = [text for text in chunks if heading in text.split("\n\n")]
+        assert len(containing) == 1
+        assert containing[0].startswith(heading)
+
+
+def test_consecutive_chunks_of_a_section_overlap():
+    chunks = chunk(document(60))
+    pairs = [(first, second) for first, second in zip(chunks, chunks[1:]) if not second.startswith("Avsnitt")]
+    assert pairs
+    for first, second in pairs:
+        # Sentences are at most 15 words, so at least one fits in the overlap
+        shared = second.split(". ")[0]
+        assert shared in first
+        assert not first.startswith(second)
+
+
+def test_inserted_sentence_changes_only_nearby_chunks():
+    text = document(200)
+    original = chunk(text)
+    position = text.find(". ", len(text) // 2) + 2
+    edited = chunk(f"{text[:position]}Ny mening om bygglov och trafik i centrum. {text[position:]}")
+
+    new = [text for text in edited if text not in set(original)]
+    assert len(original) > 50
+    assert 1 <= len(new) <= 4
+    # Chunks before and after the edit keep their exact text
+    assert edited[:10] == original[:10]
+    assert edited[-10:] == original[-10:]
+
+
+def test_overlap_must_be_under_half_of_max_tokens():
+    with pytest.raises(ValueError):
+        TextChunker(100, 50)
@@ -0,0 +1,51 @@
+"""
+Indexed text reassembled from chunks without their overlaps
+"""
+
+import pytest
+
+from app.repositories import embeddings as embeddings_repo
+from app.services import content
+from app.services.content import iter_indexed_text, overlap_length
+from app.utils.chunking import TextChunker
+
+
+@pytest.mark.parametrize(
+    "previous, chunk, limit, expected",
+    [
+        ("Första meningen. Andra meningen.", " Andra meningen. Tredje.", 100, 16),
+        ("abc", "abcabc", 10, 3),
+        ("abc", "xyz", 10, 0),
+        ("xxabab", "ababyy", 10, 4),
+        ("aaaa", "aaaaaa", 3, 3),
+        ("", "text", 10, 0),
+        ("text", "", 10, 0),
+    ],
+)
+def test_overlap_length(previous, chunk, limit, expected):
+    assert overlap_length(previous, chunk, limit) == expected
+
+
+def test_overlap_length_is_the_longest_prefix_that_ends_previous():
+    previous = "one two one two one"
+    chunk = "one two one three"
+    assert overlap_length(previous, chunk, len(chunk)) == len("one two one")
+
+
+async def test_indexed_text_drops_chunk_overlaps(monkeypatch):
+    sentences = [f"Mening nummer {n} handlar om kommunens budget och plan." for n in range(200)]
+    paragraphs = [" ".join(sentences[start:start + 5]) for start in range(0, 200, 5)]
+    text = "\n\n".join(paragraphs)
+    chunker = TextChunker(60, 20, count_tokens=lambda text: len(text.split()))
+    chunks = list(chunker.feed(text)) + list(chunker.flush())
+    assert len(chunks) > 10
+
+    async def chunk_texts(document_id, after, limit):
+        rows = [{"chunk_index": index, "chunk_text": text} for index, text in enumerate(chunks)]
+        return [row for row in rows if row["chunk_index"] > after][:limit]
+
+    monkeypatch.setattr(embeddings_repo, "chunk_texts", chunk_texts)
+    monkeypatch.setattr(content, "CHUNK_PAGE_SIZE", 4)
+
+    rebuilt = "".join([piece async for piece in iter_indexed_text(1)])
+    assert rebuilt.split() == text.split()
@@ -0,0 +1,104 @@
+"""
+Circuit breaker state machine
+"""
+
+import pytest
+
+from app.services import http_client
+from app.services.http_client import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+HOST = "nextcloud.example"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(http_client.time, "monotonic", clock)
+    return clock
+
+
+def open_breaker(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.before_request(HOST)
+        breaker.record_failure(HOST)
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_request(HOST)
+        breaker.record_failure(HOST)
+    assert breaker.state == CLOSED
+
+    breaker.before_request(HOST)
+    breaker.record_failure(HOST)
+    assert breaker.state == OPEN
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure(HOST)
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure(HOST)
+    assert breaker.state == CLOSED
+
+
+def test_open_circuit_fails_fast_with_remaining_cool_down(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    open_breaker(breaker)
+    clock.now += 12
+
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.before_request(HOST)
+    assert raised.value.retry_after == pytest.approx(18)
+    assert breaker.state == OPEN
+
+
+def test_one_trial_request_after_cool_down(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    open_breaker(breaker)
+    clock.now += 30
+
+    breaker.before_request(HOST)
+    assert breaker.state == HALF_OPEN
+    clock.now += 5
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.before_request(HOST)
+    assert raised.value.retry_after == pytest.approx(25)
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_request(HOST)
+
+
+def test_failed_trial_reopens_the_circuit(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    open_breaker(breaker)
+    clock.now += 30
+
+    breaker.before_request(HOST)
+    breaker.record_failure(HOST)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(HOST)
+
+
+def test_trial_that_never_reports_back_expires(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    open_breaker(breaker)
+    clock.now += 30
+    breaker.before_request(HOST)
+
+    clock.now += 30
+    breaker.before_request(HOST)
+    assert breaker.state == HALF_OPEN
@@ -0,0 +1,153 @@
+"""
+Streaming ingestion: memory must not grow with file size
+"""
+
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Iterator
+import threading
+
+import numpy as np
+import psutil
+import pytest
+
+from app.config import settings
+from app.services import ingestion
+from app.services.sessions import UserSession
+from app.utils.chunking import approximate_tokens
+
+MB = 1024 * 1024
+LINE = (
+    "Paragraf {n}. Kommunfullmäktige beslutar att anta riktlinjerna för "
+    "klimatarbetet i Sundsvalls kommun, diarienummer KS-{n}, enligt bilaga.\n\n"
+)
+
+
+def generate_text(size: int) -> Iterator[bytes]:
+    """size bytes of distinct paragraphs, produced in download-sized pieces"""
+    sent = 0
+    n = 0
+    while sent < size:
+        piece = bytearray()
+        while len(piece) < 64 * 1024:
+            piece += LINE.format(n=n).encode()
+            n += 1
+        piece = bytes(piece[: size - sent])
+        sent += len(piece)
+        yield piece
+
+
+class FakeEmbeddingService:
+    """Zero vectors; counts tokens the way the chunker does without a tokenizer"""
+
+    def count_tokens(self, text: str) -> int:
+        return approximate_tokens(text)
+
+    async def embed(self, texts):
+        return [np.zeros(settings.VECTOR_DIMENSION, dtype=np.float32)] * len(texts)
+
+
+class FakeConnection:
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class FakePool:
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection()
+
+
+class RSSSampler:
+    """Peak resident memory above the level when sampling started"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.baseline = self.process.memory_info().rss
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def growth(self) -> int:
+        return self.peak - self.baseline
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """index_file with the database, Redis and embedding model replaced; returns the stored rows counter"""
+    stored = {"rows": 0}
+
+    async def upsert_for_indexing(user_id, file_path, file_id, title, file_type, conn=None):
+        return {
+            "id": 1, "nextcloud_etag": None, "nextcloud_mtime": None, "content_hash": None,
+            "indexed_at": None, "chunks": 0, "file_size": 0,
+        }
+
+    async def insert_staged_chunks(run_id, rows, conn=None):
+        stored["rows"] += len(rows)
+
+    async def nothing(*args, **kwargs):
+        return None
+
+    async def no_matches(hashes, conn=None):
+        return []
+
+    async def access_token(session):
+        return "token"
+
+    monkeypatch.setattr(ingestion.documents_repo, "upsert_for_indexing", upsert_for_indexing)
+    monkeypatch.setattr(ingestion.documents_repo, "mark_indexed", nothing)
+    monkeypatch.setattr(ingestion.embeddings_repo, "find_by_hashes", no_matches)
+    monkeypatch.setattr(ingestion.embeddings_repo, "insert_staged_chunks", insert_staged_chunks)
+    monkeypatch.setattr(ingestion.embeddings_repo, "swap_in_run", nothing)
+    monkeypatch.setattr(ingestion.embeddings_repo, "delete_run", nothing)
+    monkeypatch.setattr(ingestion, "get_pool", lambda: FakePool())
+    monkeypatch.setattr(ingestion, "bump_index_version", nothing)
+    monkeypatch.setattr(ingestion, "get_access_token", access_token)
+    monkeypatch.setattr(ingestion, "get_embedding_service", lambda: FakeEmbeddingService())
+    return stored
+
+
+def _session() -> UserSession:
+    return UserSession(
+        session_token="s", user_id=1, nextcloud_user_id="anna",
+        access_token="token", refresh_token=None, expires_at=None, created_at=datetime.utcnow(),
+    )
+
+
+async def _index(server, stored, size: int) -> int:
+    path = f"/policy-{size // MB}mb.txt"
+    server.add(path, size, lambda: generate_text(size))
+    stored["rows"] = 0
+    with RSSSampler() as rss:
+        result = await ingestion.index_file(_session(), path)
+    assert result.file_size == size
+    assert result.chunks == stored["rows"] > 0
+    return rss.growth
+
+
+async def test_peak_rss_is_flat_as_file_size_grows(webdav_server, shared_http_client, pipeline):
+    # Warm up allocator pools and lazily imported modules
+    await _index(webdav_server, pipeline, 1 * MB)
+
+    small = await _index(webdav_server, pipeline, 4 * MB)
+    large = await _index(webdav_server, pipeline, 32 * MB)
+
+    # Eight times the bytes, but only the download chunk and one embedding
+    # batch are ever held, so the peak must not follow the file size
+    assert large < small + 8 * MB, f"peak RSS grew {small / MB:.1f} MB for 4 MB, {large / MB:.1f} MB for 32 MB"
@@ -0,0 +1,56 @@
+"""
+Keyset cursors and paging
+"""
+
+from datetime import datetime
+
+import pytest
+
+from app.utils.pagination import EXPORT_PAGE_SIZE, decode_cursor, encode_cursor, iter_pages, split_page
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42), int) == (42,)
+    created = datetime(2024, 3, 1, 12, 30, 5, 123456)
+    assert decode_cursor(encode_cursor(created, 7), datetime, int) == (created, 7)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(2 ** 31 - 1, datetime(2024, 1, 1))
+    assert all(char.isalnum() or char in "-_" for char in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "e30", encode_cursor("abc")])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, int)
+
+
+def test_cursor_with_wrong_number_of_values_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(1, 2), int)
+
+
+def test_split_page_returns_cursor_of_last_row_only_when_more_exist():
+    rows = [{"id": id_} for id_ in (9, 8, 7)]
+    page, cursor = split_page(rows, 2, lambda row: (row["id"],))
+    assert page == rows[:2]
+    assert decode_cursor(cursor, int) == (8,)
+
+    page, cursor = split_page(rows, 3, lambda row: (row["id"],))
+    assert page == rows
+    assert cursor is None
+
+
+async def test_iter_pages_walks_every_row_after_the_key():
+    ids = list(range(2 * EXPORT_PAGE_SIZE + 10, 0, -1))
+    calls = []
+
+    async def fetch_page(after, limit):
+        calls.append(after)
+        start = 0 if after is None else ids.index(after[0]) + 1
+        return [{"id": id_} for id_ in ids[start:start + limit]]
+
+    rows = [row["id"] async for row in iter_pages(fetch_page, lambda row: (row["id"],))]
+    assert rows == ids
+    assert calls == [None, (ids[EXPORT_PAGE_SIZE - 1],), (ids[2 * EXPORT_PAGE_SIZE - 1],)]
@@ -0,0 +1,50 @@
+"""
+Reciprocal rank fusion of vector and full-text results
+"""
+
+import pytest
+
+from app.services.search import reciprocal_rank_fusion
+
+K = 60
+
+
+def row(chunk_id: int, score: float = 0.5) -> dict:
+    return {
+        "chunk_id": chunk_id,
+        "id": chunk_id // 10,
+        "nextcloud_file_path": f"/docs/{chunk_id // 10}.pdf",
+        "title": None,
+        "chunk_text": f"chunk {chunk_id}",
+        "score": score,
+    }
+
+
+def test_hit_first_in_both_lists_scores_one():
+    [hit] = reciprocal_rank_fusion([row(1, 0.9)], [row(1, 0.3)], limit=10, k=K)
+    assert hit.score == pytest.approx(1.0)
+    assert hit.semantic_contribution == pytest.approx(0.5)
+    assert hit.lexical_contribution == pytest.approx(0.5)
+    assert (hit.semantic_rank, hit.lexical_rank) == (1, 1)
+    assert (hit.semantic_score, hit.lexical_score) == (0.9, 0.3)
+    assert hit.title == ""
+
+
+def test_contributions_add_up_to_the_score():
+    hits = reciprocal_rank_fusion([row(1), row(2), row(3)], [row(3), row(4)], limit=10, k=K)
+    for hit in hits:
+        assert hit.score == pytest.approx(hit.semantic_contribution + hit.lexical_contribution)
+    by_id = {hit.chunk_id: hit for hit in hits}
+    assert by_id[4].semantic_rank is None and by_id[4].semantic_contribution == 0.0
+    assert by_id[1].lexical_rank is None and by_id[1].lexical_contribution == 0.0
+
+
+def test_agreement_between_signals_ranks_first():
+    hits = reciprocal_rank_fusion([row(1), row(2), row(3)], [row(3), row(4), row(1)], limit=10, k=K)
+    assert [hit.chunk_id for hit in hits] == [1, 3, 2, 4]
+
+
+def test_limit_keeps_the_best_hits():
+    semantic = [row(chunk_id) for chunk_id in range(1, 21)]
+    hits = reciprocal_rank_fusion(semantic, [], limit=5, k=K)
+    assert [hit.chunk_id for hit in hits] == [1, 2, 3, 4, 5]
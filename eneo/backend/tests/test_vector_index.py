@@ -0,0 +1,72 @@
+"""
+ANN index parameters: what to build for a corpus size, when to rebuild, how wide to search
+"""
+
+import pytest
+
+from app.config import settings
+from app.services.vector_index import IndexParams, _parse_index, choose_params, needs_rebuild, query_settings
+
+
+@pytest.fixture(autouse=True)
+def index_settings(monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_INDEX_METHOD", "auto")
+    monkeypatch.setattr(settings, "VECTOR_INDEX_MIN_ROWS", 5000)
+    monkeypatch.setattr(settings, "VECTOR_INDEX_HNSW_MIN_ROWS", 1_000_000)
+
+
+def test_no_index_below_min_rows():
+    assert choose_params(4999) is None
+
+
+def test_auto_picks_ivfflat_then_hnsw():
+    assert choose_params(5000) == IndexParams(method="ivfflat", lists=10)
+    assert choose_params(500_000) == IndexParams(method="ivfflat", lists=500)
+    assert choose_params(1_000_000) == IndexParams(method="hnsw", m=16, ef_construction=64)
+    assert choose_params(5_000_000) == IndexParams(method="hnsw", m=24, ef_construction=128)
+
+
+def test_ivfflat_lists_grow_with_sqrt_past_a_million_rows(monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_INDEX_METHOD", "ivfflat")
+    assert choose_params(4_000_000) == IndexParams(method="ivfflat", lists=2000)
+
+
+def test_needs_rebuild():
+    target = IndexParams(method="ivfflat", lists=400)
+    assert not needs_rebuild(IndexParams(method="ivfflat", lists=100), None)
+    assert needs_rebuild(None, target)
+    assert needs_rebuild(IndexParams(method="hnsw", m=16, ef_construction=64), target)
+    assert not needs_rebuild(IndexParams(method="ivfflat", lists=200), target)
+    assert not needs_rebuild(IndexParams(method="ivfflat", lists=800), target)
+    assert needs_rebuild(IndexParams(method="ivfflat", lists=199), target)
+    assert needs_rebuild(IndexParams(method="hnsw", m=16, ef_construction=64), IndexParams(method="hnsw", m=24))
+
+
+def test_parse_index_reads_back_the_ddl():
+    params = IndexParams(method="hnsw", m=24, ef_construction=128)
+    indexdef = "CREATE INDEX x ON public.embeddings USING hnsw (embedding vector_cosine_ops) WITH (m='24', ef_construction='128')"
+    assert _parse_index(indexdef) == params
+    assert _parse_index("CREATE INDEX x ON public.embeddings USING ivfflat (embedding vector_cosine_ops)") == (
+        IndexParams(method="ivfflat", lists=100)
+    )
+
+
+def test_query_settings_follow_the_recall_curves():
+    ivfflat = IndexParams(method="ivfflat", lists=1000)
+    hnsw = IndexParams(method="hnsw", m=16, ef_construction=64)
+    assert query_settings(None, 0.9, 10) == []
+    assert query_settings(ivfflat, 0.9, 10) == [("ivfflat.probes", 30)]
+    [(_, probes)] = query_settings(ivfflat, 0.925, 10)
+    assert 30 < probes < 60
+    assert query_settings(hnsw, 0.95, 20) == [("hnsw.ef_search", 160)]
+    # Never below k; targets past the curve use its last point
+    assert query_settings(hnsw, 0.5, 40) == [("hnsw.ef_search", 40)]
+    assert query_settings(ivfflat, 1.0, 10) == [("ivfflat.probes", 150)]
+
+
+def test_query_settings_widen_for_selective_filters():
+    ivfflat = IndexParams(method="ivfflat", lists=1000)
+    hnsw = IndexParams(method="hnsw", m=16, ef_construction=64)
+    assert query_settings(ivfflat, 0.9, 10, selectivity=0.1) == [("ivfflat.probes", 300)]
+    assert query_settings(ivfflat, 0.9, 10, selectivity=0.01) == [("ivfflat.probes", 1000)]
+    assert query_settings(hnsw, 0.9, 10, selectivity=0.001) == [("hnsw.ef_search", 1000)]
@@ -23,6 +23,10 @@ CREATE TABLE IF NOT EXISTS documents (
     content TEXT,
     file_type VARCHAR(50),
     file_size BIGINT,
+    content_hash VARCHAR(64),  -- sha256 of the file bytes
+    nextcloud_etag VARCHAR(255),
+    nextcloud_mtime TIMESTAMP,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     indexed_at TIMESTAMP
@@ -32,22 +36,28 @@ CREATE TABLE IF NOT EXISTS documents (
 CREATE TABLE IF NOT EXISTS embeddings (
     id SERIAL PRIMARY KEY,
     document_id INTEGER REFERENCES documents(id) ON DELETE CASCADE,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,  -- owner, for per-user partial ANN indexes
     chunk_index INTEGER,
     chunk_text TEXT,
+    chunk_hash VARCHAR(64),  -- sha256 of embedding model + chunk text
+    chunk_tsv tsvector GENERATED ALWAYS AS (to_tsvector('swedish', coalesce(chunk_text, ''))) STORED,
     embedding vector(384),  -- 384 dimensions for all-MiniLM-L6-v2
+    index_run VARCHAR(32),  -- indexing run that staged the row; NULL once it is live
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Create index on embeddings for fast vector search
-CREATE INDEX IF NOT EXISTS embeddings_vector_idx ON embeddings 
-USING ivfflat (embedding vector_cosine_ops)
-WITH (lists = 100);
+-- The ANN index on embeddings (embeddings_vector_idx) is created and resized by
+-- the indexing worker once there is data to build it from, see
+-- app/services/vector_index.py. An ivfflat index built on an empty table has
+-- useless cluster centroids.
 
 -- Create conversations table
 CREATE TABLE IF NOT EXISTS conversations (
     id SERIAL PRIMARY KEY,
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
     title VARCHAR(500),
+    summary TEXT,  -- rolling summary of messages up to summary_message_id
+    summary_message_id INTEGER,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -81,15 +91,68 @@ CREATE TABLE IF NOT EXISTS file_permissions (
     granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Create index_jobs table for batch indexing
+CREATE TABLE IF NOT EXISTS index_jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create index_tasks table (one row per file in a job)
+CREATE TABLE IF NOT EXISTS index_tasks (
+    id SERIAL PRIMARY KEY,
+    job_id INTEGER REFERENCES index_jobs(id) ON DELETE CASCADE,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    file_path TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',  -- 'pending', 'running', 'done', 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    document_id INTEGER REFERENCES documents(id) ON DELETE SET NULL,
+    chunks INTEGER,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Create sync_roots table (change tracking per folder granted for indexing)
+CREATE TABLE IF NOT EXISTS sync_roots (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    root_path TEXT NOT NULL,
+    etag VARCHAR(255),  -- root ETag at the last completed pass
+    sync_token TEXT,  -- sync-collection token from the last completed pass
+    last_synced_at TIMESTAMP,
+    last_error TEXT,
+    UNIQUE (user_id, root_path)
+);
+
+-- Create sync_folders table (subfolder ETags, so unchanged subtrees are not walked)
+CREATE TABLE IF NOT EXISTS sync_folders (
+    root_id INTEGER REFERENCES sync_roots(id) ON DELETE CASCADE,
+    folder_path TEXT NOT NULL,
+    etag VARCHAR(255),
+    PRIMARY KEY (root_id, folder_path)
+);
+
 -- Create indexes for better performance
-CREATE INDEX IF NOT EXISTS idx_documents_user_id ON documents(user_id);
+CREATE INDEX IF NOT EXISTS idx_documents_user_id_id ON documents(user_id, id);
 CREATE INDEX IF NOT EXISTS idx_documents_nextcloud_file_id ON documents(nextcloud_file_id);
-CREATE INDEX IF NOT EXISTS idx_embeddings_document_id ON embeddings(document_id);
-CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations(user_id);
-CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_user_path ON documents(user_id, nextcloud_file_path);
+CREATE INDEX IF NOT EXISTS idx_embeddings_document_chunk ON embeddings(document_id, chunk_index);
+CREATE INDEX IF NOT EXISTS idx_embeddings_chunk_hash ON embeddings(chunk_hash);
+CREATE INDEX IF NOT EXISTS idx_embeddings_chunk_tsv ON embeddings USING gin(chunk_tsv);
+CREATE INDEX IF NOT EXISTS idx_embeddings_index_run ON embeddings(index_run) WHERE index_run IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_conversations_user_id_id ON conversations(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_id_id ON messages(conversation_id, id);
 CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_token ON sessions(session_token);
-CREATE INDEX IF NOT EXISTS idx_file_permissions_user_id ON file_permissions(user_id);
+CREATE INDEX IF NOT EXISTS idx_file_permissions_user_id_id ON file_permissions(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_index_jobs_user_id ON index_jobs(user_id);
+CREATE INDEX IF NOT EXISTS idx_index_tasks_job_id ON index_tasks(job_id);
+CREATE INDEX IF NOT EXISTS idx_index_tasks_user_path ON index_tasks(user_id, file_path);
+CREATE INDEX IF NOT EXISTS idx_index_tasks_pending ON index_tasks(next_attempt_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_index_tasks_running ON index_tasks(user_id) WHERE status = 'running';
 
 -- Create function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()